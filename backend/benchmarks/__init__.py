@@ -0,0 +1,48 @@
+"""
+Benchmarks backing the performance work, each runnable as a module:
+
+    python -m backend.benchmarks.<name> --help
+
+The ones that touch PostgreSQL use DATABASE_URL like the app (set DB_SSL=false
+for a local server), expect the schema at the migration head, and remove the
+rows they create.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+from sqlalchemy import event
+
+class StatementCounter:
+    """Counts the statements an engine sends while active."""
+
+    def __init__(self):
+        self.statements = 0
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    @contextmanager
+    def watch(self, engine) -> Iterator["StatementCounter"]:
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count)
+        try:
+            yield self
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", self._count)
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Mean, median and p95 of durations in seconds, as milliseconds."""
+    ordered = sorted(samples)
+    return {
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+@contextmanager
+def timer(samples: List[float]) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - started)
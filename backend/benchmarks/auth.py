@@ -0,0 +1,73 @@
+"""
+Per-request cost of authenticating an access token.
+
+    python -m backend.benchmarks.auth [--requests N] [--revoked N]
+
+Times utils.get_current_user on the stateless path (signature check plus the
+in-memory revocation list) against the database lookup it replaced
+(AUTH_STATELESS=false), and reports the statements each path sends. --revoked
+users with bumped token versions are created first, so the revocation list
+reload is sized realistically.
+"""
+import argparse
+import asyncio
+import uuid
+from datetime import datetime
+from sqlalchemy import delete, insert
+from backend import models, utils
+from backend.benchmarks import StatementCounter, summarize, timer
+from backend.database import AsyncSessionLocal, engine
+
+async def _authenticate(token: str, requests: int, stateless: bool) -> dict:
+    utils.AUTH_STATELESS = stateless
+    samples = []
+    counter = StatementCounter()
+    async with AsyncSessionLocal() as db:
+        with counter.watch(engine):
+            for _ in range(requests):
+                with timer(samples):
+                    await utils.get_current_user(db, token)
+    return {**summarize(samples), "statements_per_request": counter.statements / requests}
+
+async def run(requests: int, revoked: int) -> None:
+    prefix = f"bench-auth-{uuid.uuid4().hex[:8]}"
+    async with AsyncSessionLocal() as db:
+        user = models.User(username=f"{prefix}-user", hashed_password="x", role=models.UserRole.user, is_active=True)
+        db.add(user)
+        await db.execute(insert(models.User), [
+            {"username": f"{prefix}-{i}", "hashed_password": "x", "token_version": 1, "updated_at": datetime.utcnow()}
+            for i in range(revoked)
+        ])
+        await db.commit()
+        token = utils.create_access_token(utils.access_token_claims(user))
+    try:
+        # Warm the connection pool and the revocation list before timing
+        await _authenticate(token, 10, stateless=True)
+        await _authenticate(token, 10, stateless=False)
+        results = {
+            "stateless": await _authenticate(token, requests, stateless=True),
+            "database": await _authenticate(token, requests, stateless=False),
+        }
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(models.User).where(models.User.username.startswith(prefix)))
+            await db.commit()
+        await engine.dispose()
+
+    for path, result in results.items():
+        print(
+            f"{path:>10}: mean {result['mean_ms']:.3f} ms  p50 {result['p50_ms']:.3f} ms  "
+            f"p95 {result['p95_ms']:.3f} ms  {result['statements_per_request']:.2f} statements/request"
+        )
+    saved = results["database"]["mean_ms"] - results["stateless"]["mean_ms"]
+    print(f"saved per request: {saved:.3f} ms; revocation list {utils.revocations.stats()}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--revoked", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.revoked))
+
+if __name__ == "__main__":
+    main()
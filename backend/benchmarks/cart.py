@@ -0,0 +1,78 @@
+"""
+Round trips and latency of pricing a cart.
+
+    python -m backend.benchmarks.cart [--sizes 1,10,30,100] [--calls N]
+
+Builds one cart per size and times crud.get_cart_with_totals on each,
+reporting the statements every call sends. The count should stay flat as the
+cart grows; the per-line product lookups it replaced cost one extra round trip
+per line. With --sold-out, one line per cart is out of stock, adding the prune
+and its commit to the first call.
+"""
+import argparse
+import asyncio
+import uuid
+from sqlalchemy import delete, select
+from backend import crud, models
+from backend.benchmarks import StatementCounter, summarize, timer
+from backend.database import AsyncSessionLocal, engine
+
+async def _make_cart(prefix: str, size: int, sold_out: bool) -> int:
+    async with AsyncSessionLocal() as db:
+        category = models.Category(name=f"{prefix}-{size}")
+        user = models.User(username=f"{prefix}-{size}", hashed_password="x", role=models.UserRole.user, is_active=True)
+        products = [
+            models.Product(name=f"{prefix}-{size}-{i}", description="", price=10.0 + i, category=category, stock=0 if sold_out and i == 0 else 50)
+            for i in range(size)
+        ]
+        cart = models.Cart(user=user, products=[])
+        cart.items = [models.CartItem(product=product, quantity=2) for product in products]
+        db.add_all([user, cart, *products])
+        await db.commit()
+        return user.id
+
+async def _price(user_id: int, calls: int) -> dict:
+    samples = []
+    counter = StatementCounter()
+    async with AsyncSessionLocal() as db:
+        with counter.watch(engine):
+            for _ in range(calls):
+                with timer(samples):
+                    await crud.get_cart_with_totals(db, user_id)
+    return {**summarize(samples), "statements_per_call": counter.statements / calls}
+
+async def run(sizes, calls: int, sold_out: bool) -> None:
+    prefix = f"bench-cart-{uuid.uuid4().hex[:8]}"
+    results = {}
+    try:
+        carts = {size: await _make_cart(prefix, size, sold_out) for size in sizes}
+        # Warm the connection pool before timing
+        await _price(carts[sizes[0]], 5)
+        for size, user_id in carts.items():
+            results[size] = await _price(user_id, calls)
+    finally:
+        async with AsyncSessionLocal() as db:
+            users = select(models.User.id).where(models.User.username.startswith(prefix))
+            await db.execute(delete(models.Cart).where(models.Cart.user_id.in_(users)))
+            await db.execute(delete(models.User).where(models.User.username.startswith(prefix)))
+            await db.execute(delete(models.Product).where(models.Product.name.startswith(prefix)))
+            await db.execute(delete(models.Category).where(models.Category.name.startswith(prefix)))
+            await db.commit()
+        await engine.dispose()
+
+    for size, result in results.items():
+        print(
+            f"{size:>4} lines: mean {result['mean_ms']:.3f} ms  p50 {result['p50_ms']:.3f} ms  "
+            f"p95 {result['p95_ms']:.3f} ms  {result['statements_per_call']:.2f} statements/call"
+        )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,10,30,100", type=lambda value: [int(size) for size in value.split(",")])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--sold-out", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.calls, args.sold_out))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Latency and round trips of a checkout.
+
+    python -m backend.benchmarks.checkout [--checkouts N] [--lines N]
+
+Fills one cart per checkout up front, then times services.checkout.checkout_cart
+on each in turn and reports the statements every checkout sends, from pricing
+the cart to the commit. The STK push is not part of it; the outbox dispatcher
+sends it later and is not running here.
+"""
+import argparse
+import asyncio
+import uuid
+from sqlalchemy import delete, func, select
+from backend import models, schemas
+from backend.benchmarks import StatementCounter, summarize, timer
+from backend.database import AsyncSessionLocal, engine
+from backend.services import checkout as checkout_service
+
+CHECKOUT = schemas.CheckoutCreate(payment_method="mpesa", address="Benchmark St", phone_number="254700000000")
+
+async def _make_carts(prefix: str, checkouts: int, lines: int) -> list:
+    async with AsyncSessionLocal() as db:
+        category = models.Category(name=prefix)
+        products = [
+            models.Product(name=f"{prefix}-{i}", description="", price=10.0 + i, category=category, stock=checkouts * 10)
+            for i in range(lines)
+        ]
+        users = []
+        for n in range(checkouts):
+            user = models.User(username=f"{prefix}-{n}", hashed_password="x", role=models.UserRole.user, is_active=True)
+            cart = models.Cart(user=user, products=[])
+            cart.items = [models.CartItem(product=product, quantity=2) for product in products]
+            users.append(user)
+            db.add(cart)
+        db.add_all(products)
+        await db.commit()
+        return [user.id for user in users]
+
+async def _cleanup(prefix: str, first_delta_id: int) -> None:
+    users = select(models.User.id).where(models.User.username.startswith(prefix))
+    orders = select(models.Order.id).where(models.Order.user_id.in_(users))
+    checkouts = select(models.Checkout.id).where(models.Checkout.order_id.in_(orders))
+    async with AsyncSessionLocal() as db:
+        # Order-total deltas carry no product; product deltas go with the products below
+        await db.execute(delete(models.SalesRollupDelta).where(
+            models.SalesRollupDelta.id > first_delta_id, models.SalesRollupDelta.product_id.is_(None)
+        ))
+        await db.execute(delete(models.Payment).where(models.Payment.checkout_id.in_(checkouts)))
+        await db.execute(delete(models.Checkout).where(models.Checkout.order_id.in_(orders)))
+        await db.execute(delete(models.OrderItem).where(models.OrderItem.order_id.in_(orders)))
+        await db.execute(delete(models.Order).where(models.Order.user_id.in_(users)))
+        await db.execute(delete(models.Cart).where(models.Cart.user_id.in_(users)))
+        await db.execute(delete(models.User).where(models.User.username.startswith(prefix)))
+        await db.execute(delete(models.Product).where(models.Product.name.startswith(prefix)))
+        await db.execute(delete(models.Category).where(models.Category.name == prefix))
+        await db.commit()
+
+async def run(checkouts: int, lines: int) -> None:
+    prefix = f"bench-checkout-{uuid.uuid4().hex[:8]}"
+    samples = []
+    counter = StatementCounter()
+    async with AsyncSessionLocal() as db:
+        first_delta_id = (await db.execute(select(func.coalesce(func.max(models.SalesRollupDelta.id), 0)))).scalar()
+    try:
+        user_ids = await _make_carts(prefix, checkouts, lines)
+        with counter.watch(engine):
+            for user_id in user_ids:
+                async with AsyncSessionLocal() as db:
+                    with timer(samples):
+                        await checkout_service.checkout_cart(db, user_id, CHECKOUT)
+    finally:
+        await _cleanup(prefix, first_delta_id)
+        await engine.dispose()
+
+    # The first checkout opens the pool's connection; report it apart from the rest
+    first, rest = samples[0], samples[1:] or samples
+    result = summarize(rest)
+    print(
+        f"{checkouts} checkouts of {lines} lines: first {first * 1000:.3f} ms, then mean {result['mean_ms']:.3f} ms  "
+        f"p50 {result['p50_ms']:.3f} ms  p95 {result['p95_ms']:.3f} ms  "
+        f"{counter.statements / checkouts:.2f} statements/checkout"
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkouts", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.checkouts, args.lines))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Latency of catalog requests while logins are being verified.
+
+    python -m backend.benchmarks.login_storm [--logins N] [--concurrency N] [--path /shop/categories]
+
+Drives the app in process over httpx's ASGI transport. Times GET --path with
+the app idle, then again while --concurrency clients keep posting to
+/auth/login, first with verification on the password hashing pool and then run
+inline on the event loop the way it used to be. On the pool, catalog latency
+during the storm should stay close to idle; inline, every probe waits behind
+the hashes in progress. Rate limiting is switched off so every login is
+verified.
+"""
+import argparse
+import asyncio
+import uuid
+import httpx
+from sqlalchemy import delete
+from backend import hashing, models, utils
+from backend.benchmarks import summarize, timer
+from backend.database import AsyncSessionLocal, engine
+from backend.main import app
+from backend.ratelimit import limiter
+
+PASSWORD = "benchmark password"
+
+class InlineHasher(hashing.PasswordHasher):
+    """Hashes on the calling coroutine, blocking the event loop like the old synchronous helpers."""
+
+    async def _submit(self, fn, *args):
+        return fn(*args)
+
+async def _probe(client: httpx.AsyncClient, path: str, probes: int) -> dict:
+    samples = []
+    for _ in range(probes):
+        with timer(samples):
+            response = await client.get(path)
+        response.raise_for_status()
+        # Spread the probes over the storm instead of queueing them back to back
+        await asyncio.sleep(0.005)
+    return summarize(samples)
+
+async def _storm(client: httpx.AsyncClient, username: str, logins: int, concurrency: int) -> None:
+    remaining = iter(range(logins))
+
+    async def login_loop():
+        for _ in remaining:
+            response = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+            response.raise_for_status()
+
+    await asyncio.gather(*(login_loop() for _ in range(concurrency)))
+
+async def _measure(client, path, probes, username=None, logins=0, concurrency=0) -> dict:
+    if not username:
+        return await _probe(client, path, probes)
+    storm = asyncio.create_task(_storm(client, username, logins, concurrency))
+    # Let the first logins reach the hasher before probing
+    await asyncio.sleep(0.05)
+    result = await _probe(client, path, probes)
+    await storm
+    return result
+
+async def run(logins: int, concurrency: int, probes: int, path: str) -> None:
+    username = f"bench-login-{uuid.uuid4().hex[:8]}"
+    limiter.enabled = False
+    async with AsyncSessionLocal() as db:
+        db.add(models.User(
+            username=username,
+            hashed_password=hashing.pwd_context.hash(PASSWORD),
+            role=models.UserRole.user,
+            is_active=True,
+        ))
+        await db.commit()
+    pooled = utils.password_hasher
+    results = {}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+            # Warm the caches and the connection pool before timing
+            await _probe(client, path, 10)
+            results["idle"] = await _measure(client, path, probes)
+            results["storm, pool"] = await _measure(client, path, probes, username, logins, concurrency)
+            utils.password_hasher = InlineHasher()
+            results["storm, inline"] = await _measure(client, path, probes, username, logins, concurrency)
+    finally:
+        utils.password_hasher = pooled
+        pooled.shutdown()
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(models.User).where(models.User.username == username))
+            await db.commit()
+        await engine.dispose()
+
+    print(f"GET {path} during {logins} logins from {concurrency} clients, {pooled.workers} hashing workers")
+    for run_name, result in results.items():
+        print(
+            f"{run_name:>14}: mean {result['mean_ms']:.3f} ms  p50 {result['p50_ms']:.3f} ms  p95 {result['p95_ms']:.3f} ms"
+        )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--probes", type=int, default=100)
+    parser.add_argument("--path", default="/shop/categories")
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.concurrency, args.probes, args.path))
+
+if __name__ == "__main__":
+    main()
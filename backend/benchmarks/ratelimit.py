@@ -0,0 +1,82 @@
+"""
+Per-request cost of rate limiting.
+
+    python -m backend.benchmarks.ratelimit [--requests N] [--storage postgres+batched:// --storage memory://]
+
+For each storage, times the limiter's decision on its own (limits' hit() under
+RATE_LIMIT_STRATEGY) and then a request to a limited route against the same
+route without a limit, over httpx's ASGI transport. Nothing here touches the
+database: the batched storage decides from its in-memory counters, and its
+flush task is not started.
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from fastapi import FastAPI, Request
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+from slowapi import Limiter
+from backend import ratelimit
+from backend.benchmarks import summarize, timer
+
+def _hit_us(storage_uri: str, hits: int) -> float:
+    strategy = STRATEGIES[ratelimit.RATE_LIMIT_STRATEGY](storage_from_string(storage_uri))
+    limit = parse("1000000/minute")
+    keys = [f"anonymous:10.0.{n // 256}.{n % 256}" for n in range(1000)]
+    started = time.perf_counter()
+    for n in range(hits):
+        strategy.hit(limit, keys[n % len(keys)])
+    return (time.perf_counter() - started) / hits * 1_000_000
+
+def _app(limiter: Limiter) -> FastAPI:
+    app = FastAPI()
+    app.state.limiter = limiter
+
+    @app.get("/open")
+    async def open_route(request: Request):
+        return {}
+
+    @app.get("/limited")
+    @limiter.limit("1000000/minute")
+    async def limited_route(request: Request):
+        return {}
+
+    return app
+
+async def _requests_ms(storage_uri: str, requests: int) -> dict:
+    limiter = Limiter(key_func=ratelimit.rate_limit_key, strategy=ratelimit.RATE_LIMIT_STRATEGY, storage_uri=storage_uri)
+    samples = {"/open": [], "/limited": []}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app(limiter)), base_url="http://benchmark") as client:
+        for path in samples:
+            await client.get(path)
+        # Alternate the routes so drift in the machine's speed hits both alike
+        for _ in range(requests):
+            for path, path_samples in samples.items():
+                with timer(path_samples):
+                    response = await client.get(path)
+                response.raise_for_status()
+    return {path: summarize(path_samples) for path, path_samples in samples.items()}
+
+def run(storages, requests: int, hits: int) -> None:
+    print(f"strategy {ratelimit.RATE_LIMIT_STRATEGY}")
+    for storage_uri in storages:
+        hit_us = _hit_us(storage_uri, hits)
+        results = asyncio.run(_requests_ms(storage_uri, requests))
+        overhead_ms = results["/limited"]["p50_ms"] - results["/open"]["p50_ms"]
+        print(
+            f"{storage_uri:>20}: hit() {hit_us:.1f} µs; request p50 {results['/open']['p50_ms']:.3f} ms open, "
+            f"{results['/limited']['p50_ms']:.3f} ms limited, {overhead_ms * 1000:.0f} µs added"
+        )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--storage", action="append", dest="storages")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--hits", type=int, default=100000)
+    args = parser.parse_args()
+    run(args.storages or ["postgres+batched://", "memory://"], args.requests, args.hits)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", 300))
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", 2048))
+# "postgres" fans invalidations out to every worker via LISTEN/NOTIFY; "memory" stays in-process
+CACHE_INVALIDATION_BUS = os.getenv("CACHE_INVALIDATION_BUS", "postgres")
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache_invalidation")
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry TTL and LRU eviction.
+    Keys are tuples whose first element is a namespace (e.g. ("product", 42)),
+    so a whole family of entries can be dropped at once.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Any]]" = OrderedDict()
+        # Newest version stamp seen per key, so stale reads and reordered messages are ignored
+        self._versions: Dict[Tuple[Hashable, ...], datetime] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple[Hashable, ...], default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(
+        self,
+        key: Tuple[Hashable, ...],
+        value: Any,
+        ttl: Optional[float] = None,
+        version: Optional[datetime] = None,
+    ) -> None:
+        if version is not None and not self.is_current(key, version):
+            # The value was read before a newer write we already know about
+            return
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def is_current(self, key: Tuple[Hashable, ...], version: datetime) -> bool:
+        latest = self._versions.get(key)
+        return latest is None or version >= latest
+
+    def record_version(self, key: Tuple[Hashable, ...], version: datetime) -> bool:
+        """Remember version for key; returns False if a newer or equal version was already seen."""
+        latest = self._versions.get(key)
+        if latest is not None and version <= latest:
+            return False
+        self._versions[key] = version
+        if len(self._versions) > self.maxsize * 4:
+            # Bounded memory: forgetting old stamps only means re-applying a duplicate
+            self._versions.pop(next(iter(self._versions)))
+        return True
+
+    def invalidate(self, namespace: Hashable, ident: Hashable = _MISSING) -> int:
+        """Drop one entry (namespace, ident), or every entry in namespace when ident is omitted."""
+        if ident is not _MISSING:
+            keys = [(namespace, ident)] if (namespace, ident) in self._entries else []
+        else:
+            keys = [key for key in self._entries if key[0] == namespace]
+        for key in keys:
+            del self._entries[key]
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+# Serialized storefront reads: categories, product details, featured and bestseller lists,
+# plus the admin settings document
+catalog_cache = TTLCache(maxsize=CATALOG_CACHE_MAX_ENTRIES, ttl=CATALOG_CACHE_TTL_SECONDS)
+
+# Extra in-process state keyed by namespace (e.g. auth revocations) that must also drop on invalidation
+_listeners: Dict[str, List[Callable[[Any], None]]] = {}
+
+def on_invalidate(namespace: str, callback: Callable[[Any], None]) -> None:
+    """Call callback(ident) whenever an invalidation for namespace is applied in this worker."""
+    _listeners.setdefault(namespace, []).append(callback)
+
+def _invalidate_locally(namespace: str, ident: Any) -> None:
+    """Drop every cached read in this worker that can embed the given row."""
+    for callback in _listeners.get(namespace, []):
+        callback(ident)
+    if namespace == "product":
+        catalog_cache.invalidate("product", ident)
+        catalog_cache.invalidate("category")
+        catalog_cache.invalidate("categories")
+        catalog_cache.invalidate("featured")
+        catalog_cache.invalidate("bestsellers")
+    elif namespace == "category":
+        catalog_cache.invalidate("category", ident)
+        catalog_cache.invalidate("categories")
+    elif namespace == "settings":
+        catalog_cache.invalidate("settings")
+    elif namespace == "stock":
+        # Stock moved on a batch of products (orders): their detail entries and the in-stock counts
+        for product_id in ident or []:
+            catalog_cache.invalidate("product", product_id)
+        catalog_cache.invalidate("category")
+        catalog_cache.invalidate("categories")
+    else:
+        catalog_cache.invalidate(namespace, ident)
+
+def apply_invalidation(namespace: str, ident: Any, version: Optional[datetime] = None) -> bool:
+    """
+    Apply an invalidation published by any worker. Messages carrying a version
+    stamp no newer than one already applied are skipped.
+    """
+    if version is not None and not catalog_cache.record_version((namespace, ident), version):
+        return False
+    _invalidate_locally(namespace, ident)
+    return True
+
+class InvalidationBus(ABC):
+    """
+    Fans cache invalidations out to every worker. Each message carries the
+    namespace and id of the changed row and its version stamp (updated_at).
+    Publishers apply their own invalidation synchronously; messages from the
+    same origin are ignored on receipt.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self.published = 0
+        self.received = 0
+        self.publish_errors = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    async def _send(self, payload: str) -> None:
+        """Deliver payload to every worker on the channel, this one included."""
+
+    async def publish(self, namespace: str, ident: Any, version: Optional[datetime] = None) -> None:
+        payload = json.dumps({
+            "o": self.origin,
+            "ns": namespace,
+            "id": ident,
+            "v": version.isoformat() if version else None,
+        })
+        try:
+            await self._send(payload)
+            self.published += 1
+        except Exception:
+            # Other workers fall back to the TTL; the write itself already succeeded
+            self.publish_errors += 1
+            logger.exception("Failed to publish cache invalidation for %s %s", namespace, ident)
+
+    def _receive(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed cache invalidation message: %r", payload)
+            return
+        if message.get("o") == self.origin:
+            return
+        self.received += 1
+        version = datetime.fromisoformat(message["v"]) if message.get("v") else None
+        apply_invalidation(message["ns"], message.get("id"), version)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transport": type(self).__name__,
+            "published": self.published,
+            "received": self.received,
+            "publish_errors": self.publish_errors,
+        }
+
+class InMemoryInvalidationBus(InvalidationBus):
+    """
+    In-process stand-in for tests and single-worker runs. Buses sharing a hub
+    list behave like separate workers on one channel.
+    """
+
+    def __init__(self, hub: Optional[List["InMemoryInvalidationBus"]] = None):
+        super().__init__()
+        self.hub = hub if hub is not None else []
+        self.hub.append(self)
+
+    async def _send(self, payload: str) -> None:
+        for bus in self.hub:
+            bus._receive(payload)
+
+class PostgresInvalidationBus(InvalidationBus):
+    """
+    LISTEN/NOTIFY transport on a dedicated asyncpg connection. The listener
+    reconnects with backoff and flushes the local cache after a reconnect,
+    since notifications sent while it was away are lost. It refuses to start
+    on a transaction-mode pooler, which runs LISTEN on whichever server
+    connection the statement lands on and then hands that connection to
+    other clients, so notifications would never arrive.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        channel: str = CACHE_INVALIDATION_CHANNEL,
+        connect_args: Optional[Dict] = None,
+        pooled: bool = False,
+    ):
+        super().__init__()
+        self.dsn = dsn
+        self.pooled = pooled
+        self.channel = channel
+        self.connect_args = connect_args or {}
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+        self._lost = asyncio.Event()
+
+    async def start(self) -> None:
+        if self.pooled:
+            raise RuntimeError(
+                "The postgres cache invalidation bus cannot LISTEN through a transaction-mode pooler "
+                "(DB_POOLER_MODE=true). Set DATABASE_DIRECT_URL to the database's non-pooled endpoint, "
+                "or CACHE_INVALIDATION_BUS=memory to rely on the cache TTL across workers."
+            )
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+
+    async def _close(self) -> None:
+        conn, self._conn = self._conn, None
+        self._connected.clear()
+        if conn is not None and not conn.is_closed():
+            await conn.close()
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        delay = 0.5
+        reconnecting = False
+        while True:
+            try:
+                conn = await asyncpg.connect(self.dsn, **self.connect_args)
+                self._lost.clear()
+                conn.add_termination_listener(lambda _conn: self._lost.set())
+                await conn.add_listener(self.channel, self._on_notify)
+                self._conn = conn
+                self._connected.set()
+                if reconnecting:
+                    catalog_cache.clear()
+                delay = 0.5
+                await self._lost.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation listener disconnected; retrying in %.1fs", delay)
+            await self._close()
+            reconnecting = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self._receive(payload)
+
+    async def _send(self, payload: str) -> None:
+        if self._conn is None:
+            raise RuntimeError("invalidation listener is not connected")
+        # One asyncpg connection runs one statement at a time
+        async with self._lock:
+            await self._conn.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+def _build_bus() -> InvalidationBus:
+    if CACHE_INVALIDATION_BUS == "memory":
+        return InMemoryInvalidationBus()
+    from .database import SQLALCHEMY_DATABASE_URL, SQLALCHEMY_DIRECT_DATABASE_URL, DB_POOLER_MODE, ASYNCPG_CONNECT_ARGS
+    url = SQLALCHEMY_DIRECT_DATABASE_URL or SQLALCHEMY_DATABASE_URL
+    dsn = url.replace("postgresql+asyncpg://", "postgresql://", 1)
+    return PostgresInvalidationBus(
+        dsn,
+        connect_args=ASYNCPG_CONNECT_ARGS,
+        pooled=DB_POOLER_MODE and SQLALCHEMY_DIRECT_DATABASE_URL is None,
+    )
+
+invalidation_bus = _build_bus()
+
+async def invalidate(namespace: str, ident: Any = None, version: Optional[datetime] = None) -> None:
+    """Invalidate a row's cached reads here and on every other worker."""
+    apply_invalidation(namespace, ident, version)
+    await invalidation_bus.publish(namespace, ident, version)
+
+async def invalidate_product(product_id: int, version: Optional[datetime] = None) -> None:
+    await invalidate("product", product_id, version)
+
+async def invalidate_category(category_id: int, version: Optional[datetime] = None) -> None:
+    await invalidate("category", category_id, version)
+
+async def invalidate_settings(version: Optional[datetime] = None) -> None:
+    await invalidate("settings", None, version)
+
+async def invalidate_stock(product_ids: List[int]) -> None:
+    """Drop cached product details after stock changed on several products, in one message."""
+    await invalidate("stock", sorted(set(product_ids)))
@@ -1,26 +1,69 @@
+import json
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, func, desc
-from sqlalchemy.orm import selectinload
-from backend import models, schemas, utils
+from sqlalchemy import select, update, delete, func, desc, asc, tuple_, literal, cast, values, column, union_all, or_, Integer, DateTime
+from sqlalchemy.orm import selectinload, raiseload
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from backend import models, schemas, utils, cache
+from backend.database import AsyncSessionLocal, engine, read_engine
+from backend.services import analytics
 from fastapi import HTTPException
-from typing import Optional, List, Dict, Union
+from datetime import date, datetime
+from typing import Any, Optional, List, Dict, Union, Tuple
 
 # User CRUD
-async def get_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
+# Loader profiles for get_user, picked per call site by what the response serializes.
+# Relationships a profile leaves out raise on access instead of lazy loading, which
+# cannot work on an AsyncSession anyway.
+USER_LOAD_PROFILES = {
+    # schemas.User: columns only
+    "profile": (raiseload("*"),),
+    # schemas.AdminUserDetail: columns plus the user's order headers, in one selectin query
+    "admin_detail": (selectinload(models.User.orders), raiseload("*")),
+}
+
+async def get_user(db: AsyncSession, user_id: int, load: str = "profile") -> Optional[models.User]:
     result = await db.execute(
         select(models.User)
-        .options(
-            selectinload(models.User.orders).selectinload(models.Order.items).selectinload(models.OrderItem.product),
-            selectinload(models.User.carts),
-            selectinload(models.User.wishlists)
-        )
+        .options(*USER_LOAD_PROFILES[load])
         .filter(models.User.id == user_id)
     )
     return result.scalars().first()
 
-async def get_users(db: AsyncSession) -> List[models.User]:
-    result = await db.execute(select(models.User))
-    return result.scalars().all()
+USER_SORT_COLUMNS = {
+    "id": models.User.id,
+    "created_at": models.User.created_at,
+    "username": models.User.username,
+}
+
+def _users_query(
+    role: Optional[models.UserRole] = None,
+    is_active: Optional[bool] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    query = select(models.User).where(*_created_between(models.User.created_at, created_from, created_to))
+    if role is not None:
+        query = query.where(models.User.role == role)
+    if is_active is not None:
+        query = query.where(models.User.is_active == is_active)
+    return query
+
+async def get_users_page(
+    db: AsyncSession,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    role: Optional[models.UserRole] = None,
+    is_active: Optional[bool] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    with_estimate: bool = False,
+) -> Tuple[List[models.User], Optional[str], Optional[int]]:
+    query = _users_query(role, is_active, created_from, created_to)
+    rows, next_cursor = await keyset_page(db, query, USER_SORT_COLUMNS, models.User.id, sort, order, limit, cursor)
+    return rows, next_cursor, (await estimate_count(db, query) if with_estimate else None)
 
 async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
     result = await db.execute(select(models.User).filter(models.User.username == username))
@@ -31,7 +74,7 @@ async def get_user_by_email(db: AsyncSession, email: str) -> Optional[models.Use
     return result.scalars().first()
 
 async def create_user(db: AsyncSession, user: schemas.UserCreate) -> models.User:
-    hashed_password = utils.get_password_hash(user.password)
+    hashed_password = await utils.get_password_hash(user.password)
     db_user = models.User(
         username=user.username,
         hashed_password=hashed_password,
@@ -46,29 +89,54 @@ async def create_user(db: AsyncSession, user: schemas.UserCreate) -> models.User
     await db.refresh(db_user)
     return db_user
 
+# Changing any of these revokes the user's outstanding tokens
+TOKEN_REVOKING_FIELDS = {"hashed_password", "role", "username", "is_active"}
+
 async def update_user(db: AsyncSession, user_id: int, user_update: Union[schemas.UserUpdate, schemas.AdminUserUpdate]) -> Optional[models.User]:
     update_data = user_update.dict(exclude_unset=True)
     if 'password' in update_data:
-        update_data['hashed_password'] = utils.get_password_hash(update_data.pop('password'))
+        update_data['hashed_password'] = await utils.get_password_hash(update_data.pop('password'))
+    revokes_tokens = bool(TOKEN_REVOKING_FIELDS & update_data.keys())
+    if revokes_tokens:
+        update_data['token_version'] = models.User.token_version + 1
     result = await db.execute(
         update(models.User).where(models.User.id == user_id).values(**update_data)
     )
     await db.commit()
     if result.rowcount > 0:
+        if revokes_tokens:
+            await cache.invalidate("user", user_id)
         return await get_user(db, user_id)
     return None
 
 async def delete_user(db: AsyncSession, user_id: int) -> bool:
     result = await db.execute(delete(models.User).where(models.User.id == user_id))
     await db.commit()
+    if result.rowcount > 0:
+        await cache.invalidate("user", user_id)
     return result.rowcount > 0
 
 async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[models.User]:
     user = await get_user_by_username(db, username)
-    if not user or not utils.verify_password(password, user.hashed_password):
+    if not user:
         return None
+    verified, new_hash = await utils.verify_and_update_password(password, user.hashed_password)
+    if not verified:
+        return None
+    if new_hash:
+        # Same password under the current scheme and cost, so outstanding tokens stay valid
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
+def _version_stamp() -> datetime:
+    """
+    Version for a catalog write's cache invalidation, from the same clock as the
+    updated_at column defaults. Writes to rows with updated_at store it there too,
+    so cached reads and invalidations always compare stamps from one source.
+    """
+    return datetime.utcnow()
+
 # Category CRUD
 async def get_categories(db: AsyncSession) -> List[models.Category]:
     result = await db.execute(
@@ -86,11 +154,32 @@ async def get_category(db: AsyncSession, category_id: int) -> Optional[models.Ca
     )
     return result.scalars().first()
 
+async def get_category_summaries(db: AsyncSession, category_id: Optional[int] = None) -> List[Any]:
+    """Categories with product and in-stock counts from one GROUP BY, without loading any products."""
+    query = (
+        select(
+            models.Category.id,
+            models.Category.name,
+            models.Category.description,
+            models.Category.image_url,
+            func.count(models.Product.id).label("product_count"),
+            func.count(models.Product.id).filter(models.Product.stock > 0).label("in_stock_count"),
+        )
+        .outerjoin(models.Product, models.Product.category_id == models.Category.id)
+        .group_by(models.Category.id)
+        .order_by(models.Category.name)
+    )
+    if category_id is not None:
+        query = query.where(models.Category.id == category_id)
+    result = await db.execute(query)
+    return result.all()
+
 async def create_category(db: AsyncSession, category: schemas.CategoryCreate) -> models.Category:
     db_category = models.Category(**category.dict())
     db.add(db_category)
     await db.commit()
     await db.refresh(db_category)
+    await cache.invalidate_category(db_category.id, _version_stamp())
     return db_category
 
 async def update_category(db: AsyncSession, category_id: int, category: schemas.CategoryUpdate) -> Optional[models.Category]:
@@ -100,12 +189,15 @@ async def update_category(db: AsyncSession, category_id: int, category: schemas.
     )
     await db.commit()
     if result.rowcount > 0:
+        await cache.invalidate_category(category_id, _version_stamp())
         return await get_category(db, category_id)
     return None
 
 async def delete_category(db: AsyncSession, category_id: int) -> bool:
     result = await db.execute(delete(models.Category).where(models.Category.id == category_id))
     await db.commit()
+    if result.rowcount > 0:
+        await cache.invalidate_category(category_id, _version_stamp())
     return result.rowcount > 0
 
 # Product CRUD
@@ -113,6 +205,117 @@ async def get_products(db: AsyncSession) -> List[models.Product]:
     result = await db.execute(select(models.Product).options(selectinload(models.Product.category)))
     return result.scalars().all()
 
+# Keyset pagination
+async def keyset_page(
+    db: AsyncSession,
+    query,
+    sort_columns: Dict[str, Any],
+    id_column,
+    sort: str,
+    order: str,
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Run one keyset-paginated page of query and return its rows and the cursor for
+    the next page. The cursor encodes the (sort value, id) of the last row, so every
+    page is an index range scan no matter how deep the client has paged.
+    """
+    sort_column = sort_columns[sort]
+    direction = asc if order == "asc" else desc
+    if cursor:
+        last_value, last_id = utils.decode_cursor(cursor, sort, order)
+        if sort_column is id_column:
+            query = query.where(id_column > last_id if order == "asc" else id_column < last_id)
+        else:
+            if isinstance(sort_column.type, DateTime):
+                try:
+                    last_value = datetime.fromisoformat(last_value)
+                except (TypeError, ValueError):
+                    raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+            row_key = tuple_(sort_column, id_column)
+            last_key = tuple_(literal(last_value, type_=sort_column.type), literal(last_id))
+            query = query.where(row_key > last_key if order == "asc" else row_key < last_key)
+
+    ordering = [direction(sort_column)] if sort_column is id_column else [direction(sort_column), direction(id_column)]
+    result = await db.execute(query.order_by(*ordering).limit(limit + 1))
+    rows = result.scalars().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = utils.encode_cursor(sort, order, getattr(last, sort_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
+
+async def estimate_count(db: AsyncSession, query) -> int:
+    """
+    Planner estimate of the rows query matches, read from EXPLAIN rather than
+    counting them. Filter values are rendered inline, so it costs one planning pass.
+    """
+    statement = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    conn = await db.connection()
+    plan = (await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def _created_between(column, created_from: Optional[datetime], created_to: Optional[datetime]) -> List:
+    conditions = []
+    if created_from is not None:
+        conditions.append(column >= created_from)
+    if created_to is not None:
+        conditions.append(column <= created_to)
+    return conditions
+
+# Sort keys accepted by get_products_page; each is backed by a (column, id) index on products
+PRODUCT_SORT_COLUMNS = {
+    "price": models.Product.price,
+    "updated_at": models.Product.updated_at,
+    "name": models.Product.name,
+}
+
+async def get_products_page(
+    db: AsyncSession,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    sort: str = "updated_at",
+    order: str = "desc",
+    category_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: Optional[bool] = None,
+    is_featured: Optional[bool] = None,
+    is_bestseller: Optional[bool] = None,
+    search: Optional[str] = None,
+) -> Tuple[List[models.Product], Optional[str]]:
+    """
+    Return one keyset-paginated page of products and the cursor for the next page,
+    filtered as requested; see keyset_page for how the cursor works.
+    """
+    query = select(models.Product)
+
+    if category_id is not None:
+        query = query.where(models.Product.category_id == category_id)
+    if min_price is not None:
+        query = query.where(models.Product.price >= min_price)
+    if max_price is not None:
+        query = query.where(models.Product.price <= max_price)
+    if in_stock is not None:
+        query = query.where(models.Product.stock > 0 if in_stock else models.Product.stock <= 0)
+    if is_featured is not None:
+        query = query.where(models.Product.is_featured == is_featured)
+    if is_bestseller is not None:
+        query = query.where(models.Product.is_bestseller == is_bestseller)
+    if search:
+        pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = query.where(or_(
+            models.Product.name.ilike(pattern, escape="\\"),
+            models.Product.description.ilike(pattern, escape="\\"),
+        ))
+
+    return await keyset_page(db, query, PRODUCT_SORT_COLUMNS, models.Product.id, sort, order, limit, cursor)
+
 async def get_product(db: AsyncSession, product_id: int) -> Optional[models.Product]:
     result = await db.execute(
         select(models.Product)
@@ -126,21 +329,26 @@ async def create_product(db: AsyncSession, product: schemas.ProductCreate) -> mo
     db.add(db_product)
     await db.commit()
     await db.refresh(db_product)
+    await cache.invalidate_product(db_product.id, db_product.updated_at)
     return db_product
 
 async def update_product(db: AsyncSession, product_id: int, product: schemas.ProductBase) -> Optional[models.Product]:
     update_data = product.dict(exclude_unset=True)
+    version = _version_stamp()
     result = await db.execute(
-        update(models.Product).where(models.Product.id == product_id).values(**update_data)
+        update(models.Product).where(models.Product.id == product_id).values(**update_data, updated_at=version)
     )
     await db.commit()
     if result.rowcount > 0:
+        await cache.invalidate_product(product_id, version)
         return await get_product(db, product_id)
     return None
 
 async def delete_product(db: AsyncSession, product_id: int) -> bool:
     result = await db.execute(delete(models.Product).where(models.Product.id == product_id))
     await db.commit()
+    if result.rowcount > 0:
+        await cache.invalidate_product(product_id, _version_stamp())
     return result.rowcount > 0
 
 # ========== Cart CRUD Operations ==========
@@ -151,17 +359,48 @@ async def get_cart(db: AsyncSession, user_id: int) -> Optional[models.Cart]:
     return result.scalars().first()
 
 async def create_cart(db: AsyncSession, user_id: int) -> models.Cart:
-    """Create a new cart for a user."""
-    db_cart = models.Cart(user_id=user_id, products=[])
-    db.add(db_cart)
+    """Create a new cart for a user, tolerating a concurrent request creating it first."""
+    await db.execute(
+        pg_insert(models.Cart)
+        .values(user_id=user_id, products=[])
+        .on_conflict_do_nothing(index_elements=[models.Cart.user_id])
+    )
     await db.commit()
-    await db.refresh(db_cart)
-    return db_cart
+    return await get_cart(db, user_id)
 
 async def get_or_create_cart(db: AsyncSession, user_id: int) -> models.Cart:
     """Get existing cart or create a new one if it doesn't exist."""
     return await get_cart(db, user_id) or await create_cart(db, user_id)
 
+def _cart_item_upsert(cart_id: int, product_id: int, quantity: int, increment: bool):
+    """
+    Build a single-statement upsert of one cart line. The row is only written
+    while the product exists and has enough stock for the resulting quantity;
+    RETURNING yields no row otherwise.
+    """
+    insert_stmt = pg_insert(models.CartItem).from_select(
+        ["cart_id", "product_id", "quantity"],
+        select(cast(literal(cart_id), Integer), models.Product.id, cast(literal(quantity), Integer))
+        .where(models.Product.id == product_id, models.Product.stock >= quantity)
+    )
+    new_quantity = models.CartItem.quantity + insert_stmt.excluded.quantity if increment else insert_stmt.excluded.quantity
+    stock = select(models.Product.stock).where(models.Product.id == product_id).scalar_subquery()
+    return insert_stmt.on_conflict_do_update(
+        index_elements=[models.CartItem.cart_id, models.CartItem.product_id],
+        set_={"quantity": new_quantity},
+        where=new_quantity <= stock,
+    ).returning(models.CartItem.quantity)
+
+async def _raise_cart_stock_error(db: AsyncSession, product_id: int) -> None:
+    """Explain why a cart upsert wrote nothing; only runs on the failure path."""
+    await db.rollback()
+    product = await get_product(db, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if product.stock <= 0:
+        raise HTTPException(status_code=400, detail="Product out of stock")
+    raise HTTPException(status_code=400, detail=f"Only {product.stock} items available in stock")
+
 async def add_to_cart(
     db: AsyncSession,
     cart_item: schemas.CartAddRequest,
@@ -169,45 +408,25 @@ async def add_to_cart(
 ) -> models.Cart:
     """Add an item to the cart or update quantity if item exists."""
     cart = await get_or_create_cart(db, user_id)
-    product = await get_product(db, cart_item.product_id)
-
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-
-    if product.stock <= 0:
-        raise HTTPException(status_code=400, detail="Product out of stock")
-
-    existing_products = list(cart.products or [])
-    for item in existing_products:
-        if item.get("product_id") == cart_item.product_id:
-            new_quantity = item.get("quantity", 0) + cart_item.quantity
-            if new_quantity > product.stock:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Only {product.stock} items available in stock"
-                )
-            item["quantity"] = new_quantity
-            break
-    else:
-        if cart_item.quantity > product.stock:
-            raise HTTPException(status_code=400, detail=f"Only {product.stock} items available in stock")
-        existing_products.append({"product_id": cart_item.product_id, "quantity": cart_item.quantity})
-
-    cart.products = existing_products
+    result = await db.execute(_cart_item_upsert(cart.id, cart_item.product_id, cart_item.quantity, increment=True))
+    if result.first() is None:
+        await _raise_cart_stock_error(db, cart_item.product_id)
     await db.commit()
-    await db.refresh(cart)
     return cart
 
 async def remove_cart_item(db: AsyncSession, user_id: int, product_id: int) -> bool:
-    cart = await get_cart(db, user_id)
-    if not cart or not cart.products:
-        return False
-    filtered = [item for item in cart.products if item.get("product_id") != product_id]
-    if len(filtered) == len(cart.products):
-        return False
-    cart.products = filtered
+    cart_id = select(models.Cart.id).where(models.Cart.user_id == user_id).scalar_subquery()
+    result = await db.execute(
+        delete(models.CartItem).where(models.CartItem.cart_id == cart_id, models.CartItem.product_id == product_id)
+    )
     await db.commit()
-    return True
+    return result.rowcount > 0
+
+async def clear_cart(db: AsyncSession, user_id: int, commit: bool = True) -> None:
+    cart_id = select(models.Cart.id).where(models.Cart.user_id == user_id).scalar_subquery()
+    await db.execute(delete(models.CartItem).where(models.CartItem.cart_id == cart_id))
+    if commit:
+        await db.commit()
 
 async def update_cart_item_quantity(db: AsyncSession, user_id: int, product_id: int, quantity: int) -> Optional[dict]:
     if quantity < 0:
@@ -217,108 +436,87 @@ async def update_cart_item_quantity(db: AsyncSession, user_id: int, product_id:
     if not cart:
         return None
 
-    product = await get_product(db, product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-
-    if quantity > product.stock:
-        raise HTTPException(status_code=400, detail=f"Only {product.stock} items available in stock")
-
-    updated_products = list(cart.products or [])
-    for item in updated_products:
-        if item.get("product_id") == product_id:
-            if quantity == 0:
-                updated_products.remove(item)
-            else:
-                item["quantity"] = quantity
-            break
+    if quantity == 0:
+        await db.execute(
+            delete(models.CartItem).where(models.CartItem.cart_id == cart.id, models.CartItem.product_id == product_id)
+        )
     else:
-        if quantity > 0:
-            updated_products.append({"product_id": product_id, "quantity": quantity})
-
-    cart.products = updated_products
+        result = await db.execute(_cart_item_upsert(cart.id, product_id, quantity, increment=False))
+        if result.first() is None:
+            await _raise_cart_stock_error(db, product_id)
     await db.commit()
-    await db.refresh(cart)
     return await get_cart_with_totals(db, user_id)
 
+CART_TAX_RATE = 0.16
+
+def _empty_cart_totals(cart_id: Optional[int]) -> dict:
+    return {
+        "id": cart_id,
+        "products": [],
+        "subtotal": 0.0,
+        "tax": 0.0,
+        "total": 0.0,
+        "tax_rate": CART_TAX_RATE,
+        "currency": "KES"
+    }
+
 async def get_cart_with_totals(db: AsyncSession, user_id: int) -> dict:
-    cart = await get_cart(db, user_id)
-    if not cart or not cart.products:
-        return {
-            "id": cart.id if cart else None,
-            "products": [],
-            "subtotal": 0.0,
-            "tax": 0.0,
-            "total": 0.0,
-            "tax_rate": 0.16,
-            "currency": "KES"
-        }
-    
-    # Filter out any products that no longer exist
-    valid_products = []
-    for item in cart.products:
-        try:
-            product = await get_product(db, item.get("product_id"))
-            if product and product.stock > 0:
-                valid_products.append({
-                    "product_id": item.get("product_id"),
-                    "quantity": max(0, int(item.get("quantity", 0)))
-                })
-        except Exception:
-            continue
-    
-    # Update cart with only valid products
-    if len(valid_products) != len(cart.products):
-        cart.products = valid_products
-        await db.commit()
-    
-    if not valid_products:
-        return {
-            "id": cart.id,
-            "products": [],
-            "subtotal": 0.0,
-            "tax": 0.0,
-            "total": 0.0,
-            "tax_rate": 0.16,
-            "currency": "KES"
-        }
-    
-    product_ids = [item["product_id"] for item in valid_products]
-    products_result = await db.execute(
-        select(models.Product).filter(models.Product.id.in_(product_ids))
+    """
+    Price the user's cart with one query joining the cart, its lines and their products.
+    Out-of-stock lines are dropped and quantities are clamped to the available
+    stock in the same pass.
+    """
+    result = await db.execute(
+        select(models.Cart.id, models.CartItem.quantity, models.Product)
+        .select_from(models.Cart)
+        .outerjoin(models.CartItem, models.CartItem.cart_id == models.Cart.id)
+        .outerjoin(models.Product, models.Product.id == models.CartItem.product_id)
+        .where(models.Cart.user_id == user_id)
+        .order_by(models.CartItem.id)
     )
-    products = {p.id: p for p in products_result.scalars().all()}
-    
+    rows = result.all()
+    if not rows:
+        return _empty_cart_totals(None)
+
+    cart_id = rows[0][0]
     cart_items = []
+    out_of_stock = []
     subtotal = 0.0
-    
-    for item in valid_products:
-        product = products.get(item["product_id"])
-        if product:
-            item_quantity = min(int(item.get("quantity", 0)), max(0, product.stock))
-            if item_quantity <= 0:
-                continue
-            item_total = item_quantity * product.price
-            subtotal += item_total
-            
-            cart_items.append({
-                "product_id": product.id,
-                "quantity": item_quantity,
-                "product": schemas.ProductBase.from_orm(product),
-                "item_total": float(item_total)
-            })
-    
-    tax_rate = 0.16
-    tax = subtotal * tax_rate
+    for _, quantity, product in rows:
+        if product is None:
+            continue
+        if product.stock <= 0:
+            out_of_stock.append(product.id)
+            continue
+        item_quantity = min(quantity, product.stock)
+        if item_quantity <= 0:
+            continue
+        item_total = item_quantity * product.price
+        subtotal += item_total
+        cart_items.append({
+            "product_id": product.id,
+            "quantity": item_quantity,
+            "product": schemas.ProductBase.from_orm(product),
+            "item_total": float(item_total)
+        })
+
+    # Prune lines whose product sold out, only when there are any
+    if out_of_stock:
+        await db.execute(
+            delete(models.CartItem).where(models.CartItem.cart_id == cart_id, models.CartItem.product_id.in_(out_of_stock))
+        )
+        await db.commit()
+
+    tax = subtotal * CART_TAX_RATE
     total = subtotal + tax
-    
+
     return {
-        "id": cart.id,
+        "id": cart_id,
         "products": cart_items,
         "subtotal": float(subtotal),
         "tax": float(tax),
         "total": float(total),
-        "tax_rate": tax_rate,
+        "tax_rate": CART_TAX_RATE,
         "currency": "KES"
     }
 
@@ -430,15 +628,40 @@ async def clear_wishlist(db: AsyncSession, user_id: int) -> bool:
     return True
 
 # Order CRUD
-async def get_orders(db: AsyncSession) -> List[models.Order]:
-    result = await db.execute(
-        select(models.Order)
-        .options(
-            selectinload(models.Order.items).selectinload(models.OrderItem.product),
-            selectinload(models.Order.checkout)
-        )
-    )
-    return result.scalars().all()
+ORDER_SORT_COLUMNS = {
+    "id": models.Order.id,
+    "created_at": models.Order.created_at,
+}
+
+def _orders_query(
+    status: Optional[models.OrderStatus] = None,
+    user_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    # schemas.Order is columns only, so no items, products or checkout are loaded
+    query = select(models.Order).where(*_created_between(models.Order.created_at, created_from, created_to))
+    if status is not None:
+        query = query.where(models.Order.status == status)
+    if user_id is not None:
+        query = query.where(models.Order.user_id == user_id)
+    return query
+
+async def get_orders_page(
+    db: AsyncSession,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    status: Optional[models.OrderStatus] = None,
+    user_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    with_estimate: bool = False,
+) -> Tuple[List[models.Order], Optional[str], Optional[int]]:
+    query = _orders_query(status, user_id, created_from, created_to)
+    rows, next_cursor = await keyset_page(db, query, ORDER_SORT_COLUMNS, models.Order.id, sort, order, limit, cursor)
+    return rows, next_cursor, (await estimate_count(db, query) if with_estimate else None)
 
 async def get_order(db: AsyncSession, order_id: int) -> Optional[models.Order]:
     result = await db.execute(
@@ -462,47 +685,137 @@ async def get_user_orders(db: AsyncSession, user_id: int) -> List[models.Order]:
     )
     return result.scalars().all()
 
-async def create_order(db: AsyncSession, order: schemas.OrderCreate, user_id: int) -> models.Order:
-    total = 0
-    for item in order.items:
-        product = await get_product(db, item.product_id)
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-        if product.stock < item.quantity:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for product {item.product_id}")
-        total += item.quantity * item.price
-        await db.execute(
-            update(models.Product).where(models.Product.id == item.product_id).values(stock=product.stock - item.quantity)
-        )
-    db_order = models.Order(user_id=user_id, total=total)
+async def reserve_stock(db: AsyncSession, items: List[schemas.OrderItemBase]) -> None:
+    """
+    Decrement stock, and bump the bestseller counters, for every order line in one
+    UPDATE ... FROM (VALUES ...) statement. Rows only change where enough stock
+    remains, so concurrent checkouts cannot oversell. If any line cannot be fulfilled the transaction is rolled back and
+    a 400 lists every such line with what is still available.
+    The product rows are locked in id order first: the UPDATE's join visits them
+    in whatever order the planner picks, and two checkouts locking the same
+    products in opposite orders would deadlock.
+    """
+    requested: Dict[int, int] = {}
+    for item in items:
+        requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+
+    lines = values(
+        column("product_id", Integer), column("quantity", Integer), name="requested"
+    ).data(list(requested.items()))
+    await db.execute(
+        select(models.Product.id)
+        .where(models.Product.id.in_(requested))
+        .order_by(models.Product.id)
+        .with_for_update()
+    )
+    result = await db.execute(
+        update(models.Product)
+        .where(models.Product.id == lines.c.product_id, models.Product.stock >= lines.c.quantity)
+        .values(stock=models.Product.stock - lines.c.quantity, units_sold=models.Product.units_sold + lines.c.quantity)
+        .returning(models.Product.id)
+        .execution_options(synchronize_session=False)
+    )
+    reserved = set(result.scalars().all())
+    if len(reserved) == len(requested):
+        return
+
+    await db.rollback()
+    unfulfilled_ids = [product_id for product_id in requested if product_id not in reserved]
+    stock_result = await db.execute(
+        select(models.Product.id, models.Product.stock).where(models.Product.id.in_(unfulfilled_ids))
+    )
+    available = dict(stock_result.all())
+    raise HTTPException(
+        status_code=400,
+        detail={
+            "message": "Some items could not be fulfilled",
+            "items": [
+                {
+                    "product_id": product_id,
+                    "requested": requested[product_id],
+                    "available": max(0, available[product_id]) if product_id in available else None,
+                    "reason": "insufficient_stock" if product_id in available else "not_found",
+                }
+                for product_id in unfulfilled_ids
+            ],
+        },
+    )
+
+async def stage_order(db: AsyncSession, items: List[schemas.OrderItemBase], user_id: int) -> models.Order:
+    """
+    Reserve stock and add the order with its items to the session without committing.
+    The order and its items are written together by the next flush, items as one
+    batched INSERT, along with the order's sales rollup deltas.
+    """
+    await reserve_stock(db, items)
+    db_order = models.Order(
+        user_id=user_id,
+        created_at=datetime.utcnow(),
+        total=sum(item.quantity * item.price for item in items),
+        items=[models.OrderItem(**item.dict()) for item in items]
+    )
     db.add(db_order)
+    db.add_all(analytics.staged_order_deltas(db_order))
+    return db_order
+
+async def create_order(db: AsyncSession, order: schemas.OrderCreate, user_id: int) -> models.Order:
+    db_order = await stage_order(db, order.items, user_id)
     await db.commit()
-    await db.refresh(db_order)
-    for item in order.items:
-        db_item = models.OrderItem(**item.dict(), order_id=db_order.id)
-        db.add(db_item)
-    await db.commit()
+    # Keep the cached product detail pages' stock figures honest
+    await cache.invalidate_stock([item.product_id for item in order.items])
     return db_order
 
 async def update_order(db: AsyncSession, order_id: int, order: schemas.OrderBase) -> Optional[models.Order]:
     update_data = order.dict(exclude_unset=True)
-    result = await db.execute(
+    # Lock the row so the rollup deltas are computed against the status and total being replaced
+    current = (await db.execute(
+        select(models.Order.status, models.Order.total).where(models.Order.id == order_id).with_for_update()
+    )).first()
+    if current is None:
+        return None
+    was_counted = analytics.counts_as_sale(current.status)
+    now_counted = analytics.counts_as_sale(update_data.get("status", current.status))
+    total_changed = update_data.get("total", current.total) != current.total
+    rollups_change = was_counted != now_counted or (now_counted and total_changed)
+    if rollups_change and was_counted:
+        await analytics.record_order_sales(db, [order_id], -1)
+    await db.execute(
         update(models.Order).where(models.Order.id == order_id).values(**update_data)
     )
+    if rollups_change and now_counted:
+        await analytics.record_order_sales(db, [order_id], 1)
+    if was_counted != now_counted:
+        await analytics.adjust_units_sold(db, [order_id], 1 if now_counted else -1)
     await db.commit()
-    if result.rowcount > 0:
-        return await get_order(db, order_id)
-    return None
+    return await get_order(db, order_id)
 
 async def delete_order(db: AsyncSession, order_id: int) -> bool:
-    result = await db.execute(delete(models.Order).where(models.Order.id == order_id))
+    status = (await db.execute(
+        select(models.Order.status).where(models.Order.id == order_id).with_for_update()
+    )).first()
+    if status is None:
+        return False
+    if analytics.counts_as_sale(status.status):
+        await analytics.record_order_sales(db, [order_id], -1)
+        await analytics.adjust_units_sold(db, [order_id], -1)
+    await db.execute(delete(models.Order).where(models.Order.id == order_id))
     await db.commit()
-    return result.rowcount > 0
+    return True
 
 async def get_order_summary(db: AsyncSession, order_id: int) -> Optional[Dict]:
     order = await get_order(db, order_id)
     if not order:
         return None
+    return build_order_summary(order, {
+        item.product_id: {
+            "id": item.product.id,
+            "name": item.product.name,
+            "image_url": item.product.image_url
+        } for item in order.items
+    })
+
+def build_order_summary(order: models.Order, products: Dict[int, Dict]) -> Dict:
+    """Build an order summary from an order with loaded items and a product_id -> product info map."""
     subtotal = 0.0
     tax_rate = 0.16
     order_items = []
@@ -515,11 +828,7 @@ async def get_order_summary(db: AsyncSession, order_id: int) -> Optional[Dict]:
             "quantity": item.quantity,
             "price": float(item.price),
             "item_total": float(item_total),
-            "product": {
-                "id": item.product.id,
-                "name": item.product.name,
-                "image_url": item.product.image_url
-            }
+            "product": products[item.product_id]
         })
     tax = subtotal * tax_rate
     shipping_cost = 0.0
@@ -586,9 +895,31 @@ async def delete_order_item(db: AsyncSession, order_item_id: int, user_id: Optio
     return result.rowcount > 0
 
 # Checkout CRUD
-async def get_checkouts(db: AsyncSession) -> List[models.Checkout]:
-    result = await db.execute(select(models.Checkout).options(selectinload(models.Checkout.order)))
-    return result.scalars().all()
+CHECKOUT_SORT_COLUMNS = {
+    "id": models.Checkout.id,
+}
+
+def _checkouts_query(payment_status: Optional[str] = None, order_id: Optional[int] = None):
+    query = select(models.Checkout)
+    if payment_status is not None:
+        query = query.where(models.Checkout.payment_status == payment_status)
+    if order_id is not None:
+        query = query.where(models.Checkout.order_id == order_id)
+    return query
+
+async def get_checkouts_page(
+    db: AsyncSession,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    order: str = "desc",
+    payment_status: Optional[str] = None,
+    order_id: Optional[int] = None,
+    with_estimate: bool = False,
+) -> Tuple[List[models.Checkout], Optional[str], Optional[int]]:
+    query = _checkouts_query(payment_status, order_id)
+    rows, next_cursor = await keyset_page(db, query, CHECKOUT_SORT_COLUMNS, models.Checkout.id, sort, order, limit, cursor)
+    return rows, next_cursor, (await estimate_count(db, query) if with_estimate else None)
 
 async def get_checkout(db: AsyncSession, checkout_id: int) -> Optional[models.Checkout]:
     result = await db.execute(
@@ -621,9 +952,39 @@ async def delete_checkout(db: AsyncSession, checkout_id: int) -> bool:
     return result.rowcount > 0
 
 # Payment CRUD
-async def get_payments(db: AsyncSession) -> List[models.Payment]:
-    result = await db.execute(select(models.Payment).options(selectinload(models.Payment.checkout)))
-    return result.scalars().all()
+PAYMENT_SORT_COLUMNS = {
+    "id": models.Payment.id,
+    "created_at": models.Payment.created_at,
+}
+
+def _payments_query(
+    status: Optional[models.PaymentStatus] = None,
+    checkout_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    query = select(models.Payment).where(*_created_between(models.Payment.created_at, created_from, created_to))
+    if status is not None:
+        query = query.where(models.Payment.status == status)
+    if checkout_id is not None:
+        query = query.where(models.Payment.checkout_id == checkout_id)
+    return query
+
+async def get_payments_page(
+    db: AsyncSession,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    order: str = "desc",
+    status: Optional[models.PaymentStatus] = None,
+    checkout_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    with_estimate: bool = False,
+) -> Tuple[List[models.Payment], Optional[str], Optional[int]]:
+    query = _payments_query(status, checkout_id, created_from, created_to)
+    rows, next_cursor = await keyset_page(db, query, PAYMENT_SORT_COLUMNS, models.Payment.id, sort, order, limit, cursor)
+    return rows, next_cursor, (await estimate_count(db, query) if with_estimate else None)
 
 async def get_payment(db: AsyncSession, payment_id: int) -> Optional[models.Payment]:
     result = await db.execute(
@@ -657,40 +1018,31 @@ async def delete_payment(db: AsyncSession, payment_id: int) -> bool:
 
 # Bestseller and Featured Products
 async def get_bestseller_products(db: AsyncSession, limit: int = 10) -> List[models.Product]:
-    # First try to get products based on sales
-    product_sales = (
-        select(
-            models.OrderItem.product_id,
-            func.sum(models.OrderItem.quantity).label('total_sold')
-        )
-        .group_by(models.OrderItem.product_id)
-        .subquery()
-    )
-    
+    """
+    Top sellers by the units_sold counter, read off ix_products_units_sold_id, padded
+    with products flagged as bestsellers when too few have sold anything.
+    """
     result = await db.execute(
         select(models.Product)
         .options(selectinload(models.Product.category))
-        .outerjoin(product_sales, models.Product.id == product_sales.c.product_id)
-        .order_by(desc(product_sales.c.total_sold))
+        .where(models.Product.units_sold > 0)
+        .order_by(desc(models.Product.units_sold), desc(models.Product.id))
         .limit(limit)
     )
-    
-    products = result.scalars().all()
-    
-    # If we don't have enough products with sales, fill with products marked as bestsellers
+    products = list(result.scalars().all())
+
     if len(products) < limit:
         remaining_limit = limit - len(products)
         bestseller_result = await db.execute(
             select(models.Product)
             .options(selectinload(models.Product.category))
             .where(models.Product.is_bestseller == True)
-            .where(~models.Product.id.in_([p.id for p in products]))  # Exclude already selected products
+            .where(models.Product.units_sold <= 0)  # Anything that has sold is already ranked above
             .order_by(desc(models.Product.updated_at))
             .limit(remaining_limit)
         )
-        additional_products = bestseller_result.scalars().all()
-        products.extend(additional_products)
-    
+        products.extend(bestseller_result.scalars().all())
+
     return products
 
 async def get_featured_products(db: AsyncSession, limit: int = 10) -> List[models.Product]:
@@ -703,26 +1055,126 @@ async def get_featured_products(db: AsyncSession, limit: int = 10) -> List[model
     )
     return result.scalars().all()
 
+# Cached catalog reads for the storefront; admin CRUD above invalidates these on write
+async def _read_primary(db: AsyncSession, load):
+    """
+    Run load on the primary. Unversioned cache entries are filled from there even
+    when the route reads from the replica: the invalidation can arrive before the
+    replica has replayed the write, and a refill from it would keep the old rows
+    for the whole TTL.
+    """
+    if read_engine is engine or db.bind is not read_engine:
+        return await load(db)
+    async with AsyncSessionLocal() as primary:
+        return await load(primary)
+
+async def get_cached_categories(db: AsyncSession) -> List[schemas.CategorySummary]:
+    key = ("categories", "all")
+    categories = cache.catalog_cache.get(key)
+    if categories is None:
+        categories = [
+            schemas.CategorySummary.model_validate(row, from_attributes=True)
+            for row in await _read_primary(db, get_category_summaries)
+        ]
+        cache.catalog_cache.set(key, categories)
+    return categories
+
+async def get_cached_category(db: AsyncSession, category_id: int) -> Optional[schemas.CategorySummary]:
+    key = ("category", category_id)
+    category = cache.catalog_cache.get(key)
+    if category is None:
+        rows = await _read_primary(db, lambda primary: get_category_summaries(primary, category_id))
+        if not rows:
+            return None
+        category = schemas.CategorySummary.model_validate(rows[0], from_attributes=True)
+        cache.catalog_cache.set(key, category)
+    return category
+
+async def get_cached_product(db: AsyncSession, product_id: int) -> Optional[schemas.Product]:
+    key = ("product", product_id)
+    product = cache.catalog_cache.get(key)
+    if product is None:
+        db_product = await _read_primary(db, lambda primary: get_product(primary, product_id))
+        if not db_product:
+            return None
+        product = schemas.Product.from_orm(db_product)
+        cache.catalog_cache.set(key, product, version=db_product.updated_at)
+    return product
+
+async def get_cached_featured_products(db: AsyncSession, limit: int = 10) -> List[schemas.Product]:
+    key = ("featured", limit)
+    products = cache.catalog_cache.get(key)
+    if products is None:
+        featured = await _read_primary(db, lambda primary: get_featured_products(primary, limit=limit))
+        products = [schemas.Product.from_orm(p) for p in featured]
+        cache.catalog_cache.set(key, products)
+    return products
+
+async def get_cached_bestseller_products(db: AsyncSession, limit: int = 10) -> List[schemas.Product]:
+    key = ("bestsellers", limit)
+    products = cache.catalog_cache.get(key)
+    if products is None:
+        bestsellers = await _read_primary(db, lambda primary: get_bestseller_products(primary, limit=limit))
+        products = [schemas.Product.from_orm(p) for p in bestsellers]
+        cache.catalog_cache.set(key, products)
+    return products
+
 # Analytics
-async def get_analytics(db: AsyncSession) -> Dict:
+def _day_range(day_column, start_date: Optional[date], end_date: Optional[date]) -> List:
+    conditions = []
+    if start_date:
+        conditions.append(day_column >= start_date)
+    if end_date:
+        conditions.append(day_column <= end_date)
+    return conditions
+
+async def get_analytics(db: AsyncSession, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict:
+    """
+    Store analytics read from the daily sales rollups plus the deltas not yet
+    compacted into them, so the cost follows days x products rather than the
+    order history. Cancelled orders are not counted; dates are inclusive UTC days.
+    """
+    delta = models.SalesRollupDelta
     total_users = await db.execute(select(func.count()).select_from(models.User))
     total_users = total_users.scalar()
 
+    order_sales = union_all(
+        select(models.OrderSalesDaily.orders, models.OrderSalesDaily.revenue)
+        .where(*_day_range(models.OrderSalesDaily.day, start_date, end_date)),
+        select(delta.orders, delta.revenue)
+        .where(delta.product_id.is_(None), *_day_range(delta.day, start_date, end_date))
+    ).subquery()
     orders_result = await db.execute(
-        select(func.count(models.Order.id), func.sum(models.Order.total))
+        select(func.sum(order_sales.c.orders), func.sum(order_sales.c.revenue))
     )
     total_orders, total_revenue = orders_result.first()
 
+    product_sales = union_all(
+        select(models.ProductSalesDaily.product_id, models.ProductSalesDaily.quantity, models.ProductSalesDaily.revenue)
+        .where(*_day_range(models.ProductSalesDaily.day, start_date, end_date)),
+        select(delta.product_id, delta.quantity, delta.revenue)
+        .where(delta.product_id.is_not(None), *_day_range(delta.day, start_date, end_date))
+    ).subquery()
+    sales_by_product = (
+        select(
+            product_sales.c.product_id,
+            func.sum(product_sales.c.quantity).label('total_sold'),
+            func.sum(product_sales.c.revenue).label('total_revenue')
+        )
+        .group_by(product_sales.c.product_id)
+        .cte('sales_by_product')
+    )
+
     top_products_result = await db.execute(
         select(
             models.Product.id,
             models.Product.name,
-            func.sum(models.OrderItem.quantity).label('total_sold'),
-            func.sum(models.OrderItem.quantity * models.OrderItem.price).label('total_revenue')
+            sales_by_product.c.total_sold,
+            sales_by_product.c.total_revenue
         )
-        .join(models.OrderItem, models.Product.id == models.OrderItem.product_id)
-        .group_by(models.Product.id, models.Product.name)
-        .order_by(desc('total_sold'))
+        .join(sales_by_product, models.Product.id == sales_by_product.c.product_id)
+        .where(sales_by_product.c.total_sold > 0)
+        .order_by(desc(sales_by_product.c.total_sold))
         .limit(5)
     )
     top_products = [
@@ -734,16 +1186,17 @@ async def get_analytics(db: AsyncSession) -> Dict:
         } for row in top_products_result.all()
     ]
 
+    # Sales follow each product's current category, as they did when this joined order_items
     category_result = await db.execute(
         select(
             models.Category.id,
             models.Category.name,
             func.count(models.Product.id).label('product_count'),
-            func.sum(models.OrderItem.quantity).label('total_sold'),
-            func.sum(models.OrderItem.quantity * models.OrderItem.price).label('total_revenue')
+            func.sum(sales_by_product.c.total_sold).label('total_sold'),
+            func.sum(sales_by_product.c.total_revenue).label('total_revenue')
         )
         .outerjoin(models.Product, models.Category.id == models.Product.category_id)
-        .outerjoin(models.OrderItem, models.Product.id == models.OrderItem.product_id)
+        .outerjoin(sales_by_product, models.Product.id == sales_by_product.c.product_id)
         .group_by(models.Category.id, models.Category.name)
     )
     category_performance = [
@@ -762,6 +1215,8 @@ async def get_analytics(db: AsyncSession) -> Dict:
         "total_revenue": float(total_revenue or 0),
         "top_products": top_products,
         "category_performance": category_performance,
+        "start_date": start_date,
+        "end_date": end_date,
         "currency": "KES"
     }
 
@@ -776,9 +1231,26 @@ async def get_settings(db: AsyncSession) -> models.Settings:
         await db.refresh(settings)
     return settings
 
+async def get_cached_settings(db: AsyncSession) -> schemas.SettingsResponse:
+    key = ("settings", None)
+    settings = cache.catalog_cache.get(key)
+    if settings is None:
+        db_settings = await get_settings(db)
+        settings = schemas.SettingsResponse.from_orm(db_settings)
+        cache.catalog_cache.set(key, settings, version=db_settings.updated_at)
+    return settings
+
+async def warm_catalog_cache(db: AsyncSession) -> None:
+    """Fill the storefront landing-page entries, at their default sizes, before the first request."""
+    await get_cached_categories(db)
+    await get_cached_featured_products(db)
+    await get_cached_bestseller_products(db)
+    await get_cached_settings(db)
+
 async def update_settings(db: AsyncSession, data: Dict) -> models.Settings:
     settings = await get_settings(db)
     settings.data = data
     await db.commit()
     await db.refresh(settings)
+    await cache.invalidate_settings(settings.updated_at)
     return settings
\ No newline at end of file
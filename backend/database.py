@@ -1,22 +1,150 @@
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from uuid import uuid4
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import time
+import asyncio
+from typing import Any, Dict
 
 # Remove sslmode from DATABASE_URL
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL").replace("?sslmode=require", "")
+# Read replica for the route groups in replica.DB_REPLICA_ROUTES; every read uses the primary when unset
+SQLALCHEMY_READ_DATABASE_URL = (os.getenv("DATABASE_READ_URL") or "").replace("?sslmode=require", "") or None
+# Non-pooled endpoint for session-level features a transaction-mode pooler cannot carry,
+# such as the cache invalidation bus's LISTEN; needed with DB_POOLER_MODE
+SQLALCHEMY_DIRECT_DATABASE_URL = (os.getenv("DATABASE_DIRECT_URL") or "").replace("?sslmode=require", "") or None
+
+# Connection pool sizing, per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Neon closes idle connections, so recycle before the server does
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Connections opened at startup, so the first requests skip TLS setup
+DB_POOL_WARM_CONNECTIONS = int(os.getenv("DB_POOL_WARM_CONNECTIONS", DB_POOL_SIZE))
+# asyncpg's own statement cache and SQLAlchemy's prepared statement cache, per connection
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# Set when connecting through a transaction-mode pooler (PgBouncer, Neon's -pooler endpoint),
+# which cannot keep named prepared statements across transactions
+DB_POOLER_MODE = os.getenv("DB_POOLER_MODE", "false").lower() == "true"
+# Neon requires TLS; turn off for a local database, e.g. the test suite's
+DB_SSL = os.getenv("DB_SSL", "true").lower() == "true"
+
+# asyncpg connection arguments, shared with connections opened outside the engine
+ASYNCPG_CONNECT_ARGS = {
+    "ssl": DB_SSL,
+    "statement_cache_size": 0 if DB_POOLER_MODE else DB_STATEMENT_CACHE_SIZE,
+}
+
+ENGINE_CONNECT_ARGS = {
+    **ASYNCPG_CONNECT_ARGS,
+    "prepared_statement_cache_size": 0 if DB_POOLER_MODE else DB_STATEMENT_CACHE_SIZE,
+}
+if DB_POOLER_MODE:
+    # Unique names, so a statement prepared on one server connection never clashes on another
+    ENGINE_CONNECT_ARGS["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+
+class PoolMetrics:
+    """Counters for connection checkouts, time spent waiting on the pool and connection churn."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.peak_overflow = 0
+
+    def record_checkout(self, waited: float, overflow: int) -> None:
+        self.checkouts += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        # A checkout taking over a millisecond waited for a connection to be opened or returned
+        if waited > 0.001:
+            self.waits += 1
+        self.peak_overflow = max(self.peak_overflow, overflow)
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """The engine's default async queue pool, timing every checkout into its engine's metrics."""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record_checkout(time.perf_counter() - started_at, max(0, self.overflow()))
+        return connection
+
+def _build_engine(url: str):
+    metrics = PoolMetrics()
+    # A subclass per engine, since SQLAlchemy rebuilds the pool from its class on reconnect
+    poolclass = type("InstrumentedQueuePool", (InstrumentedQueuePool,), {"metrics": metrics})
+    async_engine = create_async_engine(
+        url,
+        echo=False,  # Disabled for production; enable for debugging
+        connect_args=ENGINE_CONNECT_ARGS,
+        poolclass=poolclass,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _count_connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(async_engine.sync_engine, "invalidate")
+    def _count_invalidate(dbapi_connection, connection_record, exception):
+        metrics.invalidations += 1
+
+    return async_engine
 
 # Create async engine with proper SSL configuration
-engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL,
-    echo=False,  # Disabled for production; enable for debugging
-    connect_args={"ssl": True},  # Enable SSL for Neon DB
-)
+engine = _build_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = _build_engine(SQLALCHEMY_READ_DATABASE_URL) if SQLALCHEMY_READ_DATABASE_URL else engine
+
+def pool_stats(target_engine=engine) -> Dict[str, Any]:
+    pool = target_engine.pool
+    pool_metrics = type(pool).metrics
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "peak_overflow": pool_metrics.peak_overflow,
+        "checkouts": pool_metrics.checkouts,
+        "waits": pool_metrics.waits,
+        "timeouts": pool_metrics.timeouts,
+        "avg_wait_ms": round(pool_metrics.wait_seconds / pool_metrics.checkouts * 1000, 3) if pool_metrics.checkouts else 0.0,
+        "max_wait_ms": round(pool_metrics.max_wait_seconds * 1000, 3),
+        "connects": pool_metrics.connects,
+        "invalidations": pool_metrics.invalidations,
+        "pooler_mode": DB_POOLER_MODE,
+    }
+
+async def warm_pool(target_engine=engine, connections: int = DB_POOL_WARM_CONNECTIONS) -> None:
+    """Open connections concurrently so they are already in the pool when traffic arrives."""
+    async def touch():
+        async with target_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    await asyncio.gather(*(touch() for _ in range(min(connections, DB_POOL_SIZE))))
 
 AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+ReadSessionLocal = sessionmaker(bind=read_engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -25,4 +153,4 @@ async def get_db():
         try:
             yield db
         finally:
-            await db.close()
\ No newline at end of file
+            await db.close()
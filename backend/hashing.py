@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+# New hashes use the first scheme; hashes in the others still verify and are
+# rehashed with the first one on the user's next successful login
+PASSWORD_HASH_SCHEMES = [
+    scheme.strip() for scheme in os.getenv("PASSWORD_HASH_SCHEMES", "argon2,bcrypt").split(",") if scheme.strip()
+]
+# bcrypt cost factor; each +1 doubles the time per hash
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# argon2id cost. Parallelism stays at 1 because the pool below already spreads logins over cores
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST_KIB = int(os.getenv("ARGON2_MEMORY_COST_KIB", 65536))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 1))
+# scrypt cost as log2(N)
+SCRYPT_ROUNDS = int(os.getenv("SCRYPT_ROUNDS", 16))
+# bcrypt and argon2 release the GIL, so threads hash in parallel without blocking the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Hash/verify calls allowed to wait for a worker before new ones are turned away with a 503
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64))
+
+def build_context(schemes=PASSWORD_HASH_SCHEMES) -> CryptContext:
+    """CryptContext for the configured schemes; hashes made with outdated costs report needs_update."""
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__rounds=BCRYPT_ROUNDS,
+        argon2__type="ID",
+        argon2__rounds=ARGON2_TIME_COST,
+        argon2__memory_cost=ARGON2_MEMORY_COST_KIB,
+        argon2__parallelism=ARGON2_PARALLELISM,
+        scrypt__rounds=SCRYPT_ROUNDS,
+    )
+
+pwd_context = build_context()
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a bounded thread pool so a burst
+    of logins cannot stall the event loop. At most workers calls run at once
+    and max_queue more may wait; beyond that callers get a 503 with Retry-After.
+    """
+
+    def __init__(
+        self,
+        context: CryptContext = pwd_context,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_queue: int = PASSWORD_HASH_MAX_QUEUE,
+    ):
+        self.context = context
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.upgraded = 0
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def _submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-in attempts in progress, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self._pending += 1
+        self.peak_pending = max(self.peak_pending, self._pending)
+        enqueued_at = time.perf_counter()
+
+        def timed():
+            started_at = time.perf_counter()
+            return fn(*args), started_at, time.perf_counter()
+
+        try:
+            loop = asyncio.get_running_loop()
+            result, started_at, finished_at = await loop.run_in_executor(self._get_executor(), timed)
+        finally:
+            self._pending -= 1
+        self.completed += 1
+        self._wait_seconds += started_at - enqueued_at
+        self._run_seconds += finished_at - started_at
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._submit(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify, and also return a replacement hash when the stored one uses an outdated scheme or cost."""
+        verified, new_hash = await self._submit(self.context.verify_and_update, password, hashed_password)
+        if new_hash:
+            self.upgraded += 1
+        return verified, new_hash
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "default_scheme": self.context.default_scheme(),
+            "in_flight": min(self._pending, self.workers),
+            "queue_depth": max(0, self._pending - self.workers),
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "upgraded": self.upgraded,
+            "avg_wait_ms": round(self._wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_run_ms": round(self._run_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+        }
+
+password_hasher = PasswordHasher()
+
+def benchmark(schemes=PASSWORD_HASH_SCHEMES, seconds: float = 2.0) -> Dict[str, Dict[str, float]]:
+    """Hash with each scheme on one core for about `seconds` and report the throughput."""
+    results = {}
+    for scheme in schemes:
+        context = build_context([scheme])
+        context.hash("warm-up password")
+        count = 0
+        started_at = time.perf_counter()
+        while time.perf_counter() - started_at < seconds:
+            context.hash("benchmark password")
+            count += 1
+        elapsed = time.perf_counter() - started_at
+        results[scheme] = {
+            "hashes_per_second_per_core": round(count / elapsed, 2),
+            "ms_per_hash": round(elapsed / count * 1000, 1),
+        }
+    return results
+
+if __name__ == "__main__":
+    # python -m backend.hashing [seconds]: pick costs so ms_per_hash fits the login budget
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    for scheme, result in benchmark(seconds=seconds).items():
+        print(f"{scheme:>8}: {result['hashes_per_second_per_core']:>8} hashes/s/core  {result['ms_per_hash']:>7} ms/hash")
+    print(f"pool workers: {PASSWORD_HASH_WORKERS}, cpu count: {os.cpu_count()}")
@@ -1,15 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from backend.database import engine, Base
-from backend.routers import auth, admin, user, shop
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict
+from backend.database import AsyncSessionLocal, engine, read_engine, warm_pool
+from backend import cache, crud, hashing, migrate, ratelimit, replica
+from backend.services import analytics, outbox, payments, reconciliation, mpesa as mpesa_service
+from backend.routers import auth, admin, user, shop, mpesa
 
-# Async function to create database tables
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def startup_phase(timings: Dict[str, float], name: str):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - started_at) * 1000, 1)
 
 # Initialize FastAPI app with enhanced OpenAPI configuration
 app = FastAPI(
@@ -20,7 +30,8 @@ app = FastAPI(
         {"name": "auth", "description": "User authentication and account management"},
         {"name": "user", "description": "User profile, orders, cart, and wishlist operations"},
         {"name": "shop", "description": "Public shop operations for products and categories"},
-        {"name": "admin", "description": "Admin operations for managing users, products, and orders"}
+        {"name": "admin", "description": "Admin operations for managing users, products, and orders"},
+        {"name": "mpesa", "description": "M-Pesa payment callbacks"}
     ]
 )
 
@@ -31,20 +42,68 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count-Estimate"],
 )
 
 # Rate limiting
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
+app.state.limiter = ratelimit.limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+@app.middleware("http")
+async def track_recent_writes(request: Request, call_next):
+    """Start the caller's read-your-writes window after any successful mutation."""
+    response = await call_next(request)
+    # Without a replica every read is on the primary, so there is nothing to pin
+    if replica.replica_enabled() and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        claims = ratelimit.request_token_claims(request)
+        if claims:
+            await replica.mark_recent_write(claims["uid"])
+    return response
+
 # Include routers with clear prefixes
 app.include_router(auth.router, tags=["auth"])
 app.include_router(user.router, tags=["user"])
 app.include_router(shop.router, tags=["shop"])
 app.include_router(admin.router, tags=["admin"])
+app.include_router(mpesa.router, tags=["mpesa"])
 
-# Run database initialization on startup
 @app.on_event("startup")
 async def startup_event():
-    await init_db()
\ No newline at end of file
+    timings: Dict[str, float] = {}
+    with startup_phase(timings, "schema_check"):
+        await migrate.ensure_schema()
+    with startup_phase(timings, "pool_warmup"):
+        await warm_pool(engine)
+        if read_engine is not engine:
+            await warm_pool(read_engine)
+    with startup_phase(timings, "cache_warmup"):
+        try:
+            async with AsyncSessionLocal() as db:
+                await crud.warm_catalog_cache(db)
+        except Exception:
+            # A cold cache only costs the first requests a query each
+            logger.exception("Catalog cache warmup failed")
+    with startup_phase(timings, "background_workers"):
+        await ratelimit.start()
+        await cache.invalidation_bus.start()
+        await outbox.dispatcher.start()
+        await payments.callback_processor.start()
+        await reconciliation.poller.start()
+        await analytics.compactor.start()
+    app.state.startup_timings = timings
+    logger.info(
+        "Startup finished in %.1f ms (%s)",
+        sum(timings.values()),
+        ", ".join(f"{name} {ms} ms" for name, ms in timings.items()),
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await analytics.compactor.stop()
+    await reconciliation.poller.stop()
+    await payments.callback_processor.stop()
+    await outbox.dispatcher.stop()
+    await mpesa_service.close_client()
+    await cache.invalidation_bus.stop()
+    hashing.password_hasher.shutdown()
+    await ratelimit.stop()
\ No newline at end of file
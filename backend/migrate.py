@@ -0,0 +1,58 @@
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from .database import engine
+
+if TYPE_CHECKING:
+    from alembic.config import Config
+
+ALEMBIC_INI = Path(__file__).with_name("alembic.ini")
+# Apply pending migrations at boot instead of refusing to start. Off by default:
+# deploys run `alembic -c backend/alembic.ini upgrade head` once, before the workers start.
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "false").lower() == "true"
+# Advisory lock key, so only one booting worker migrates while the others wait
+MIGRATION_LOCK_KEY = 0x5049534146
+
+def _config() -> "Config":
+    # Alembic loads only when the schema is checked, not whenever backend.main is imported
+    from alembic.config import Config
+    config = Config(str(ALEMBIC_INI))
+    config.attributes["configure_logger"] = False
+    return config
+
+def head_revision() -> Optional[str]:
+    from alembic.script import ScriptDirectory
+    return ScriptDirectory.from_config(_config()).get_current_head()
+
+async def current_revision(conn: AsyncConnection) -> Optional[str]:
+    # to_regclass instead of catching the error, which would abort the transaction
+    if (await conn.execute(text("SELECT to_regclass('alembic_version')"))).scalar() is None:
+        return None
+    return (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar()
+
+def _upgrade(sync_conn) -> None:
+    from alembic import command
+    config = _config()
+    config.attributes["connection"] = sync_conn
+    command.upgrade(config, "head")
+
+async def ensure_schema() -> None:
+    """
+    Boot-time schema check: a single query comparing the database's revision
+    with the migration head. No reflection and no DDL when they match.
+    """
+    head = head_revision()
+    async with engine.begin() as conn:
+        if await current_revision(conn) == head:
+            return
+        if not DB_MIGRATE_ON_STARTUP:
+            raise RuntimeError(
+                f"Database schema is at revision {await current_revision(conn)}, expected {head}. "
+                "Run `alembic -c backend/alembic.ini upgrade head` before starting the app."
+            )
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        # Another worker may have migrated while this one waited for the lock
+        if await current_revision(conn) != head:
+            await conn.run_sync(_upgrade)
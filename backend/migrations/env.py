@@ -0,0 +1,43 @@
+import asyncio
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from backend.database import SQLALCHEMY_DATABASE_URL, ENGINE_CONNECT_ARGS, Base
+from backend import models  # noqa: F401  registers every table on Base.metadata
+
+config = context.config
+# Skipped when the app runs migrations in-process, so its logging setup is left alone
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=SQLALCHEMY_DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def do_run_migrations(connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+async def run_async_migrations() -> None:
+    connectable = create_async_engine(SQLALCHEMY_DATABASE_URL, connect_args=ENGINE_CONNECT_ARGS, poolclass=NullPool)
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await connectable.dispose()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+elif config.attributes.get("connection") is not None:
+    # backend.migrate hands over the connection it already holds the migration lock on
+    do_run_migrations(config.attributes["connection"])
+else:
+    asyncio.run(run_async_migrations())
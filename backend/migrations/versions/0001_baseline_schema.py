@@ -0,0 +1,157 @@
+"""Baseline schema, as previously created by Base.metadata.create_all on boot
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+Every statement is guarded, so databases created by the old create_all can
+simply be upgraded onto this revision.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+user_role = postgresql.ENUM("admin", "user", name="userrole", create_type=False)
+order_status = postgresql.ENUM(
+    "pending", "processing", "shipped", "delivered", "cancelled", name="orderstatus", create_type=False
+)
+payment_status = postgresql.ENUM("pending", "completed", "failed", "refunded", name="paymentstatus", create_type=False)
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    for enum_type in (user_role, order_status, payment_status):
+        enum_type.create(bind, checkfirst=True)
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("username", sa.String),
+        sa.Column("hashed_password", sa.String),
+        sa.Column("role", user_role),
+        sa.Column("email", sa.String, nullable=True),
+        sa.Column("full_name", sa.String, nullable=True),
+        sa.Column("phone", sa.String, nullable=True),
+        sa.Column("address", sa.String, nullable=True),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("updated_at", sa.DateTime),
+        sa.Column("is_active", sa.Boolean),
+        if_not_exists=True,
+    )
+    op.create_index("ix_users_id", "users", ["id"], if_not_exists=True)
+    op.create_index("ix_users_username", "users", ["username"], unique=True, if_not_exists=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True, if_not_exists=True)
+
+    op.create_table(
+        "categories",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String, unique=True),
+        sa.Column("description", sa.String, nullable=True),
+        sa.Column("image_url", sa.String, nullable=True),
+        if_not_exists=True,
+    )
+    op.create_index("ix_categories_id", "categories", ["id"], if_not_exists=True)
+
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String),
+        sa.Column("description", sa.String),
+        sa.Column("price", sa.Float),
+        sa.Column("stock", sa.Integer),
+        sa.Column("category_id", sa.Integer, sa.ForeignKey("categories.id")),
+        sa.Column("image_url", sa.String, nullable=True),
+        sa.Column("is_bestseller", sa.Boolean),
+        sa.Column("is_featured", sa.Boolean),
+        sa.Column("updated_at", sa.DateTime),
+        if_not_exists=True,
+    )
+    op.create_index("ix_products_id", "products", ["id"], if_not_exists=True)
+
+    op.create_table(
+        "carts",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), unique=True),
+        sa.Column("products", sa.JSON),
+        if_not_exists=True,
+    )
+    op.create_index("ix_carts_id", "carts", ["id"], if_not_exists=True)
+
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id")),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("total", sa.Float),
+        sa.Column("status", order_status),
+        if_not_exists=True,
+    )
+    op.create_index("ix_orders_id", "orders", ["id"], if_not_exists=True)
+
+    op.create_table(
+        "order_items",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("order_id", sa.Integer, sa.ForeignKey("orders.id")),
+        sa.Column("product_id", sa.Integer, sa.ForeignKey("products.id")),
+        sa.Column("quantity", sa.Integer),
+        sa.Column("price", sa.Float),
+        if_not_exists=True,
+    )
+    op.create_index("ix_order_items_id", "order_items", ["id"], if_not_exists=True)
+
+    op.create_table(
+        "wishlists",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), unique=True),
+        sa.Column("products", sa.JSON),
+        if_not_exists=True,
+    )
+    op.create_index("ix_wishlists_id", "wishlists", ["id"], if_not_exists=True)
+
+    op.create_table(
+        "checkouts",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("order_id", sa.Integer, sa.ForeignKey("orders.id"), unique=True),
+        sa.Column("payment_method", sa.String),
+        sa.Column("payment_status", sa.String),
+        sa.Column("address", sa.String),
+        sa.Column("phone_number", sa.String),
+        sa.Column("mpesa_transaction_id", sa.String, nullable=True),
+        if_not_exists=True,
+    )
+    op.create_index("ix_checkouts_id", "checkouts", ["id"], if_not_exists=True)
+
+    op.create_table(
+        "payments",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("checkout_id", sa.Integer, sa.ForeignKey("checkouts.id")),
+        sa.Column("amount", sa.Float),
+        sa.Column("transaction_id", sa.String, unique=True),
+        sa.Column("status", payment_status),
+        sa.Column("created_at", sa.DateTime),
+        if_not_exists=True,
+    )
+    op.create_index("ix_payments_id", "payments", ["id"], if_not_exists=True)
+
+    op.create_table(
+        "settings",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("data", sa.JSON),
+        sa.Column("updated_at", sa.DateTime),
+        if_not_exists=True,
+    )
+    op.create_index("ix_settings_id", "settings", ["id"], if_not_exists=True)
+
+def downgrade() -> None:
+    for table in (
+        "settings", "payments", "checkouts", "wishlists", "order_items",
+        "orders", "carts", "products", "categories", "users",
+    ):
+        op.drop_table(table)
+    bind = op.get_bind()
+    for enum_type in (payment_status, order_status, user_role):
+        enum_type.drop(bind, checkfirst=True)
@@ -0,0 +1,135 @@
+"""Catalog keyset indexes, cart_items, payment outbox, worker checkpoints, rate limit counters, token versions
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+Replaces the ad-hoc steps init_db used to run after create_all. Guarded like
+0001, since databases booted by those releases already have some of this.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+payment_intent_status = postgresql.ENUM(
+    "pending", "dispatching", "dispatched", "failed", name="paymentintentstatus", create_type=False
+)
+
+PRODUCT_KEYSET_INDEXES = {
+    "ix_products_price_id": ["price", "id"],
+    "ix_products_updated_at_id": ["updated_at", "id"],
+    "ix_products_name_id": ["name", "id"],
+    "ix_products_category_price_id": ["category_id", "price", "id"],
+    "ix_products_category_updated_at_id": ["category_id", "updated_at", "id"],
+    "ix_products_category_name_id": ["category_id", "name", "id"],
+}
+
+# Move lines still stored in the legacy carts.products JSON column into cart_items.
+# Malformed or dangling lines are skipped, and migrated carts are emptied.
+MIGRATE_LEGACY_CART_LINES = """
+    INSERT INTO cart_items (cart_id, product_id, quantity)
+    SELECT c.id, p.id, SUM((line->>'quantity')::int)
+    FROM carts c
+    CROSS JOIN LATERAL json_array_elements(c.products) AS line
+    JOIN products p ON p.id::text = line->>'product_id'
+    WHERE json_typeof(c.products) = 'array'
+      AND line->>'quantity' ~ '^[0-9]+$'
+      AND (line->>'quantity')::int > 0
+    GROUP BY c.id, p.id
+    ON CONFLICT (cart_id, product_id) DO NOTHING
+"""
+CLEAR_LEGACY_CART_LINES = """
+    UPDATE carts SET products = '[]'::json
+    WHERE json_typeof(products) = 'array' AND json_array_length(products) > 0
+"""
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("token_version", sa.Integer, nullable=False, server_default="0"),
+        if_not_exists=True,
+    )
+    # Serves the token revocation list's reload of recently changed users
+    op.create_index(
+        "ix_users_revoked_updated_at",
+        "users",
+        ["updated_at"],
+        postgresql_where=sa.text("is_active = false OR token_version > 0"),
+        if_not_exists=True,
+    )
+
+    for name, columns in PRODUCT_KEYSET_INDEXES.items():
+        op.create_index(name, "products", columns, if_not_exists=True)
+
+    op.create_table(
+        "cart_items",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("cart_id", sa.Integer, sa.ForeignKey("carts.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("product_id", sa.Integer, sa.ForeignKey("products.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.UniqueConstraint("cart_id", "product_id", name="uq_cart_items_cart_product"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_cart_items_id", "cart_items", ["id"], if_not_exists=True)
+    op.execute(MIGRATE_LEGACY_CART_LINES)
+    op.execute(CLEAR_LEGACY_CART_LINES)
+
+    op.create_index("ix_payments_status_id", "payments", ["status", "id"], if_not_exists=True)
+
+    payment_intent_status.create(op.get_bind(), checkfirst=True)
+    op.create_table(
+        "payment_intents",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("payment_id", sa.Integer, sa.ForeignKey("payments.id", ondelete="CASCADE"), nullable=False, unique=True),
+        sa.Column("order_id", sa.Integer, sa.ForeignKey("orders.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("phone_number", sa.String, nullable=False),
+        sa.Column("amount", sa.Float, nullable=False),
+        sa.Column("status", payment_intent_status, nullable=False),
+        sa.Column("attempts", sa.Integer, nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime, nullable=False),
+        sa.Column("last_error", sa.String, nullable=True),
+        sa.Column("checkout_request_id", sa.String, nullable=True),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("updated_at", sa.DateTime),
+        if_not_exists=True,
+    )
+    op.create_index("ix_payment_intents_id", "payment_intents", ["id"], if_not_exists=True)
+    op.create_index(
+        "ix_payment_intents_status_next_attempt", "payment_intents", ["status", "next_attempt_at"], if_not_exists=True
+    )
+
+    op.create_table(
+        "worker_checkpoints",
+        sa.Column("name", sa.String, primary_key=True),
+        sa.Column("position", sa.Integer, nullable=False),
+        sa.Column("leased_until", sa.DateTime, nullable=True),
+        sa.Column("updated_at", sa.DateTime),
+        if_not_exists=True,
+    )
+
+    op.create_table(
+        "rate_limit_counters",
+        sa.Column("key", sa.String, primary_key=True),
+        sa.Column("count", sa.Integer, nullable=False),
+        sa.Column("expires_at", sa.Float, nullable=False),
+        if_not_exists=True,
+    )
+    op.create_index("ix_rate_limit_counters_expires_at", "rate_limit_counters", ["expires_at"], if_not_exists=True)
+
+def downgrade() -> None:
+    op.drop_table("rate_limit_counters")
+    op.drop_table("worker_checkpoints")
+    op.drop_table("payment_intents")
+    payment_intent_status.drop(op.get_bind(), checkfirst=True)
+    op.drop_index("ix_payments_status_id", table_name="payments")
+    # Cart lines are not copied back into the legacy JSON column
+    op.drop_table("cart_items")
+    for name in PRODUCT_KEYSET_INDEXES:
+        op.drop_index(name, table_name="products")
+    op.drop_index("ix_users_revoked_updated_at", table_name="users")
+    op.drop_column("users", "token_version")
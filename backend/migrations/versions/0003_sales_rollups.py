@@ -0,0 +1,69 @@
+"""Daily sales rollups for /admin/analytics and the delta log feeding them
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+The rollups are backfilled from the existing order history, leaving out
+cancelled orders. From here on order writes append sales_rollup_deltas,
+which services.analytics folds into the rollups.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+BACKFILL_PRODUCT_SALES = """
+    INSERT INTO product_sales_daily (day, product_id, quantity, revenue)
+    SELECT o.created_at::date, oi.product_id, SUM(oi.quantity), SUM(oi.quantity * oi.price)
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE o.status IS DISTINCT FROM 'cancelled' AND o.created_at IS NOT NULL AND oi.product_id IS NOT NULL
+    GROUP BY o.created_at::date, oi.product_id
+    ON CONFLICT (day, product_id) DO NOTHING
+"""
+BACKFILL_ORDER_SALES = """
+    INSERT INTO order_sales_daily (day, orders, revenue)
+    SELECT created_at::date, COUNT(*), COALESCE(SUM(total), 0)
+    FROM orders
+    WHERE status IS DISTINCT FROM 'cancelled' AND created_at IS NOT NULL
+    GROUP BY created_at::date
+    ON CONFLICT (day) DO NOTHING
+"""
+
+def upgrade() -> None:
+    op.create_table(
+        "sales_rollup_deltas",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("day", sa.Date, nullable=False),
+        sa.Column("product_id", sa.Integer, sa.ForeignKey("products.id", ondelete="CASCADE"), nullable=True),
+        sa.Column("orders", sa.Integer, nullable=False),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.Column("revenue", sa.Float, nullable=False),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "product_sales_daily",
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("product_id", sa.Integer, sa.ForeignKey("products.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.Column("revenue", sa.Float, nullable=False),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "order_sales_daily",
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("orders", sa.Integer, nullable=False),
+        sa.Column("revenue", sa.Float, nullable=False),
+        if_not_exists=True,
+    )
+    op.execute(BACKFILL_PRODUCT_SALES)
+    op.execute(BACKFILL_ORDER_SALES)
+
+def downgrade() -> None:
+    op.drop_table("order_sales_daily")
+    op.drop_table("product_sales_daily")
+    op.drop_table("sales_rollup_deltas")
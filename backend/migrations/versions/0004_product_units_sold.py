@@ -0,0 +1,42 @@
+"""Bestseller counter on products
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+products.units_sold is backfilled from the order lines of orders that are
+not cancelled, then kept current by the stock reservation and restock
+statements.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+BACKFILL_UNITS_SOLD = """
+    UPDATE products p SET units_sold = sold.quantity
+    FROM (
+        SELECT oi.product_id, SUM(oi.quantity) AS quantity
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE o.status IS DISTINCT FROM 'cancelled'
+        GROUP BY oi.product_id
+    ) sold
+    WHERE p.id = sold.product_id
+"""
+
+def upgrade() -> None:
+    op.add_column(
+        "products",
+        sa.Column("units_sold", sa.Integer, nullable=False, server_default="0"),
+        if_not_exists=True,
+    )
+    op.execute(BACKFILL_UNITS_SOLD)
+    op.create_index("ix_products_units_sold_id", "products", ["units_sold", "id"], if_not_exists=True)
+
+def downgrade() -> None:
+    op.drop_index("ix_products_units_sold_id", table_name="products")
+    op.drop_column("products", "units_sold")
@@ -0,0 +1,27 @@
+"""Indexes for the paginated /admin/orders list
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+ORDER_LIST_INDEXES = {
+    "ix_orders_created_at_id": ["created_at", "id"],
+    "ix_orders_status_created_at_id": ["status", "created_at", "id"],
+    "ix_orders_user_id_created_at_id": ["user_id", "created_at", "id"],
+}
+
+def upgrade() -> None:
+    for name, columns in ORDER_LIST_INDEXES.items():
+        op.create_index(name, "orders", columns, if_not_exists=True)
+
+def downgrade() -> None:
+    for name in ORDER_LIST_INDEXES:
+        op.drop_index(name, table_name="orders")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Enum, Boolean, JSON, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -21,6 +21,12 @@ class PaymentStatus(enum.Enum):
     failed = "failed"
     refunded = "refunded"
 
+class PaymentIntentStatus(enum.Enum):
+    pending = "pending"
+    dispatching = "dispatching"
+    dispatched = "dispatched"
+    failed = "failed"
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -34,11 +40,22 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    # Bumped whenever outstanding tokens must stop working (password, role, username or status change)
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
 
     carts = relationship("Cart", back_populates="user", uselist=False)
-    orders = relationship("Order", back_populates="user")
+    orders = relationship("Order", back_populates="user", order_by=lambda: Order.created_at.desc())
     wishlists = relationship("Wishlist", back_populates="user", uselist=False)
 
+    # The revocation list in utils loads recently changed users with revoked tokens
+    __table_args__ = (
+        Index(
+            "ix_users_revoked_updated_at",
+            "updated_at",
+            postgresql_where=text("is_active = false OR token_version > 0"),
+        ),
+    )
+
 class Category(Base):
     __tablename__ = "categories"
     id = Column(Integer, primary_key=True, index=True)
@@ -60,18 +77,50 @@ class Product(Base):
     is_bestseller = Column(Boolean, default=False)
     is_featured = Column(Boolean, default=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Units on orders that are not cancelled; moved in the same statements that reserve and return stock
+    units_sold = Column(Integer, default=0, server_default="0", nullable=False)
 
     category = relationship("Category", back_populates="products")
     order_items = relationship("OrderItem", back_populates="product")
     # Removed carts relationship since no direct foreign key exists
 
+    # Composite (sort key, id) indexes backing keyset pagination in crud.get_products_page,
+    # both catalog-wide and scoped to a category
+    __table_args__ = (
+        Index("ix_products_price_id", "price", "id"),
+        Index("ix_products_updated_at_id", "updated_at", "id"),
+        Index("ix_products_name_id", "name", "id"),
+        Index("ix_products_category_price_id", "category_id", "price", "id"),
+        Index("ix_products_category_updated_at_id", "category_id", "updated_at", "id"),
+        Index("ix_products_category_name_id", "category_id", "name", "id"),
+        # Bestseller ranking reads the top of this index backwards
+        Index("ix_products_units_sold_id", "units_sold", "id"),
+    )
+
 class Cart(Base):
     __tablename__ = "carts"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True)
+    # Legacy JSON line storage; lines now live in cart_items (old carts moved by migration 0002)
     products = Column(JSON, default=list)
 
     user = relationship("User", back_populates="carts")
+    items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan", passive_deletes=True)
+
+class CartItem(Base):
+    __tablename__ = "cart_items"
+    id = Column(Integer, primary_key=True, index=True)
+    cart_id = Column(Integer, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+    cart = relationship("Cart", back_populates="items")
+    product = relationship("Product")
+
+    # One row per (cart, product) so quantity changes are INSERT ... ON CONFLICT upserts
+    __table_args__ = (
+        UniqueConstraint("cart_id", "product_id", name="uq_cart_items_cart_product"),
+    )
 
 class Order(Base):
     __tablename__ = "orders"
@@ -85,6 +134,13 @@ class Order(Base):
     items = relationship("OrderItem", back_populates="order")
     checkout = relationship("Checkout", back_populates="order", uselist=False)
 
+    # Keyset pagination of /admin/orders by creation time, unfiltered or filtered by status or user
+    __table_args__ = (
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_orders_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
 class OrderItem(Base):
     __tablename__ = "order_items"
     id = Column(Integer, primary_key=True, index=True)
@@ -127,6 +183,81 @@ class Payment(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     checkout = relationship("Checkout", back_populates="payments")
+    intent = relationship("PaymentIntent", back_populates="payment", uselist=False)
+
+    # The STK status poller walks pending payments in id order
+    __table_args__ = (
+        Index("ix_payments_status_id", "status", "id"),
+    )
+
+class PaymentIntent(Base):
+    """Outbox row for an STK push, written in the checkout transaction and sent by the dispatcher."""
+    __tablename__ = "payment_intents"
+    id = Column(Integer, primary_key=True, index=True)
+    payment_id = Column(Integer, ForeignKey("payments.id", ondelete="CASCADE"), unique=True, nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    phone_number = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+    status = Column(Enum(PaymentIntentStatus), default=PaymentIntentStatus.pending, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(String, nullable=True)
+    checkout_request_id = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    payment = relationship("Payment", back_populates="intent")
+    order = relationship("Order")
+
+    # The dispatcher polls for due intents by (status, next_attempt_at)
+    __table_args__ = (
+        Index("ix_payment_intents_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class WorkerCheckpoint(Base):
+    """Resume position and lease for a background worker that scans a table in batches."""
+    __tablename__ = "worker_checkpoints"
+    name = Column(String, primary_key=True)
+    position = Column(Integer, default=0, nullable=False)
+    leased_until = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RateLimitCounter(Base):
+    """Rate limit counters shared by all workers; rows are flushed in batches by backend.ratelimit."""
+    __tablename__ = "rate_limit_counters"
+    key = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+    # Epoch seconds, matching the clock the limits library windows on
+    expires_at = Column(Float, nullable=False, index=True)
+
+class SalesRollupDelta(Base):
+    """
+    Signed change to the daily sales rollups, appended in the transaction that
+    creates, cancels or deletes an order and folded in by services.analytics.
+    Rows with no product_id carry the order count and order total.
+    """
+    __tablename__ = "sales_rollup_deltas"
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=True)
+    orders = Column(Integer, default=0, nullable=False)
+    quantity = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+
+class ProductSalesDaily(Base):
+    """Units sold and item revenue per product per day (UTC), excluding cancelled orders."""
+    __tablename__ = "product_sales_daily"
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+
+class OrderSalesDaily(Base):
+    """Order count and order totals per day (UTC), excluding cancelled orders."""
+    __tablename__ = "order_sales_daily"
+    day = Column(Date, primary_key=True)
+    orders = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
 
 class Settings(Base):
     __tablename__ = "settings"
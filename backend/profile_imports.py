@@ -0,0 +1,56 @@
+"""
+Import-time profile of the app.
+
+    python -m backend.profile_imports [--top N] [--module backend.main]
+
+Imports the module in a fresh interpreter with -X importtime and prints the
+slowest modules by cumulative time, then the same time grouped by top-level
+package.
+"""
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+def profile(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self µs, cumulative µs) for every module imported by `import module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    rows = profile(args.module)
+    total_us = next(cumulative for name, _, cumulative in rows if name == args.module)
+    print(f"import {args.module}: {total_us / 1000:.1f} ms, {len(rows)} modules\n")
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    # Self times summed per top-level package add up to the total without double counting
+    packages: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        packages[name.split(".")[0]] += self_us
+    print(f"\n{'self ms':>14}  package")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:>14.1f}  {package}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import os
+import time
+import asyncio
+import logging
+from math import floor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from fastapi import Request
+from jose import JWTError, jwt
+from limits.storage import Storage, SlidingWindowCounterSupport
+from limits.storage.base import TimestampedSlidingWindow
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+from sqlalchemy import select, delete, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+logger = logging.getLogger(__name__)
+
+# "memory://" keeps counters per worker (tests, single worker). "postgres+batched://" shares
+# them through the rate_limit_counters table; any limits storage URI (e.g. redis://) also works.
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "postgres+batched://")
+# "sliding-window-counter" or "fixed-window" (moving-window needs redis:// or memory://)
+RATE_LIMIT_STRATEGY = os.getenv("RATE_LIMIT_STRATEGY", "sliding-window-counter")
+# How often each worker pushes its counter deltas and pulls everyone else's
+RATE_LIMIT_FLUSH_SECONDS = float(os.getenv("RATE_LIMIT_FLUSH_SECONDS", 0.5))
+# Expired counter rows are swept every this many flushes
+RATE_LIMIT_SWEEP_EVERY = int(os.getenv("RATE_LIMIT_SWEEP_EVERY", 120))
+
+# Quota multiplier per caller tier; anonymous callers, keyed by address, get the base limit
+RATE_LIMIT_TIER_MULTIPLIERS = {
+    "anonymous": float(os.getenv("RATE_LIMIT_ANONYMOUS_MULTIPLIER", 1)),
+    "user": float(os.getenv("RATE_LIMIT_USER_MULTIPLIER", 2)),
+    "admin": float(os.getenv("RATE_LIMIT_ADMIN_MULTIPLIER", 10)),
+}
+
+_batched_storages: List["BatchedPostgresStorage"] = []
+
+class BatchedPostgresStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    limits storage that decides from in-memory counters and shares them with
+    other workers through the rate_limit_counters table.
+    A background task flushes the local deltas every RATE_LIMIT_FLUSH_SECONDS in
+    one upsert, which returns the global counts that replace the local view, so
+    a request never waits on the database. Across workers a limit can be
+    overshot by at most what the other workers admit within one flush interval.
+    """
+
+    STORAGE_SCHEME = ["postgres+batched"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.flush_interval = float(options.get("flush_interval", RATE_LIMIT_FLUSH_SECONDS))
+        self._counts: Dict[str, int] = {}
+        self._expiry: Dict[str, float] = {}
+        self._pending: Dict[str, int] = {}
+        self._touched: Set[str] = set()
+        self._cleared: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._flushes = 0
+        self._healthy = True
+        _batched_storages.append(self)
+
+    @property
+    def base_exceptions(self):
+        return ValueError
+
+    def _live(self, key: str, now: float) -> bool:
+        expires_at = self._expiry.get(key)
+        return expires_at is not None and expires_at > now
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        if not self._live(key, now):
+            self._counts[key] = 0
+            self._expiry[key] = now + expiry
+        self._counts[key] += amount
+        self._pending[key] = self._pending.get(key, 0) + amount
+        self._touched.add(key)
+        return self._counts[key]
+
+    def decr(self, key: str, amount: int = 1) -> int:
+        if not self._live(key, time.time()):
+            return 0
+        self._counts[key] = max(0, self._counts[key] - amount)
+        self._pending[key] = self._pending.get(key, 0) - amount
+        return self._counts[key]
+
+    def get(self, key: str) -> int:
+        self._touched.add(key)
+        return self._counts.get(key, 0) if self._live(key, time.time()) else 0
+
+    def get_expiry(self, key: str) -> float:
+        return self._expiry.get(key, time.time())
+
+    def check(self) -> bool:
+        return self._healthy
+
+    def reset(self) -> Optional[int]:
+        count = len(self._counts)
+        self._cleared.update(self._counts)
+        self._counts.clear()
+        self._expiry.clear()
+        self._pending.clear()
+        return count
+
+    def clear(self, key: str) -> None:
+        self._counts.pop(key, None)
+        self._expiry.pop(key, None)
+        self._pending.pop(key, None)
+        self._cleared.add(key)
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count, previous_ttl, current_count, _ = self._sliding_window_info(previous_key, current_key, expiry, now)
+        if floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+            return False
+        # Window keys are timestamped, so every worker expires them at the same moment
+        self.incr(current_key, 2 * expiry, amount=amount)
+        return True
+
+    def _sliding_window_info(self, previous_key: str, current_key: str, expiry: int, now: float) -> Tuple[int, float, int, float]:
+        previous_count = self.get(previous_key)
+        current_count = self.get(current_key)
+        previous_ttl = 0.0 if previous_count == 0 else (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._sliding_window_info(previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self.clear(previous_key)
+        self.clear(current_key)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Hand the last deltas to the other workers
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        from . import models
+        from .database import AsyncSessionLocal
+
+        pending, self._pending = self._pending, {}
+        touched, self._touched = self._touched, set()
+        cleared, self._cleared = self._cleared, set()
+        now = time.time()
+        rows = [
+            {"key": key, "count": delta, "expires_at": self._expiry[key]}
+            for key, delta in pending.items() if delta and key in self._expiry
+        ]
+        # Keys only read here may still have been counted by other workers
+        read_only = [key for key in touched if key not in pending]
+        table = models.RateLimitCounter.__table__
+        try:
+            async with AsyncSessionLocal() as db:
+                fresh: List[Tuple[str, int, float]] = []
+                if cleared:
+                    await db.execute(delete(table).where(table.c.key.in_(cleared)))
+                if rows:
+                    stmt = pg_insert(table).values(rows)
+                    expired = table.c.expires_at <= now
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[table.c.key],
+                        set_={
+                            "count": case((expired, stmt.excluded["count"]), else_=table.c["count"] + stmt.excluded["count"]),
+                            "expires_at": case((expired, stmt.excluded.expires_at), else_=table.c.expires_at),
+                        },
+                    ).returning(table.c.key, table.c["count"], table.c.expires_at)
+                    fresh.extend((await db.execute(stmt)).all())
+                if read_only:
+                    result = await db.execute(
+                        select(table.c.key, table.c["count"], table.c.expires_at)
+                        .where(table.c.key.in_(read_only), table.c.expires_at > now)
+                    )
+                    fresh.extend(result.all())
+                self._flushes += 1
+                if self._flushes % RATE_LIMIT_SWEEP_EVERY == 0:
+                    await db.execute(delete(table).where(table.c.expires_at <= now))
+                await db.commit()
+        except Exception:
+            # Keep the deltas for the next flush; decisions carry on from local counts meanwhile
+            for key, delta in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + delta
+            self._touched |= touched
+            self._cleared |= cleared
+            if self._healthy:
+                logger.exception("Rate limit counter flush failed")
+            self._healthy = False
+            return
+        self._healthy = True
+        for key, count, expires_at in fresh:
+            local_expiry = self._expiry.get(key)
+            if local_expiry is not None and local_expiry > expires_at + self.flush_interval:
+                # This worker already rolled the key into a newer window during the flush
+                continue
+            self._counts[key] = count + self._pending.get(key, 0)
+            self._expiry[key] = expires_at
+        for key in [key for key, expires_at in self._expiry.items() if expires_at <= now and key not in self._pending]:
+            self._counts.pop(key, None)
+            self._expiry.pop(key, None)
+
+def request_token_claims(request: Request) -> Optional[Dict[str, Any]]:
+    """Signed claims of the request's bearer token, decoded once per request; no database lookup."""
+    if hasattr(request.state, "rate_limit_claims"):
+        return request.state.rate_limit_claims
+    claims = None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        from .utils import SECRET_KEY, ALGORITHM
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            if payload.get("type") == "access" and "uid" in payload:
+                claims = payload
+        except JWTError:
+            pass
+    request.state.rate_limit_claims = claims
+    return claims
+
+def rate_limit_key(request: Request) -> str:
+    """
+    "<role>:<user id>" for callers with a valid access token, so users sharing
+    one address keep separate budgets; "anonymous:<address>" otherwise.
+    """
+    claims = request_token_claims(request)
+    if claims:
+        tier = claims.get("role") if claims.get("role") in RATE_LIMIT_TIER_MULTIPLIERS else "user"
+        return f"{tier}:{claims['uid']}"
+    return f"anonymous:{get_remote_address(request)}"
+
+@lru_cache(maxsize=256)
+def _scaled_limit(limit: str, tier: str) -> str:
+    multiplier = RATE_LIMIT_TIER_MULTIPLIERS.get(tier, 1)
+    scaled = []
+    for part in limit.split(";"):
+        amount, _, period = part.strip().partition("/")
+        scaled.append(f"{max(1, int(int(amount) * multiplier))}/{period}")
+    return ";".join(scaled)
+
+def tiered(limit: str) -> Callable[[str], str]:
+    """Limit provider that scales a base limit such as "10/minute" by the caller's tier."""
+    def provider(key: str) -> str:
+        return _scaled_limit(limit, key.split(":", 1)[0])
+    return provider
+
+# Shared by every router, so each limit holds for the whole deployment rather than per router and worker
+limiter = Limiter(
+    key_func=rate_limit_key,
+    strategy=RATE_LIMIT_STRATEGY,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+)
+
+async def start() -> None:
+    for storage in _batched_storages:
+        await storage.start()
+
+async def stop() -> None:
+    for storage in _batched_storages:
+        await storage.stop()
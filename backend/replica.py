@@ -0,0 +1,60 @@
+import os
+import time
+from typing import Dict, Optional
+from fastapi import Request
+from backend import cache
+from backend.database import AsyncSessionLocal, ReadSessionLocal, engine, read_engine
+from backend.ratelimit import request_token_claims
+
+# Route groups whose reads may be served by the replica
+DB_REPLICA_ROUTES = {
+    route.strip() for route in os.getenv("DB_REPLICA_ROUTES", "catalog,analytics,admin_lists").split(",") if route.strip()
+}
+# After a user's own write, their reads stay on the primary this long so replica lag never hides it
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", 5))
+
+def replica_enabled() -> bool:
+    return read_engine is not engine
+
+# user id -> monotonic deadline of their read-your-writes window, filled on every worker via the cache bus
+_recent_writers: Dict[int, float] = {}
+
+def _mark_recent_write(user_id: Optional[int]) -> None:
+    if user_id is None:
+        return
+    now = time.monotonic()
+    if len(_recent_writers) > 10000:
+        for expired in [uid for uid, deadline in _recent_writers.items() if deadline <= now]:
+            del _recent_writers[expired]
+    _recent_writers[user_id] = now + DB_READ_YOUR_WRITES_SECONDS
+
+cache.on_invalidate("recent_write", _mark_recent_write)
+
+async def mark_recent_write(user_id: int) -> None:
+    """Pin the user's reads to the primary on every worker for DB_READ_YOUR_WRITES_SECONDS."""
+    await cache.invalidate("recent_write", user_id)
+
+def _reads_from_replica(route: str, request: Request) -> bool:
+    if not replica_enabled() or route not in DB_REPLICA_ROUTES:
+        return False
+    claims = request_token_claims(request)
+    if claims:
+        deadline = _recent_writers.get(claims["uid"])
+        if deadline is not None and deadline > time.monotonic():
+            return False
+    return True
+
+def read_db(route: str):
+    """
+    Session dependency for read-only routes in the given route group. It uses
+    the replica when the group is listed in DB_REPLICA_ROUTES, unless the caller
+    wrote something within DB_READ_YOUR_WRITES_SECONDS.
+    """
+    async def get_read_db(request: Request):
+        session_factory = ReadSessionLocal if _reads_from_replica(route, request) else AsyncSessionLocal
+        async with session_factory() as db:
+            try:
+                yield db
+            finally:
+                await db.close()
+    return get_read_db
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from backend import schemas, crud, models, utils
-from backend.database import get_db
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from typing import List
+from backend import schemas, crud, models, utils, cache, hashing
+from backend.database import get_db, pool_stats, engine, read_engine
+from backend.replica import read_db
+from backend.ratelimit import limiter, tiered
+from backend.services import mpesa as mpesa_service, outbox, payments, reconciliation
+from typing import List, Optional, Tuple
+from datetime import date, datetime, timezone
 from sqlalchemy import select
 
 router = APIRouter(
@@ -12,25 +14,75 @@ router = APIRouter(
     tags=["admin"],
     dependencies=[Depends(utils.get_current_active_admin)]
 )
-limiter = Limiter(key_func=get_remote_address)
 
-@router.get("/users", response_model=List[schemas.User], summary="List all users")
-@limiter.limit("100/minute")
-async def read_users(request: Request, db: AsyncSession = Depends(get_db)):
-    """Get a list of all users (admin only)."""
-    return await crud.get_users(db)
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # created_at columns hold naive UTC; offset-aware query values are converted to match
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
 
-@router.get("/users/{user_id}", response_model=schemas.User, summary="Get user details")
-@limiter.limit("100/minute")
+def _created_range(
+    created_from: Optional[datetime], created_to: Optional[datetime]
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    created_from, created_to = _naive_utc(created_from), _naive_utc(created_to)
+    if created_from and created_to and created_from > created_to:
+        raise HTTPException(status_code=400, detail="created_from must not be after created_to")
+    return created_from, created_to
+
+def _set_page_headers(response: Response, next_cursor: Optional[str], estimate: Optional[int]) -> None:
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if estimate is not None:
+        response.headers["X-Total-Count-Estimate"] = str(estimate)
+
+@router.get("/users", response_model=List[schemas.User], summary="List users")
+@limiter.limit(tiered("100/minute"))
+async def read_users(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, gt=0, le=200, description="Number of users to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    sort: str = Query("created_at", pattern="^(id|created_at|username)$", description="Sort key"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Sort direction"),
+    role: Optional[models.UserRole] = Query(None, description="Only users with this role"),
+    is_active: Optional[bool] = Query(None, description="Filter on the active flag"),
+    created_from: Optional[datetime] = Query(None, description="Only users created at or after this time (UTC)"),
+    created_to: Optional[datetime] = Query(None, description="Only users created at or before this time (UTC)"),
+    include_total: bool = Query(False, description="Return a planner estimate of the matching rows in X-Total-Count-Estimate"),
+    db: AsyncSession = Depends(read_db("admin_lists"))
+):
+    """
+    Get a page of users (admin only).
+    When more users are available, the cursor for the next page is returned
+    in the X-Next-Cursor response header.
+    """
+    created_from, created_to = _created_range(created_from, created_to)
+    users, next_cursor, estimate = await crud.get_users_page(
+        db,
+        limit=limit,
+        cursor=cursor,
+        sort=sort,
+        order=order,
+        role=role,
+        is_active=is_active,
+        created_from=created_from,
+        created_to=created_to,
+        with_estimate=include_total,
+    )
+    _set_page_headers(response, next_cursor, estimate)
+    return users
+
+@router.get("/users/{user_id}", response_model=schemas.AdminUserDetail, summary="Get user details")
+@limiter.limit(tiered("100/minute"))
 async def read_user(request: Request, user_id: int, db: AsyncSession = Depends(get_db)):
-    """Get details of a specific user (admin only)."""
-    user = await crud.get_user(db, user_id)
+    """Get details of a specific user and their orders (admin only)."""
+    user = await crud.get_user(db, user_id, load="admin_detail")
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @router.post("/users", response_model=schemas.User, status_code=status.HTTP_201_CREATED, summary="Create user")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def create_user(request: Request, user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     """Create a new user (admin only)."""
     if await crud.get_user_by_username(db, user.username):
@@ -40,7 +92,7 @@ async def create_user(request: Request, user: schemas.UserCreate, db: AsyncSessi
     return await crud.create_user(db, user)
 
 @router.put("/users/{user_id}", response_model=schemas.User, summary="Update user")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def update_user(
     request: Request,
     user_id: int,
@@ -63,7 +115,7 @@ async def update_user(
     return updated_user
 
 @router.delete("/users/{user_id}", response_model=schemas.Msg, summary="Delete user")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def delete_user(request: Request, user_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a user (admin only)."""
     success = await crud.delete_user(db, user_id)
@@ -72,13 +124,13 @@ async def delete_user(request: Request, user_id: int, db: AsyncSession = Depends
     return {"detail": "User deleted"}
 
 @router.get("/categories", response_model=List[schemas.Category], summary="List all categories")
-@limiter.limit("100/minute")
+@limiter.limit(tiered("100/minute"))
 async def read_categories(request: Request, db: AsyncSession = Depends(get_db)):
     """Get a list of all categories (admin only)."""
     return await crud.get_categories(db)
 
 @router.get("/categories/{category_id}", response_model=schemas.Category, summary="Get category details")
-@limiter.limit("100/minute")
+@limiter.limit(tiered("100/minute"))
 async def read_category(request: Request, category_id: int, db: AsyncSession = Depends(get_db)):
     """Get details of a specific category, including its products (admin only)."""
     category = await crud.get_category(db, category_id)
@@ -87,7 +139,7 @@ async def read_category(request: Request, category_id: int, db: AsyncSession = D
     return category
 
 @router.post("/categories", response_model=schemas.CategorySimple, status_code=status.HTTP_201_CREATED, summary="Create category")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def create_category(request: Request, category: schemas.CategoryCreate, db: AsyncSession = Depends(get_db)):
     """Create a new category (admin only)."""
     try:
@@ -109,7 +161,7 @@ async def create_category(request: Request, category: schemas.CategoryCreate, db
         raise HTTPException(status_code=500, detail="Failed to create category")
 
 @router.put("/categories/{category_id}", response_model=schemas.Category, summary="Update category")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def update_category(
     request: Request,
     category_id: int,
@@ -129,7 +181,7 @@ async def update_category(
     return db_category
 
 @router.delete("/categories/{category_id}", response_model=schemas.Msg, summary="Delete category")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def delete_category(request: Request, category_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a category (admin only)."""
     success = await crud.delete_category(db, category_id)
@@ -138,13 +190,13 @@ async def delete_category(request: Request, category_id: int, db: AsyncSession =
     return {"detail": "Category deleted"}
 
 @router.get("/products", response_model=List[schemas.Product], summary="List all products")
-@limiter.limit("100/minute")
+@limiter.limit(tiered("100/minute"))
 async def read_products(request: Request, db: AsyncSession = Depends(get_db)):
     """Get a list of all products (admin only)."""
     return await crud.get_products(db)
 
 @router.get("/products/{product_id}", response_model=schemas.Product, summary="Get product details")
-@limiter.limit("100/minute")
+@limiter.limit(tiered("100/minute"))
 async def read_product(request: Request, product_id: int, db: AsyncSession = Depends(get_db)):
     """Get details of a specific product (admin only)."""
     product = await crud.get_product(db, product_id)
@@ -153,7 +205,7 @@ async def read_product(request: Request, product_id: int, db: AsyncSession = Dep
     return product
 
 @router.post("/products", response_model=schemas.Product, status_code=status.HTTP_201_CREATED, summary="Create product")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def create_product(request: Request, product: schemas.ProductCreate, db: AsyncSession = Depends(get_db)):
     """Create a new product (admin only)."""
     category = await crud.get_category(db, product.category_id)
@@ -162,7 +214,7 @@ async def create_product(request: Request, product: schemas.ProductCreate, db: A
     return await crud.create_product(db, product)
 
 @router.put("/products/{product_id}", response_model=schemas.Product, summary="Update product")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def update_product(
     request: Request,
     product_id: int,
@@ -179,7 +231,7 @@ async def update_product(
     return db_product
 
 @router.delete("/products/{product_id}", response_model=schemas.Msg, summary="Delete product")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def delete_product(request: Request, product_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a product (admin only)."""
     success = await crud.delete_product(db, product_id)
@@ -187,14 +239,45 @@ async def delete_product(request: Request, product_id: int, db: AsyncSession = D
         raise HTTPException(status_code=404, detail="Product not found")
     return {"detail": "Product deleted"}
 
-@router.get("/orders", response_model=List[schemas.Order], summary="List all orders")
-@limiter.limit("100/minute")
-async def read_orders(request: Request, db: AsyncSession = Depends(get_db)):
-    """Get a list of all orders (admin only)."""
-    return await crud.get_orders(db)
+@router.get("/orders", response_model=List[schemas.Order], summary="List orders")
+@limiter.limit(tiered("100/minute"))
+async def read_orders(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, gt=0, le=200, description="Number of orders to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    sort: str = Query("created_at", pattern="^(id|created_at)$", description="Sort key"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Sort direction"),
+    order_status: Optional[models.OrderStatus] = Query(None, alias="status", description="Only orders in this status"),
+    user_id: Optional[int] = Query(None, description="Only orders placed by this user"),
+    created_from: Optional[datetime] = Query(None, description="Only orders placed at or after this time (UTC)"),
+    created_to: Optional[datetime] = Query(None, description="Only orders placed at or before this time (UTC)"),
+    include_total: bool = Query(False, description="Return a planner estimate of the matching rows in X-Total-Count-Estimate"),
+    db: AsyncSession = Depends(read_db("admin_lists"))
+):
+    """
+    Get a page of orders (admin only).
+    When more orders are available, the cursor for the next page is returned
+    in the X-Next-Cursor response header.
+    """
+    created_from, created_to = _created_range(created_from, created_to)
+    orders, next_cursor, estimate = await crud.get_orders_page(
+        db,
+        limit=limit,
+        cursor=cursor,
+        sort=sort,
+        order=order,
+        status=order_status,
+        user_id=user_id,
+        created_from=created_from,
+        created_to=created_to,
+        with_estimate=include_total,
+    )
+    _set_page_headers(response, next_cursor, estimate)
+    return orders
 
 @router.get("/orders/{order_id}", response_model=schemas.Order, summary="Get order details")
-@limiter.limit("100/minute")
+@limiter.limit(tiered("100/minute"))
 async def read_order(request: Request, order_id: int, db: AsyncSession = Depends(get_db)):
     """Get details of a specific order (admin only)."""
     order = await crud.get_order(db, order_id)
@@ -203,7 +286,7 @@ async def read_order(request: Request, order_id: int, db: AsyncSession = Depends
     return order
 
 @router.put("/orders/{order_id}", response_model=schemas.Order, summary="Update order")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def update_order(
     request: Request,
     order_id: int,
@@ -217,7 +300,7 @@ async def update_order(
     return db_order
 
 @router.delete("/orders/{order_id}", response_model=schemas.Msg, summary="Delete order")
-@limiter.limit("10/minute")
+@limiter.limit(tiered("10/minute"))
 async def delete_order(request: Request, order_id: int, db: AsyncSession = Depends(get_db)):
     """Delete an order (admin only)."""
     success = await crud.delete_order(db, order_id)
@@ -226,7 +309,7 @@ async def delete_order(request: Request, order_id: int, db: AsyncSession = Depen
     return {"detail": "Order deleted"}
 
 @router.get("/orders/{order_id}/summary", response_model=schemas.OrderSummaryResponse, summary="Get order summary")
-@limiter.limit("100/minute")
+@limiter.limit(tiered("100/minute"))
 async def get_order_summary(request: Request, order_id: int, db: AsyncSession = Depends(get_db)):
     """Get detailed summary of a specific order (admin only)."""
     order_summary = await crud.get_order_summary(db, order_id)
@@ -234,16 +317,121 @@ async def get_order_summary(request: Request, order_id: int, db: AsyncSession =
         raise HTTPException(status_code=404, detail="Order not found")
     return order_summary
 
+@router.get("/checkouts", response_model=List[schemas.Checkout], summary="List checkouts")
+@limiter.limit(tiered("100/minute"))
+async def read_checkouts(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, gt=0, le=200, description="Number of checkouts to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    sort: str = Query("id", pattern="^id$", description="Sort key"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Sort direction"),
+    payment_status: Optional[str] = Query(None, description="Only checkouts with this payment status"),
+    order_id: Optional[int] = Query(None, description="Only the checkout of this order"),
+    include_total: bool = Query(False, description="Return a planner estimate of the matching rows in X-Total-Count-Estimate"),
+    db: AsyncSession = Depends(read_db("admin_lists"))
+):
+    """
+    Get a page of checkouts (admin only).
+    When more checkouts are available, the cursor for the next page is returned
+    in the X-Next-Cursor response header.
+    """
+    checkouts, next_cursor, estimate = await crud.get_checkouts_page(
+        db,
+        limit=limit,
+        cursor=cursor,
+        sort=sort,
+        order=order,
+        payment_status=payment_status,
+        order_id=order_id,
+        with_estimate=include_total,
+    )
+    _set_page_headers(response, next_cursor, estimate)
+    return checkouts
+
+@router.get("/payments", response_model=List[schemas.Payment], summary="List payments")
+@limiter.limit(tiered("100/minute"))
+async def read_payments(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, gt=0, le=200, description="Number of payments to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    sort: str = Query("id", pattern="^(id|created_at)$", description="Sort key"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Sort direction"),
+    payment_status: Optional[models.PaymentStatus] = Query(None, alias="status", description="Only payments in this status"),
+    checkout_id: Optional[int] = Query(None, description="Only payments for this checkout"),
+    created_from: Optional[datetime] = Query(None, description="Only payments created at or after this time (UTC)"),
+    created_to: Optional[datetime] = Query(None, description="Only payments created at or before this time (UTC)"),
+    include_total: bool = Query(False, description="Return a planner estimate of the matching rows in X-Total-Count-Estimate"),
+    db: AsyncSession = Depends(read_db("admin_lists"))
+):
+    """
+    Get a page of payments (admin only).
+    When more payments are available, the cursor for the next page is returned
+    in the X-Next-Cursor response header.
+    """
+    created_from, created_to = _created_range(created_from, created_to)
+    payments_page, next_cursor, estimate = await crud.get_payments_page(
+        db,
+        limit=limit,
+        cursor=cursor,
+        sort=sort,
+        order=order,
+        status=payment_status,
+        checkout_id=checkout_id,
+        created_from=created_from,
+        created_to=created_to,
+        with_estimate=include_total,
+    )
+    _set_page_headers(response, next_cursor, estimate)
+    return payments_page
+
 @router.get("/analytics", response_model=schemas.AnalyticsResponse, summary="Get store analytics")
-@limiter.limit("50/minute")
-async def get_analytics(request: Request, db: AsyncSession = Depends(get_db)):
-    """Get analytics data for the store (admin only)."""
-    analytics = await crud.get_analytics(db)
+@limiter.limit(tiered("50/minute"))
+async def get_analytics(
+    request: Request,
+    start_date: Optional[date] = Query(None, description="First day to include (UTC, inclusive)"),
+    end_date: Optional[date] = Query(None, description="Last day to include (UTC, inclusive)"),
+    db: AsyncSession = Depends(read_db("analytics"))
+):
+    """Get analytics data for the store, optionally for a date range (admin only)."""
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    analytics = await crud.get_analytics(db, start_date, end_date)
     return analytics
 
+@router.get("/cache/stats", response_model=schemas.CacheStatsResponse, summary="Get catalog cache statistics")
+@limiter.limit(tiered("50/minute"))
+async def get_cache_stats(request: Request):
+    """Get hit, miss and eviction counters for this worker's catalog cache (admin only)."""
+    return {**cache.catalog_cache.stats(), "invalidation_bus": cache.invalidation_bus.stats()}
+
+@router.get("/mpesa/metrics", response_model=schemas.MpesaMetricsResponse, summary="Get M-Pesa integration metrics")
+@limiter.limit(tiered("50/minute"))
+async def get_mpesa_metrics(request: Request):
+    """Get this worker's M-Pesa token cache, STK push dispatcher, callback and status poller counters (admin only)."""
+    return {
+        "access_token": mpesa_service.token_cache.stats(),
+        "dispatcher": outbox.dispatcher.stats(),
+        "callbacks": payments.callback_processor.stats(),
+        "status_poller": reconciliation.poller.stats(),
+    }
+
+@router.get("/password-hashing/stats", response_model=schemas.PasswordHashingStatsResponse, summary="Get password hashing pool statistics")
+@limiter.limit(tiered("50/minute"))
+async def get_password_hashing_stats(request: Request):
+    """Get queue depth and timing for this worker's password hashing pool (admin only)."""
+    return hashing.password_hasher.stats()
+
+@router.get("/db/pool", response_model=schemas.DatabasePoolStatsResponse, summary="Get database connection pool statistics")
+@limiter.limit(tiered("50/minute"))
+async def get_db_pool_stats(request: Request, target: str = Query("primary", pattern="^(primary|replica)$")):
+    """Get checkout, wait and overflow counters for this worker's primary or replica connection pool (admin only)."""
+    return pool_stats(read_engine if target == "replica" else engine)
+
 @router.get("/settings", response_model=schemas.SettingsResponse, summary="Get admin settings")
 async def get_settings(request: Request, db: AsyncSession = Depends(get_db)):
-    settings = await crud.get_settings(db)
+    settings = await crud.get_cached_settings(db)
     return settings
 
 @router.put("/settings", response_model=schemas.SettingsResponse, summary="Update admin settings")
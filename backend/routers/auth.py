@@ -1,21 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Form, Body
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 from jose import JWTError, jwt
-from datetime import timedelta
-from backend import schemas, crud, utils, models
+from datetime import datetime, timedelta
+from backend import schemas, crud, utils, models, cache
 from backend.database import get_db
+from backend.ratelimit import limiter
+from slowapi.util import get_remote_address
 import os
-import smtplib
-from email.mime.text import MIMEText
 
 router = APIRouter(prefix="/auth", tags=["auth"])
-limiter = Limiter(key_func=get_remote_address)
+# Credential endpoints stay keyed by client address, so holding a token never buys a fresh budget
 
 @router.post("/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED, summary="Register a new user")
-@limiter.limit("5/minute")
+@limiter.limit("5/minute", key_func=get_remote_address)
 async def register(
     request: Request,
     user: schemas.UserCreate,
@@ -30,7 +28,7 @@ async def register(
     return await crud.create_user(db, user)
 
 @router.post("/login", response_model=schemas.Token, summary="Login and get access/refresh tokens")
-@limiter.limit("10/minute")
+@limiter.limit("10/minute", key_func=get_remote_address)
 async def login(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
@@ -45,14 +43,14 @@ async def login(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(days=7 if remember_me else utils.ACCESS_TOKEN_EXPIRE_MINUTES / 60)
+    access_token_expires = utils.login_access_token_lifetime(remember_me)
     refresh_token_expires = timedelta(days=30 if remember_me else utils.REFRESH_TOKEN_EXPIRE_DAYS)
     access_token = utils.create_access_token(
-        data={"sub": user.username, "role": user.role.value},
+        data=utils.access_token_claims(user),
         expires_delta=access_token_expires
     )
     refresh_token = utils.create_refresh_token(
-        data={"sub": user.username, "role": user.role.value},
+        data={"sub": user.username, "role": user.role.value, "ver": user.token_version},
         expires_delta=refresh_token_expires
     )
     return {
@@ -63,7 +61,7 @@ async def login(
     }
 
 @router.post("/refresh", response_model=schemas.Token, summary="Refresh access token")
-@limiter.limit("10/minute")
+@limiter.limit("10/minute", key_func=get_remote_address)
 async def refresh_token(
     request: Request,
     refresh_token: str = Body(..., embed=True, description="Refresh token from login"),
@@ -84,16 +82,18 @@ async def refresh_token(
         if not username or not role:
             raise credentials_exception
         user = await crud.get_user_by_username(db, username)
-        if not user:
+        if not user or not user.is_active:
+            raise credentials_exception
+        if payload.get("ver", user.token_version) != user.token_version:
             raise credentials_exception
         access_token_expires = timedelta(minutes=utils.ACCESS_TOKEN_EXPIRE_MINUTES)
         refresh_token_expires = timedelta(days=utils.REFRESH_TOKEN_EXPIRE_DAYS)
         access_token = utils.create_access_token(
-            data={"sub": username, "role": role},
+            data=utils.access_token_claims(user),
             expires_delta=access_token_expires
         )
         new_refresh_token = utils.create_refresh_token(
-            data={"sub": username, "role": role},
+            data={"sub": user.username, "role": user.role.value, "ver": user.token_version},
             expires_delta=refresh_token_expires
         )
         return {
@@ -106,7 +106,7 @@ async def refresh_token(
         raise credentials_exception
 
 @router.post("/forgot-password", response_model=schemas.Msg, summary="Request password reset")
-@limiter.limit("5/hour")
+@limiter.limit("5/hour", key_func=get_remote_address)
 async def forgot_password(
     request: Request,
     email: str = Body(..., embed=True, description="User's email address"),
@@ -119,6 +119,9 @@ async def forgot_password(
     reset_token = utils.create_password_reset_token(email=user.email)
     reset_url = f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')}/reset-password?token={reset_token}"
     try:
+        # Password resets are rare, so the mail modules load on first use
+        import smtplib
+        from email.mime.text import MIMEText
         msg = MIMEText(f"Click to reset your password: {reset_url}")
         msg["Subject"] = "Password Reset Request"
         msg["From"] = os.getenv("EMAIL_USER", "noreply@pisafagiftshop.com")
@@ -132,7 +135,7 @@ async def forgot_password(
     return {"detail": "If an account with that email exists, a reset link has been sent"}
 
 @router.post("/reset-password", response_model=schemas.Msg, summary="Reset password")
-@limiter.limit("5/hour")
+@limiter.limit("5/hour", key_func=get_remote_address)
 async def reset_password(
     request: Request,
     token: str = Body(..., embed=True, description="Password reset token from email"),
@@ -143,8 +146,10 @@ async def reset_password(
     user = await utils.verify_password_reset_token(token, db)
     if not user:
         raise HTTPException(status_code=400, detail="Invalid or expired password reset token")
-    user.hashed_password = utils.get_password_hash(new_password)
+    user.hashed_password = await utils.get_password_hash(new_password)
     user.updated_at = datetime.utcnow()
+    user.token_version = (user.token_version or 0) + 1
     db.add(user)
     await db.commit()
+    await cache.invalidate("user", user.id)
     return {"detail": "Password reset successfully"}
\ No newline at end of file
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, HTTPException, Request, Body
+from backend.services import payments, mpesa as mpesa_service
+from typing import Any, Dict
+
+router = APIRouter(prefix="/mpesa", tags=["mpesa"])
+
+# MPESA_CALLBACK_URL should point at {API_URL}/mpesa/callback; the order id and its
+# signed token are appended per push
+@router.post("/callback/{order_id}/{token}", summary="Receive M-Pesa STK push callback")
+async def stk_callback(request: Request, order_id: int, token: str, payload: Dict[str, Any] = Body(...)):
+    """
+    Acknowledge a Safaricom STK callback immediately and queue it for batched settlement.
+    The token must be the one signed for this order. Settlement also checks the order
+    and amount against the payment row, so a forged body cannot settle another payment.
+    """
+    if not mpesa_service.valid_callback_token(order_id, token):
+        raise HTTPException(status_code=403, detail="Invalid callback token")
+    result = payments.parse_stk_callback(payload, order_id)
+    if result is not None:
+        payments.callback_processor.submit(result)
+    return {"ResultCode": 0, "ResultDesc": "Accepted"}
@@ -1,40 +1,99 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from backend import schemas, crud
-from backend.database import get_db
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from typing import List
+from backend.replica import read_db
+from backend.ratelimit import limiter
+from typing import List, Optional
 
 router = APIRouter(prefix="/shop", tags=["shop"])
-limiter = Limiter(key_func=get_remote_address)
 
-@router.get("/categories", response_model=List[schemas.Category], summary="List all categories")
+@router.get("/categories", response_model=List[schemas.CategorySummary], summary="List all categories")
 @limiter.limit("100/minute")
-async def read_categories(request: Request, db: AsyncSession = Depends(get_db)):
-    """Get a list of all product categories."""
-    return await crud.get_categories(db)
+async def read_categories(request: Request, db: AsyncSession = Depends(read_db("catalog"))):
+    """Get all product categories with their product and in-stock counts."""
+    return await crud.get_cached_categories(db)
 
-@router.get("/categories/{category_id}", response_model=schemas.Category, summary="Get category details")
+@router.get("/categories/{category_id}", response_model=schemas.CategorySummary, summary="Get category details")
 @limiter.limit("100/minute")
-async def read_category(request: Request, category_id: int, db: AsyncSession = Depends(get_db)):
-    """Get details of a specific category, including its products."""
-    category = await crud.get_category(db, category_id)
+async def read_category(request: Request, category_id: int, db: AsyncSession = Depends(read_db("catalog"))):
+    """Get details of a specific category with its product counts."""
+    category = await crud.get_cached_category(db, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return category
 
-@router.get("/products", response_model=List[schemas.Product], summary="List all products")
+@router.get("/categories/{category_id}/products", response_model=List[schemas.Product], summary="List a category's products")
 @limiter.limit("100/minute")
-async def read_products(request: Request, db: AsyncSession = Depends(get_db)):
-    """Get a list of all products."""
-    return await crud.get_products(db)
+async def read_category_products(
+    request: Request,
+    response: Response,
+    category_id: int,
+    limit: int = Query(50, gt=0, le=200, description="Number of products to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    sort: str = Query("updated_at", pattern="^(price|updated_at|name)$", description="Sort key"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Sort direction"),
+    db: AsyncSession = Depends(read_db("catalog"))
+):
+    """
+    Get a page of the products in a category.
+    When more products are available, the cursor for the next page is returned
+    in the X-Next-Cursor response header.
+    """
+    if not await crud.get_cached_category(db, category_id):
+        raise HTTPException(status_code=404, detail="Category not found")
+    products, next_cursor = await crud.get_products_page(
+        db, limit=limit, cursor=cursor, sort=sort, order=order, category_id=category_id
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return products
+
+@router.get("/products", response_model=List[schemas.Product], summary="List products")
+@limiter.limit("100/minute")
+async def read_products(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, gt=0, le=200, description="Number of products to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    sort: str = Query("updated_at", pattern="^(price|updated_at|name)$", description="Sort key"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Sort direction"),
+    category_id: Optional[int] = Query(None, description="Only products in this category"),
+    min_price: Optional[float] = Query(None, ge=0, description="Minimum price"),
+    max_price: Optional[float] = Query(None, ge=0, description="Maximum price"),
+    in_stock: Optional[bool] = Query(None, description="Only products with (true) or without (false) stock"),
+    is_featured: Optional[bool] = Query(None, description="Filter on the featured flag"),
+    is_bestseller: Optional[bool] = Query(None, description="Filter on the bestseller flag"),
+    search: Optional[str] = Query(None, min_length=1, max_length=100, description="Match against product name or description"),
+    db: AsyncSession = Depends(read_db("catalog"))
+):
+    """
+    Get a page of products, filtered and sorted server-side.
+    When more products are available, the cursor for the next page is returned
+    in the X-Next-Cursor response header.
+    """
+    products, next_cursor = await crud.get_products_page(
+        db,
+        limit=limit,
+        cursor=cursor,
+        sort=sort,
+        order=order,
+        category_id=category_id,
+        min_price=min_price,
+        max_price=max_price,
+        in_stock=in_stock,
+        is_featured=is_featured,
+        is_bestseller=is_bestseller,
+        search=search,
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return products
 
 @router.get("/products/{product_id}", response_model=schemas.Product, summary="Get product details")
 @limiter.limit("100/minute")
-async def read_product(request: Request, product_id: int, db: AsyncSession = Depends(get_db)):
+async def read_product(request: Request, product_id: int, db: AsyncSession = Depends(read_db("catalog"))):
     """Get details of a specific product."""
-    product = await crud.get_product(db, product_id)
+    product = await crud.get_cached_product(db, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
@@ -44,17 +103,17 @@ async def read_product(request: Request, product_id: int, db: AsyncSession = Dep
 async def get_bestsellers(
     request: Request,
     limit: int = Query(10, gt=0, le=100, description="Number of products to return"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(read_db("catalog"))
 ):
     """Get bestseller products based on order history."""
-    return await crud.get_bestseller_products(db, limit=limit)
+    return await crud.get_cached_bestseller_products(db, limit=limit)
 
 @router.get("/featured", response_model=List[schemas.Product], summary="Get featured products")
 @limiter.limit("100/minute")
 async def get_featured_products(
     request: Request,
     limit: int = Query(10, gt=0, le=100, description="Number of products to return"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(read_db("catalog"))
 ):
     """Get featured products, ordered by most recently updated."""
-    return await crud.get_featured_products(db, limit=limit)
\ No newline at end of file
+    return await crud.get_cached_featured_products(db, limit=limit)
\ No newline at end of file
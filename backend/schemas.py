@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, validator
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List, Union, Dict, Any
 from .models import UserRole, OrderStatus
 from pydantic import conint
@@ -42,6 +42,13 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class AuthenticatedUser(BaseModel):
+    """The caller as described by the signed claims of their access token."""
+    id: int
+    username: str
+    role: UserRole
+    is_active: bool = True
+
 # Token Schemas
 class Token(BaseModel):
     access_token: str
@@ -70,6 +77,14 @@ class CategoryUpdate(BaseModel):
 class Category(CategoryBase):
     id: int
     products: List["Product"] = Field(default_factory=list)
+class CategorySummary(CategoryBase):
+    """Category without its products, for navigation; products are paged separately."""
+    id: int
+    product_count: int
+    in_stock_count: int
+    class Config:
+        from_attributes = True
+
 class CategorySimple(CategoryBase):
     id: int
     class Config:
@@ -194,6 +209,10 @@ class Order(OrderBase):
 
     class Config:
         from_attributes = True
+
+class AdminUserDetail(User):
+    """A user as the admin detail view shows them, with their orders newest first."""
+    orders: List[Order]
         
 class OrderItemProduct(BaseModel):
     id: int
@@ -276,12 +295,65 @@ class AnalyticsResponse(BaseModel):
     total_revenue: float
     top_products: List[dict]
     category_performance: List[dict]
+    # Inclusive UTC day range the figures cover; None means unbounded
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
     currency: str = "KES"
 
     class Config:
         from_attributes = True
 
 
+class CacheStatsResponse(BaseModel):
+    size: int
+    maxsize: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+    invalidations: int
+    invalidation_bus: Dict[str, Any]
+
+
+class MpesaMetricsResponse(BaseModel):
+    access_token: Dict[str, Any]
+    dispatcher: Dict[str, Any]
+    callbacks: Dict[str, Any]
+    status_poller: Dict[str, Any]
+
+
+class PasswordHashingStatsResponse(BaseModel):
+    workers: int
+    max_queue: int
+    default_scheme: str
+    in_flight: int
+    queue_depth: int
+    peak_pending: int
+    completed: int
+    rejected: int
+    upgraded: int
+    avg_wait_ms: float
+    avg_run_ms: float
+
+
+class DatabasePoolStatsResponse(BaseModel):
+    pool_size: int
+    max_overflow: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    peak_overflow: int
+    checkouts: int
+    waits: int
+    timeouts: int
+    avg_wait_ms: float
+    max_wait_ms: float
+    connects: int
+    invalidations: int
+    pooler_mode: bool
+
+
 class SettingsSchema(BaseModel):
     data: Dict[str, Any]
 
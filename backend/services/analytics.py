@@ -0,0 +1,175 @@
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+from sqlalchemy import select, insert, update, func, literal, null, text, union_all, Date, cast
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend import models
+from backend.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_COMPACT_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_COMPACT_INTERVAL_SECONDS", 60))
+ANALYTICS_COMPACT_BATCH_SIZE = int(os.getenv("ANALYTICS_COMPACT_BATCH_SIZE", 5000))
+
+# Move one batch of deltas into the daily rollups in a single statement. SKIP LOCKED
+# lets every worker run the compactor without a lease: concurrent runs take disjoint
+# batches, and the upserts add onto whatever the other run already committed.
+COMPACT_DELTAS = text("""
+    WITH moved AS (
+        DELETE FROM sales_rollup_deltas
+        WHERE id IN (
+            SELECT id FROM sales_rollup_deltas ORDER BY id LIMIT :batch_size FOR UPDATE SKIP LOCKED
+        )
+        RETURNING day, product_id, orders, quantity, revenue
+    ), products AS (
+        INSERT INTO product_sales_daily (day, product_id, quantity, revenue)
+        SELECT day, product_id, SUM(quantity), SUM(revenue)
+        FROM moved WHERE product_id IS NOT NULL
+        GROUP BY day, product_id
+        ON CONFLICT (day, product_id) DO UPDATE SET
+            quantity = product_sales_daily.quantity + excluded.quantity,
+            revenue = product_sales_daily.revenue + excluded.revenue
+    ), totals AS (
+        INSERT INTO order_sales_daily (day, orders, revenue)
+        SELECT day, SUM(orders), SUM(revenue)
+        FROM moved WHERE product_id IS NULL
+        GROUP BY day
+        ON CONFLICT (day) DO UPDATE SET
+            orders = order_sales_daily.orders + excluded.orders,
+            revenue = order_sales_daily.revenue + excluded.revenue
+    )
+    SELECT COUNT(*) FROM moved
+""")
+
+def counts_as_sale(status: Optional[models.OrderStatus]) -> bool:
+    """Orders count towards the rollups from creation until they are cancelled."""
+    return status != models.OrderStatus.cancelled
+
+def staged_order_deltas(order: models.Order) -> List[models.SalesRollupDelta]:
+    """Rollup deltas for an order built in memory by crud.stage_order, flushed along with it."""
+    day = order.created_at.date()
+    lines: Dict[int, List[float]] = defaultdict(lambda: [0, 0.0])
+    for item in order.items:
+        lines[item.product_id][0] += item.quantity
+        lines[item.product_id][1] += item.quantity * item.price
+    deltas = [models.SalesRollupDelta(day=day, orders=1, quantity=0, revenue=order.total)]
+    deltas.extend(
+        models.SalesRollupDelta(day=day, product_id=product_id, orders=0, quantity=quantity, revenue=revenue)
+        for product_id, (quantity, revenue) in lines.items()
+    )
+    return deltas
+
+async def record_order_sales(db: AsyncSession, order_ids: List[int], sign: int) -> None:
+    """
+    Append deltas adding (sign=1) or removing (sign=-1) persisted orders from the
+    rollups, read from the orders' current rows in one INSERT ... SELECT. Runs in
+    the caller's transaction and does not commit.
+    """
+    if not order_ids:
+        return
+    day = cast(models.Order.created_at, Date)
+    order_rows = select(
+        day, null(), literal(sign), literal(0), sign * func.coalesce(models.Order.total, 0)
+    ).where(models.Order.id.in_(order_ids))
+    product_rows = (
+        select(
+            day,
+            models.OrderItem.product_id,
+            literal(0),
+            sign * func.sum(models.OrderItem.quantity),
+            sign * func.sum(models.OrderItem.quantity * models.OrderItem.price),
+        )
+        .join(models.OrderItem, models.OrderItem.order_id == models.Order.id)
+        .where(models.Order.id.in_(order_ids))
+        .group_by(day, models.OrderItem.product_id)
+    )
+    await db.execute(
+        insert(models.SalesRollupDelta).from_select(
+            ["day", "product_id", "orders", "quantity", "revenue"], union_all(order_rows, product_rows)
+        )
+    )
+
+async def adjust_units_sold(db: AsyncSession, order_ids: List[int], sign: int) -> None:
+    """
+    Add (sign=1) or take back (sign=-1) the orders' quantities on the products'
+    bestseller counters in one UPDATE ... FROM. Runs in the caller's transaction.
+    Checkout and payment-failure restocks fold this into their stock updates instead.
+    """
+    if not order_ids:
+        return
+    quantities = (
+        select(models.OrderItem.product_id, func.sum(models.OrderItem.quantity).label("quantity"))
+        .where(models.OrderItem.order_id.in_(order_ids))
+        .group_by(models.OrderItem.product_id)
+        .subquery()
+    )
+    await db.execute(
+        update(models.Product)
+        .where(models.Product.id == quantities.c.product_id)
+        .values(units_sold=models.Product.units_sold + sign * quantities.c.quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+class RollupCompactor:
+    """
+    Periodically folds the append-only sales_rollup_deltas into the daily
+    product and order rollups. Order transactions only ever insert deltas, so
+    checkouts never queue behind each other on a shared per-day counter row.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = ANALYTICS_COMPACT_BATCH_SIZE,
+        interval: float = ANALYTICS_COMPACT_INTERVAL_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.compacted = 0
+        self.runs = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                moved = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.errors += 1
+                logger.exception("Sales rollup compaction failed")
+                moved = 0
+            # Keep draining while there is a backlog, otherwise wait for the next cycle
+            if moved < self.batch_size:
+                await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """Compact one batch. Returns the number of deltas folded in."""
+        async with self.session_factory() as db:
+            moved = (await db.execute(COMPACT_DELTAS, {"batch_size": self.batch_size})).scalar() or 0
+            await db.commit()
+        self.runs += 1
+        self.compacted += moved
+        return moved
+
+    def stats(self) -> dict:
+        return {"compacted": self.compacted, "runs": self.runs, "errors": self.errors}
+
+compactor = RollupCompactor()
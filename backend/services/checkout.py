@@ -0,0 +1,54 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException
+from backend import crud, models, schemas, cache
+from backend.services import outbox
+
+async def checkout_cart(db: AsyncSession, user_id: int, checkout_data: schemas.CheckoutCreate) -> dict:
+    """
+    Turn the user's cart into an order in a single pass.
+    The order is computed from one priced cart snapshot. Stock reservation, the
+    order and its items, the checkout, the pending payment, its STK push intent
+    and the cart clear are all persisted in one transaction, and the summary is
+    built from the in-memory rows instead of being re-queried. The M-Pesa call
+    itself happens later in the outbox dispatcher.
+    """
+    cart = await crud.get_cart_with_totals(db, user_id)
+    if not cart["products"]:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+
+    order_items = [
+        schemas.OrderItemBase(
+            product_id=item["product_id"],
+            quantity=item["quantity"],
+            price=item["product"].price
+        ) for item in cart["products"]
+    ]
+    products = {
+        item["product_id"]: {
+            "id": item["product_id"],
+            "name": item["product"].name,
+            "image_url": item["product"].image_url
+        } for item in cart["products"]
+    }
+
+    order = await crud.stage_order(db, order_items, user_id)
+    payment = models.Payment(amount=order.total, status=models.PaymentStatus.pending)
+    payment.intent = models.PaymentIntent(
+        order=order,
+        phone_number=checkout_data.phone_number,
+        amount=order.total
+    )
+    checkout = models.Checkout(**checkout_data.dict(), order=order, payments=[payment])
+    db.add(checkout)
+    await crud.clear_cart(db, user_id, commit=False)
+    await db.commit()
+    await cache.invalidate_stock(list(products))
+    # The STK push is sent by the outbox dispatcher; nudge it so it goes out right away
+    outbox.dispatcher.wake()
+
+    return {
+        "message": "Order created successfully",
+        "order_id": order.id,
+        "checkout_id": checkout.id,
+        "order_summary": crud.build_order_summary(order, products)
+    }
@@ -1,42 +1,187 @@
 import os
-from dotenv import load_dotenv
+import time
+import asyncio
 import base64
-import httpx
+import hashlib
+import hmac
 from datetime import datetime
+from typing import TYPE_CHECKING, Optional
 from fastapi import HTTPException
 
-load_dotenv()
+if TYPE_CHECKING:
+    import httpx
 
 MPESA_CONSUMER_KEY = os.getenv("MPESA_CONSUMER_KEY")
 MPESA_CONSUMER_SECRET = os.getenv("MPESA_CONSUMER_SECRET")
 MPESA_PASS_KEY = os.getenv("MPESA_PASS_KEY")
 MPESA_SHORT_CODE = os.getenv("MPESA_SHORT_CODE")
 MPESA_CALLBACK_URL = os.getenv("MPESA_CALLBACK_URL")
+# Signs the per-order callback URL sent with each STK push, so results can only be
+# posted by whoever received that URL (Safaricom). With neither set, pushes fail
+# and every callback is rejected.
+MPESA_CALLBACK_SECRET = os.getenv("MPESA_CALLBACK_SECRET") or os.getenv("SECRET_KEY") or ""
+# Point at a local fake Daraja server in tests
+MPESA_BASE_URL = os.getenv("MPESA_BASE_URL", "https://sandbox.safaricom.co.ke").rstrip("/")
+MPESA_HTTP_TIMEOUT_SECONDS = float(os.getenv("MPESA_HTTP_TIMEOUT_SECONDS", 30))
+# Upper bound on one STK call, covering the token fetch and the retry after a 401.
+# The background workers enforce it and size their leases from it.
+MPESA_CALL_DEADLINE_SECONDS = float(os.getenv("MPESA_CALL_DEADLINE_SECONDS", 2 * MPESA_HTTP_TIMEOUT_SECONDS))
+MPESA_HTTP_MAX_CONNECTIONS = int(os.getenv("MPESA_HTTP_MAX_CONNECTIONS", 20))
+# Refresh the OAuth token this long before Daraja says it expires
+MPESA_TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("MPESA_TOKEN_REFRESH_MARGIN_SECONDS", 300))
 
-async def generate_access_token():
-    auth_str = f"{MPESA_CONSUMER_KEY}:{MPESA_CONSUMER_SECRET}"
-    encoded_auth = base64.b64encode(auth_str.encode()).decode()
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials",
-            headers={"Authorization": f"Basic {encoded_auth}"}
+_client: Optional["httpx.AsyncClient"] = None
+
+def get_client() -> "httpx.AsyncClient":
+    """Shared keep-alive client, so token and STK calls reuse pooled TLS connections."""
+    global _client
+    if _client is None or _client.is_closed:
+        # Imported on first use; most workers start long before the first payment
+        import httpx
+        _client = httpx.AsyncClient(
+            base_url=MPESA_BASE_URL,
+            timeout=MPESA_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=MPESA_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=MPESA_HTTP_MAX_CONNECTIONS,
+            ),
         )
+    return _client
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+class AccessTokenCache:
+    """
+    Caches the Daraja OAuth token for its advertised expires_in.
+    Within the refresh margin the cached token is still served while a single
+    background refresh runs; once expired, concurrent callers share one fetch.
+    """
+
+    def __init__(self, refresh_margin: float = MPESA_TOKEN_REFRESH_MARGIN_SECONDS):
+        self.refresh_margin = refresh_margin
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self.background_refreshes = 0
+        self.failures = 0
+
+    def _valid(self, margin: float = 0.0) -> bool:
+        return self._token is not None and time.monotonic() < self._expires_at - margin
+
+    async def get(self) -> str:
+        if self._valid(self.refresh_margin):
+            self.hits += 1
+            return self._token
+        if self._valid():
+            self.hits += 1
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._refresh_ahead())
+            return self._token
+        async with self._lock:
+            if self._valid():
+                # Another caller fetched it while we waited
+                self.coalesced += 1
+                return self._token
+            return await self._fetch()
+
+    async def _refresh_ahead(self) -> None:
+        async with self._lock:
+            if self._valid(self.refresh_margin):
+                return
+            self.background_refreshes += 1
+            try:
+                await self._fetch()
+            except Exception:
+                # The current token is still valid; the next caller retries
+                pass
+
+    async def _fetch(self) -> str:
+        self.fetches += 1
+        auth_str = f"{MPESA_CONSUMER_KEY}:{MPESA_CONSUMER_SECRET}"
+        encoded_auth = base64.b64encode(auth_str.encode()).decode()
+        import httpx
+        try:
+            response = await get_client().get(
+                "/oauth/v1/generate",
+                params={"grant_type": "client_credentials"},
+                headers={"Authorization": f"Basic {encoded_auth}"}
+            )
+        except httpx.HTTPError:
+            self.failures += 1
+            raise HTTPException(status_code=500, detail="Failed to generate M-Pesa access token")
         if response.status_code != 200:
+            self.failures += 1
             raise HTTPException(status_code=500, detail="Failed to generate M-Pesa access token")
-        return response.json().get("access_token")
+        body = response.json()
+        self._token = body.get("access_token")
+        self._expires_at = time.monotonic() + float(body.get("expires_in", 3599))
+        return self._token
+
+    def invalidate(self) -> None:
+        self._token = None
+        self._expires_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "fetches": self.fetches,
+            "coalesced": self.coalesced,
+            "background_refreshes": self.background_refreshes,
+            "failures": self.failures,
+            "expires_in_seconds": max(0, round(self._expires_at - time.monotonic())) if self._token else 0,
+        }
+
+token_cache = AccessTokenCache()
+
+async def generate_access_token():
+    return await token_cache.get()
 
 def generate_timestamp():
     return datetime.now().strftime("%Y%m%d%H%M%S")
 
+def callback_token(order_id: int) -> str:
+    if not MPESA_CALLBACK_SECRET:
+        # An empty key would make every callback URL forgeable
+        raise RuntimeError("Set MPESA_CALLBACK_SECRET or SECRET_KEY to sign M-Pesa callback URLs")
+    return hmac.new(MPESA_CALLBACK_SECRET.encode(), f"order:{order_id}".encode(), hashlib.sha256).hexdigest()
+
+def valid_callback_token(order_id: int, token: str) -> bool:
+    """Check a callback URL's token. Without a secret every callback is rejected."""
+    if not MPESA_CALLBACK_SECRET:
+        return False
+    return hmac.compare_digest(callback_token(order_id), token)
+
 def generate_password(timestamp: str):
     data_to_encode = f"{MPESA_SHORT_CODE}{MPESA_PASS_KEY}{timestamp}"
     return base64.b64encode(data_to_encode.encode()).decode()
 
+async def _post_with_token(path: str, payload: dict) -> "httpx.Response":
+    response = None
+    for _ in range(2):
+        access_token = await generate_access_token()
+        response = await get_client().post(
+            path,
+            json=payload,
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        if response.status_code != 401:
+            break
+        # Token revoked or expired early on Daraja's side; fetch a fresh one once
+        token_cache.invalidate()
+    return response
+
 async def initiate_stk_push(phone: str, amount: float, order_id: int):
-    access_token = await generate_access_token()
     timestamp = generate_timestamp()
     password = generate_password(timestamp)
-    
+
     payload = {
         "BusinessShortCode": MPESA_SHORT_CODE,
         "Password": password,
@@ -46,17 +191,43 @@ async def initiate_stk_push(phone: str, amount: float, order_id: int):
         "PartyA": phone,  # Customer phone number
         "PartyB": MPESA_SHORT_CODE,
         "PhoneNumber": phone,
-        "CallBackURL": f"{MPESA_CALLBACK_URL}/{order_id}",
+        "CallBackURL": f"{MPESA_CALLBACK_URL}/{order_id}/{callback_token(order_id)}",
         "AccountReference": f"Order_{order_id}",
         "TransactionDesc": "Jewelry Shop Payment"
     }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest",
-            json=payload,
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail="Failed to initiate M-Pesa STK Push")
-        return response.json()
\ No newline at end of file
+
+    response = await _post_with_token("/mpesa/stkpush/v1/processrequest", payload)
+    if response.status_code != 200:
+        raise HTTPException(status_code=500, detail="Failed to initiate M-Pesa STK Push")
+    return response.json()
+
+# Daraja answers an STK query for a transaction it has not finished with this error code
+STK_QUERY_IN_PROGRESS = "500.001.1001"
+# ... and one for a CheckoutRequestID it has no record of
+STK_QUERY_UNKNOWN_REQUEST = "400.002.02"
+
+async def query_stk_status(checkout_request_id: str) -> Optional[dict]:
+    """
+    Query the outcome of an STK push. Returns None while Daraja is still processing
+    it, and Daraja's error body (with no ResultCode) when it has no record of the
+    request. Any other failure raises.
+    """
+    timestamp = generate_timestamp()
+    payload = {
+        "BusinessShortCode": MPESA_SHORT_CODE,
+        "Password": generate_password(timestamp),
+        "Timestamp": timestamp,
+        "CheckoutRequestID": checkout_request_id
+    }
+    response = await _post_with_token("/mpesa/stkpushquery/v1/query", payload)
+    if response.status_code == 200:
+        return response.json()
+    try:
+        error_code = response.json().get("errorCode")
+    except ValueError:
+        error_code = None
+    if error_code == STK_QUERY_IN_PROGRESS:
+        return None
+    if error_code == STK_QUERY_UNKNOWN_REQUEST:
+        return response.json()
+    raise HTTPException(status_code=500, detail="Failed to query M-Pesa STK Push status")
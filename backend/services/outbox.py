@@ -0,0 +1,209 @@
+import os
+import math
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import select, update, or_
+from backend import models
+from backend.database import AsyncSessionLocal
+from backend.services import mpesa as mpesa_service
+from backend.services import payments
+
+logger = logging.getLogger(__name__)
+
+MPESA_DISPATCH_BATCH_SIZE = int(os.getenv("MPESA_DISPATCH_BATCH_SIZE", 20))
+MPESA_DISPATCH_CONCURRENCY = int(os.getenv("MPESA_DISPATCH_CONCURRENCY", 5))
+MPESA_DISPATCH_MAX_ATTEMPTS = int(os.getenv("MPESA_DISPATCH_MAX_ATTEMPTS", 5))
+MPESA_DISPATCH_POLL_SECONDS = float(os.getenv("MPESA_DISPATCH_POLL_SECONDS", 2))
+# A claimed intent whose worker died mid-push becomes due again after this lease.
+# Unset, it is sized to outlast a full batch: one call deadline per wave of pushes.
+MPESA_DISPATCH_LEASE_SECONDS = float(os.getenv("MPESA_DISPATCH_LEASE_SECONDS", 0)) or None
+MPESA_DISPATCH_LEASE_MARGIN_SECONDS = float(os.getenv("MPESA_DISPATCH_LEASE_MARGIN_SECONDS", 30))
+MPESA_DISPATCH_BACKOFF_BASE_SECONDS = float(os.getenv("MPESA_DISPATCH_BACKOFF_BASE_SECONDS", 2))
+MPESA_DISPATCH_BACKOFF_MAX_SECONDS = float(os.getenv("MPESA_DISPATCH_BACKOFF_MAX_SECONDS", 120))
+
+class StkPushDispatcher:
+    """
+    Background sender for the payment_intents outbox.
+    Due intents are claimed in batches with FOR UPDATE SKIP LOCKED, so several
+    workers can run a dispatcher side by side. Pushes run concurrently under a
+    semaphore, and failures are retried with exponential backoff and jitter
+    until MPESA_DISPATCH_MAX_ATTEMPTS, after which the payment is settled as
+    failed. The attempts count written at claim time fences the lease: outcomes
+    are only recorded while the intent still carries it.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = MPESA_DISPATCH_BATCH_SIZE,
+        concurrency: int = MPESA_DISPATCH_CONCURRENCY,
+        max_attempts: int = MPESA_DISPATCH_MAX_ATTEMPTS,
+        poll_interval: float = MPESA_DISPATCH_POLL_SECONDS,
+        lease_seconds: Optional[float] = MPESA_DISPATCH_LEASE_SECONDS,
+        push_deadline: float = mpesa_service.MPESA_CALL_DEADLINE_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.push_deadline = push_deadline
+        self.lease_seconds = lease_seconds or (
+            push_deadline * math.ceil(batch_size / concurrency) + MPESA_DISPATCH_LEASE_MARGIN_SECONDS
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.dispatched = 0
+        self.retried = 0
+        self.failed = 0
+        self.lost = 0
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        """Dispatch right away instead of waiting for the next poll, e.g. after a checkout commits."""
+        self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                claimed = await self.dispatch_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("STK push dispatch cycle failed")
+                claimed = 0
+            if claimed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def dispatch_once(self) -> int:
+        """Claim one batch of due intents, push them and record the outcomes. Returns the batch size."""
+        intents = await self._claim()
+        if not intents:
+            return 0
+        results = await asyncio.gather(*(self._push(intent) for intent in intents))
+        await self._record(list(zip(intents, results)))
+        return len(intents)
+
+    async def _claim(self) -> List[models.PaymentIntent]:
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(models.PaymentIntent)
+                .where(
+                    or_(
+                        models.PaymentIntent.status == models.PaymentIntentStatus.pending,
+                        models.PaymentIntent.status == models.PaymentIntentStatus.dispatching,
+                    ),
+                    models.PaymentIntent.next_attempt_at <= now,
+                )
+                .order_by(models.PaymentIntent.next_attempt_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            intents = result.scalars().all()
+            lease_until = now + timedelta(seconds=self.lease_seconds)
+            for intent in intents:
+                intent.status = models.PaymentIntentStatus.dispatching
+                intent.attempts += 1
+                intent.next_attempt_at = lease_until
+            await db.commit()
+            return intents
+
+    async def _push(self, intent: models.PaymentIntent) -> Tuple[Optional[str], Optional[str]]:
+        """Returns (CheckoutRequestID, error)."""
+        async with self._semaphore:
+            try:
+                response = await asyncio.wait_for(
+                    mpesa_service.initiate_stk_push(intent.phone_number, intent.amount, intent.order_id),
+                    timeout=self.push_deadline,
+                )
+            except Exception as exc:
+                return None, str(getattr(exc, "detail", None) or exc) or type(exc).__name__
+        checkout_request_id = response.get("CheckoutRequestID")
+        if not checkout_request_id:
+            return None, response.get("errorMessage") or "STK push response had no CheckoutRequestID"
+        return checkout_request_id, None
+
+    def _backoff(self, attempts: int) -> timedelta:
+        delay = min(MPESA_DISPATCH_BACKOFF_MAX_SECONDS, MPESA_DISPATCH_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+    async def _record(self, outcomes: List[Tuple[models.PaymentIntent, Tuple[Optional[str], Optional[str]]]]) -> None:
+        now = datetime.utcnow()
+        given_up: List[payments.PaymentResult] = []
+        async with self.session_factory() as db:
+            for intent, (checkout_request_id, error) in outcomes:
+                if checkout_request_id:
+                    values = dict(status=models.PaymentIntentStatus.dispatched, checkout_request_id=checkout_request_id, last_error=None)
+                elif intent.attempts >= self.max_attempts:
+                    values = dict(status=models.PaymentIntentStatus.failed, last_error=error)
+                else:
+                    values = dict(
+                        status=models.PaymentIntentStatus.pending,
+                        next_attempt_at=now + self._backoff(intent.attempts),
+                        last_error=error,
+                    )
+                owned = await db.execute(
+                    update(models.PaymentIntent)
+                    .where(
+                        models.PaymentIntent.id == intent.id,
+                        models.PaymentIntent.status == models.PaymentIntentStatus.dispatching,
+                        models.PaymentIntent.attempts == intent.attempts,
+                    )
+                    .values(**values)
+                    .returning(models.PaymentIntent.id)
+                )
+                if owned.scalar() is None:
+                    # The lease ran out and another worker has claimed the intent since
+                    self.lost += 1
+                    logger.warning("Lost the dispatch lease on order %s; leaving it to the new owner", intent.order_id)
+                    continue
+                if checkout_request_id:
+                    self.dispatched += 1
+                    payment_result = await db.execute(
+                        update(models.Payment)
+                        .where(models.Payment.id == intent.payment_id)
+                        .values(transaction_id=checkout_request_id)
+                        .returning(models.Payment.checkout_id)
+                    )
+                    await db.execute(
+                        update(models.Checkout)
+                        .where(models.Checkout.id == payment_result.scalar())
+                        .values(mpesa_transaction_id=checkout_request_id)
+                    )
+                elif intent.attempts >= self.max_attempts:
+                    self.failed += 1
+                    logger.warning("Giving up on STK push for order %s: %s", intent.order_id, error)
+                    given_up.append(payments.PaymentResult(None, False, error, payment_id=intent.payment_id))
+                else:
+                    self.retried += 1
+            if given_up:
+                # Cancels the orders, returns their stock and commits with the intent updates
+                await payments.settle_payments(db, given_up)
+            else:
+                await db.commit()
+
+    def stats(self) -> dict:
+        return {"dispatched": self.dispatched, "retried": self.retried, "failed": self.failed, "lost": self.lost}
+
+dispatcher = StkPushDispatcher()
@@ -0,0 +1,302 @@
+import os
+import asyncio
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+from sqlalchemy import select, update, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend import models, cache
+from backend.database import AsyncSessionLocal
+from backend.services import analytics
+
+logger = logging.getLogger(__name__)
+
+MPESA_CALLBACK_BATCH_SIZE = int(os.getenv("MPESA_CALLBACK_BATCH_SIZE", 100))
+MPESA_CALLBACK_FLUSH_SECONDS = float(os.getenv("MPESA_CALLBACK_FLUSH_SECONDS", 0.2))
+MPESA_CALLBACK_QUEUE_SIZE = int(os.getenv("MPESA_CALLBACK_QUEUE_SIZE", 10000))
+# Callbacks can beat the dispatcher recording their CheckoutRequestID; retry those a few times
+MPESA_CALLBACK_MAX_RETRIES = int(os.getenv("MPESA_CALLBACK_MAX_RETRIES", 5))
+MPESA_CALLBACK_RETRY_SECONDS = float(os.getenv("MPESA_CALLBACK_RETRY_SECONDS", 5))
+
+class PaymentResult(NamedTuple):
+    # None only for payments whose STK push never went out; those name payment_id instead
+    transaction_id: Optional[str]
+    succeeded: bool
+    description: Optional[str] = None
+    attempts: int = 0
+    # Claimed by a callback and checked against the payment row; None for STK Query answers
+    order_id: Optional[int] = None
+    amount: Optional[float] = None
+    payment_id: Optional[int] = None
+
+def parse_stk_callback(payload: Dict[str, Any], order_id: Optional[int] = None) -> Optional[PaymentResult]:
+    """Extract the outcome from a Daraja STK callback body, or None if it is malformed."""
+    try:
+        callback = payload["Body"]["stkCallback"]
+        transaction_id = callback["CheckoutRequestID"]
+        result_code = int(callback["ResultCode"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    amount = None
+    items = (callback.get("CallbackMetadata") or {}).get("Item") or []
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get("Name") == "Amount":
+            try:
+                amount = float(item.get("Value"))
+            except (TypeError, ValueError):
+                amount = None
+    return PaymentResult(transaction_id, result_code == 0, callback.get("ResultDesc"), order_id=order_id, amount=amount)
+
+def _matches_payment(result: PaymentResult, order_id: int, amount: Optional[float]) -> bool:
+    if result.order_id is not None and result.order_id != order_id:
+        return False
+    if result.succeeded and result.order_id is not None:
+        # The push asks for int(amount), so that is what a genuine callback reports
+        return result.amount is not None and amount is not None and int(result.amount) == int(amount)
+    return True
+
+async def _reject_mismatched(db: AsyncSession, results: List[PaymentResult]) -> List[PaymentResult]:
+    """
+    Drop callback results whose order or amount does not match the pending payment
+    they name. Those payments stay pending for the STK status poller to confirm.
+    """
+    claimed = [r for r in results if r.order_id is not None and r.transaction_id is not None]
+    if not claimed:
+        return results
+    rows = await db.execute(
+        select(models.Payment.transaction_id, models.Payment.amount, models.Checkout.order_id)
+        .join(models.Checkout, models.Checkout.id == models.Payment.checkout_id)
+        .where(
+            models.Payment.transaction_id.in_([r.transaction_id for r in claimed]),
+            models.Payment.status == models.PaymentStatus.pending,
+        )
+    )
+    payments_by_id = {row.transaction_id: row for row in rows.all()}
+    accepted = []
+    for result in results:
+        row = payments_by_id.get(result.transaction_id)
+        if result.order_id is not None and row is not None and not _matches_payment(result, row.order_id, row.amount):
+            logger.warning(
+                "Rejected M-Pesa callback for %s: order %s amount %s does not match the payment",
+                result.transaction_id, result.order_id, result.amount,
+            )
+            continue
+        accepted.append(result)
+    return accepted
+
+async def settle_payments(db: AsyncSession, results: List[PaymentResult]) -> Set[str]:
+    """
+    Apply payment outcomes in batched, idempotent updates and commit.
+    Only payments still pending move, so replays match no rows. Callback results
+    whose order or amount does not match their payment are ignored. A completed
+    payment moves its checkout to completed and its pending order to processing;
+    a failed one moves its checkout to failed, cancels the pending order,
+    returns the order's stock and takes it out of the sales rollups. Returns
+    the transaction ids that were settled now. Results naming a payment_id
+    instead of a transaction id are matched on the payment row's id.
+    """
+    settled: Set[str] = set()
+    restocked: List[int] = []
+    results = await _reject_mismatched(db, results)
+    for succeeded in (True, False):
+        transaction_ids = [r.transaction_id for r in results if r.succeeded == succeeded and r.transaction_id]
+        payment_ids = [r.payment_id for r in results if r.succeeded == succeeded and not r.transaction_id]
+        if not transaction_ids and not payment_ids:
+            continue
+        payment_status = models.PaymentStatus.completed if succeeded else models.PaymentStatus.failed
+        payment_result = await db.execute(
+            update(models.Payment)
+            .where(
+                or_(models.Payment.transaction_id.in_(transaction_ids), models.Payment.id.in_(payment_ids)),
+                models.Payment.status == models.PaymentStatus.pending,
+            )
+            .values(status=payment_status)
+            .returning(models.Payment.transaction_id, models.Payment.checkout_id)
+        )
+        rows = payment_result.all()
+        if not rows:
+            continue
+        settled.update(row.transaction_id for row in rows if row.transaction_id)
+
+        checkout_result = await db.execute(
+            update(models.Checkout)
+            .where(models.Checkout.id.in_([row.checkout_id for row in rows]))
+            .values(payment_status=payment_status.value)
+            .returning(models.Checkout.order_id)
+        )
+        order_ids = checkout_result.scalars().all()
+        order_result = await db.execute(
+            update(models.Order)
+            .where(models.Order.id.in_(order_ids), models.Order.status == models.OrderStatus.pending)
+            .values(status=models.OrderStatus.processing if succeeded else models.OrderStatus.cancelled)
+            .returning(models.Order.id)
+        )
+        moved_orders = order_result.scalars().all()
+        if not succeeded and moved_orders:
+            restocked.extend(await _restock_orders(db, moved_orders))
+            await analytics.record_order_sales(db, moved_orders, -1)
+    await db.commit()
+    if restocked:
+        await cache.invalidate_stock(restocked)
+    return settled
+
+async def _restock_orders(db: AsyncSession, order_ids: List[int]) -> List[int]:
+    """
+    Return the stock reserved by cancelled orders, and take their quantities back
+    off the bestseller counters, in one UPDATE ... FROM statement.
+    """
+    quantities = (
+        select(models.OrderItem.product_id, func.sum(models.OrderItem.quantity).label("quantity"))
+        .where(models.OrderItem.order_id.in_(order_ids))
+        .group_by(models.OrderItem.product_id)
+        .subquery()
+    )
+    result = await db.execute(
+        update(models.Product)
+        .where(models.Product.id == quantities.c.product_id)
+        .values(
+            stock=models.Product.stock + quantities.c.quantity,
+            units_sold=models.Product.units_sold - quantities.c.quantity
+        )
+        .returning(models.Product.id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalars().all()
+
+class CallbackProcessor:
+    """
+    Queue between the M-Pesa callback endpoint and the database.
+    The endpoint only enqueues; a background worker drains the queue in batches
+    and settles them with settle_payments. Transaction ids already settled by
+    this worker are remembered, so duplicate callbacks never reach the database.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = MPESA_CALLBACK_BATCH_SIZE,
+        flush_interval: float = MPESA_CALLBACK_FLUSH_SECONDS,
+        queue_size: int = MPESA_CALLBACK_QUEUE_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: "asyncio.Queue[PaymentResult]" = asyncio.Queue(maxsize=queue_size)
+        self._settled = cache.TTLCache(maxsize=50000, ttl=24 * 3600)
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.settled = 0
+        self.rejected = 0
+        self.batches = 0
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def submit(self, result: PaymentResult) -> bool:
+        """Queue a payment outcome without waiting. Returns False if it was dropped."""
+        self.received += 1
+        if self._settled.get(("settled", result.transaction_id)):
+            self.duplicates += 1
+            return True
+        try:
+            self.queue.put_nowait(result)
+        except asyncio.QueueFull:
+            # The STK status poller settles anything lost here
+            self.dropped += 1
+            logger.warning("M-Pesa callback queue full; dropped %s", result.transaction_id)
+            return False
+        return True
+
+    async def _next_batch(self) -> List[PaymentResult]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self.apply(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to apply %d M-Pesa callbacks", len(batch))
+                self._retry_later(batch)
+
+    async def apply(self, batch: List[PaymentResult]) -> None:
+        # First outcome per transaction wins; anything already settled is skipped
+        unique: Dict[str, PaymentResult] = {}
+        for result in batch:
+            if self._settled.get(("settled", result.transaction_id)):
+                self.duplicates += 1
+            elif result.transaction_id not in unique:
+                unique[result.transaction_id] = result
+        if not unique:
+            return
+        self.batches += 1
+        async with self.session_factory() as db:
+            settled = await settle_payments(db, list(unique.values()))
+            unmatched = [tid for tid in unique if tid not in settled]
+            statuses = {}
+            if unmatched:
+                known_result = await db.execute(
+                    select(models.Payment.transaction_id, models.Payment.status)
+                    .where(models.Payment.transaction_id.in_(unmatched))
+                )
+                statuses = dict(known_result.all())
+        self.settled += len(settled)
+        # Payments that exist but are no longer pending were settled earlier
+        known = {tid for tid, status in statuses.items() if status != models.PaymentStatus.pending}
+        for transaction_id in settled | known:
+            self._settled.set(("settled", transaction_id), True)
+        # Still pending after settlement: the callback did not match its payment, so a
+        # forged result is dropped without blocking the genuine callback or the poller
+        self.rejected += sum(1 for status in statuses.values() if status == models.PaymentStatus.pending)
+        self._retry_later([unique[tid] for tid in unmatched if tid not in statuses])
+
+    def _retry_later(self, results: List[PaymentResult]) -> None:
+        loop = asyncio.get_running_loop()
+        for result in results:
+            if result.attempts >= MPESA_CALLBACK_MAX_RETRIES:
+                logger.warning("No pending payment for M-Pesa transaction %s; giving up", result.transaction_id)
+                continue
+            loop.call_later(MPESA_CALLBACK_RETRY_SECONDS, self._requeue, result._replace(attempts=result.attempts + 1))
+
+    def _requeue(self, result: PaymentResult) -> None:
+        try:
+            self.queue.put_nowait(result)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "settled": self.settled,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "queued": self.queue.qsize(),
+        }
+
+callback_processor = CallbackProcessor()
@@ -0,0 +1,227 @@
+import os
+import math
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import select, update, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from backend import models
+from backend.database import AsyncSessionLocal
+from backend.services import mpesa as mpesa_service
+from backend.services.payments import PaymentResult, settle_payments
+
+logger = logging.getLogger(__name__)
+
+STK_POLL_INTERVAL_SECONDS = float(os.getenv("STK_POLL_INTERVAL_SECONDS", 60))
+STK_POLL_BATCH_SIZE = int(os.getenv("STK_POLL_BATCH_SIZE", 50))
+STK_POLL_CONCURRENCY = int(os.getenv("STK_POLL_CONCURRENCY", 5))
+STK_POLL_RATE_PER_SECOND = float(os.getenv("STK_POLL_RATE_PER_SECOND", 5))
+# Only poll payments whose callback is overdue, and stop trying after a day
+STK_POLL_STALE_AFTER_SECONDS = float(os.getenv("STK_POLL_STALE_AFTER_SECONDS", 120))
+STK_POLL_GIVE_UP_AFTER_SECONDS = float(os.getenv("STK_POLL_GIVE_UP_AFTER_SECONDS", 24 * 3600))
+# Slack on top of the worst-case batch time when sizing the poller lease
+STK_POLL_LEASE_MARGIN_SECONDS = float(os.getenv("STK_POLL_LEASE_MARGIN_SECONDS", 30))
+
+class RateBudget:
+    """Spaces calls at most per_second apart across all concurrent callers."""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+class StkStatusPoller:
+    """
+    Settles pending payments whose callback never arrived by polling the
+    Daraja STK Query API. Each cycle takes the next batch of stale pending
+    payments after the stored checkpoint, queries them concurrently under a
+    semaphore and a rate budget, and settles the answers with settle_payments.
+    The checkpoint row also carries a lease, so only one worker polls at a time
+    and a restart resumes where the last batch ended. The lease is sized to
+    outlast the slowest possible batch, and only its holder may advance the
+    checkpoint.
+    """
+
+    name = "stk_status_poller"
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = STK_POLL_BATCH_SIZE,
+        concurrency: int = STK_POLL_CONCURRENCY,
+        rate_per_second: float = STK_POLL_RATE_PER_SECOND,
+        interval: float = STK_POLL_INTERVAL_SECONDS,
+        query_deadline: float = mpesa_service.MPESA_CALL_DEADLINE_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval
+        self.query_deadline = query_deadline
+        # Rate budget waits plus one deadline per wave of queries, plus the settle
+        self.lease_seconds = (
+            batch_size / rate_per_second
+            + query_deadline * math.ceil(batch_size / concurrency)
+            + STK_POLL_LEASE_MARGIN_SECONDS
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._budget = RateBudget(rate_per_second)
+        self._task: Optional[asyncio.Task] = None
+        self.queried = 0
+        self.settled = 0
+        self.errors = 0
+        self.gave_up = 0
+        # Past the give-up deadline but the query failed, so left pending for the next pass or review
+        self.overdue_errors = 0
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                polled = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("STK status poll failed")
+                polled = 0
+            # Keep draining while there is a backlog, otherwise wait for the next cycle
+            if polled < self.batch_size:
+                await asyncio.sleep(self.interval)
+
+    async def _lease(self) -> Optional[Tuple[int, datetime]]:
+        """
+        Take the poller lease and return the checkpoint with the lease expiry, which
+        identifies this holder, or None if another worker holds it.
+        """
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        async with self.session_factory() as db:
+            await db.execute(
+                pg_insert(models.WorkerCheckpoint)
+                .values(name=self.name, position=0)
+                .on_conflict_do_nothing(index_elements=[models.WorkerCheckpoint.name])
+            )
+            result = await db.execute(
+                update(models.WorkerCheckpoint)
+                .where(
+                    models.WorkerCheckpoint.name == self.name,
+                    or_(models.WorkerCheckpoint.leased_until.is_(None), models.WorkerCheckpoint.leased_until < now),
+                )
+                .values(leased_until=lease_until)
+                .returning(models.WorkerCheckpoint.position)
+            )
+            position = result.scalar()
+            await db.commit()
+            return None if position is None else (position, lease_until)
+
+    async def _release(self, position: int, lease_until: datetime) -> None:
+        async with self.session_factory() as db:
+            released = await db.execute(
+                update(models.WorkerCheckpoint)
+                .where(
+                    models.WorkerCheckpoint.name == self.name,
+                    models.WorkerCheckpoint.leased_until == lease_until,
+                )
+                .values(position=position, leased_until=None)
+                .returning(models.WorkerCheckpoint.name)
+            )
+            if released.scalar() is None:
+                logger.warning("STK poller lease expired before the batch finished; checkpoint not advanced")
+            await db.commit()
+
+    async def run_once(self) -> int:
+        """Poll one batch. Returns the number of payments examined."""
+        lease = await self._lease()
+        if lease is None:
+            return 0
+        position, lease_until = lease
+        now = datetime.utcnow()
+        try:
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(models.Payment.id, models.Payment.transaction_id, models.Payment.created_at)
+                    .where(
+                        models.Payment.status == models.PaymentStatus.pending,
+                        models.Payment.id > position,
+                        models.Payment.transaction_id.is_not(None),
+                        models.Payment.created_at <= now - timedelta(seconds=STK_POLL_STALE_AFTER_SECONDS),
+                    )
+                    .order_by(models.Payment.id)
+                    .limit(self.batch_size)
+                )
+                rows = result.all()
+            if not rows:
+                # End of the table: the next cycle starts a fresh pass over what is still pending
+                position = 0
+                return 0
+
+            give_up_before = now - timedelta(seconds=STK_POLL_GIVE_UP_AFTER_SECONDS)
+            outcomes = await asyncio.gather(*(
+                self._query(row.transaction_id, expired=row.created_at < give_up_before) for row in rows
+            ))
+            results = [outcome for outcome in outcomes if outcome is not None]
+            if results:
+                async with self.session_factory() as db:
+                    self.settled += len(await settle_payments(db, results))
+            position = rows[-1].id
+            return len(rows)
+        finally:
+            await self._release(position, lease_until)
+
+    async def _query(self, transaction_id: str, expired: bool) -> Optional[PaymentResult]:
+        async with self._semaphore:
+            await self._budget.acquire()
+            self.queried += 1
+            try:
+                response = await asyncio.wait_for(
+                    mpesa_service.query_stk_status(transaction_id), timeout=self.query_deadline
+                )
+            except Exception:
+                # No answer says nothing about whether the customer paid, so never give up on one
+                self.errors += 1
+                if expired:
+                    self.overdue_errors += 1
+                    logger.error(
+                        "STK status query failed for %s past the give-up deadline; leaving it pending",
+                        transaction_id, exc_info=True,
+                    )
+                else:
+                    logger.warning("STK status query failed for %s", transaction_id, exc_info=True)
+                return None
+        if response is not None and "ResultCode" in response:
+            return PaymentResult(transaction_id, str(response["ResultCode"]) == "0", response.get("ResultDesc"))
+        if expired:
+            # Daraja answered: still processing a day later, or it has no record of the push
+            self.gave_up += 1
+            return PaymentResult(transaction_id, False, "No STK result before the give-up deadline")
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "queried": self.queried,
+            "settled": self.settled,
+            "errors": self.errors,
+            "gave_up": self.gave_up,
+            "overdue_errors": self.overdue_errors,
+        }
+
+poller = StkStatusPoller()
@@ -1,29 +1,50 @@
 import os
+import json
+import time
+import base64
+import asyncio
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Set, Tuple, Union
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from . import crud, models, schemas
+from . import crud, models, schemas, cache
+from .hashing import pwd_context, password_hasher
 from .database import get_db
-from sqlalchemy import select
+from sqlalchemy import select, or_
 
 # Load environment variables
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
+# Trust the signed claims in access tokens instead of loading the user on every request
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "true").lower() == "true"
+AUTH_REVOCATION_REFRESH_SECONDS = float(os.getenv("AUTH_REVOCATION_REFRESH_SECONDS", 60))
+# Access token lifetime for a remember-me login, the longest-lived kind
+REMEMBER_ME_ACCESS_TOKEN_DAYS = 7
+
+def login_access_token_lifetime(remember_me: bool) -> timedelta:
+    return timedelta(days=REMEMBER_ME_ACCESS_TOKEN_DAYS if remember_me else ACCESS_TOKEN_EXPIRE_MINUTES / 60)
+
+# No access token outlives this, so revocations older than it no longer matter
+ACCESS_TOKEN_MAX_LIFETIME = max(
+    login_access_token_lifetime(True),
+    login_access_token_lifetime(False),
+    timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await password_hasher.verify_and_update(plain_password, hashed_password)
+
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -31,6 +52,16 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     to_encode.update({"exp": expire, "type": "access"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def access_token_claims(user: models.User) -> Dict[str, Any]:
+    """Claims that let get_current_user authenticate the user without a database lookup."""
+    return {
+        "sub": user.username,
+        "role": user.role.value,
+        "uid": user.id,
+        "active": user.is_active,
+        "ver": user.token_version or 0,
+    }
+
 def create_refresh_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
@@ -42,7 +73,118 @@ def create_password_reset_token(email: str, expires_delta: Optional[timedelta] =
     to_encode = {"sub": email, "exp": expire, "type": "password_reset"}
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)) -> models.User:
+def encode_cursor(sort: str, order: str, value: Any, last_id: int) -> str:
+    """Encode the keyset position of the last row of a page into an opaque cursor."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps({"s": sort, "o": order, "v": value, "id": last_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, order: str) -> Tuple[Any, int]:
+    """Decode a cursor produced by encode_cursor for the same sort key and order."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if payload["s"] != sort or payload["o"] != order:
+            raise ValueError("cursor does not match sort")
+        return payload["v"], int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+class RevocationList:
+    """
+    In-memory list of users whose outstanding tokens must be rejected: those
+    deactivated or whose token_version was bumped (password, role or username
+    change). It is reloaded with one small query every
+    AUTH_REVOCATION_REFRESH_SECONDS, and immediately when any worker publishes
+    a "user" invalidation, so stateless authentication never needs a lookup.
+    Only users changed within ACCESS_TOKEN_MAX_LIFETIME are loaded, since any
+    token issued before an older change has expired. Deleted users leave no
+    row to load, so ids named by an invalidation that no longer exist are kept
+    as tombstones for the same lifetime. Each reload also checks that the users
+    authenticated since the last one still exist, so a deletion whose
+    invalidation was missed is caught within one refresh interval.
+    """
+
+    def __init__(self, refresh_seconds: float = AUTH_REVOCATION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._entries: Dict[int, Tuple[int, bool]] = {}
+        # user id -> monotonic time the tombstone can be dropped
+        self._tombstones: Dict[int, float] = {}
+        self._pending: Set[int] = set()
+        # Users authenticated since the last reload
+        self._seen: Set[int] = set()
+        self._loaded_at: Optional[float] = None
+        self._invalidated_at = 0.0
+        self._lock = asyncio.Lock()
+        self.reloads = 0
+
+    def mark_stale(self, user_id: Any = None) -> None:
+        self._invalidated_at = time.monotonic()
+        if user_id is not None:
+            self._pending.add(user_id)
+
+    def _fresh(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and self._loaded_at > self._invalidated_at
+            and time.monotonic() - self._loaded_at < self.refresh_seconds
+        )
+
+    async def ensure_fresh(self, db: AsyncSession) -> None:
+        if self._fresh():
+            return
+        async with self._lock:
+            if self._fresh():
+                return
+            # Invalidations landing during the reload leave it stale for the next request
+            started = time.monotonic()
+            pending, self._pending = self._pending, set()
+            seen, self._seen = self._seen, set()
+            result = await db.execute(
+                select(models.User.id, models.User.token_version, models.User.is_active)
+                .where(
+                    models.User.updated_at >= datetime.utcnow() - ACCESS_TOKEN_MAX_LIFETIME,
+                    or_(models.User.is_active == False, models.User.token_version > 0),
+                )
+            )
+            self._entries = {row.id: (row.token_version, row.is_active) for row in result.all()}
+            check = (pending | seen) - self._entries.keys() - self._tombstones.keys()
+            if check:
+                existing = await db.execute(select(models.User.id).where(models.User.id.in_(check)))
+                deleted = check - set(existing.scalars().all())
+                expires_at = started + ACCESS_TOKEN_MAX_LIFETIME.total_seconds()
+                self._tombstones.update(dict.fromkeys(deleted, expires_at))
+            self._tombstones = {uid: expires_at for uid, expires_at in self._tombstones.items() if expires_at > started}
+            self._loaded_at = started
+            self.reloads += 1
+
+    def is_revoked(self, user_id: int, token_version: int) -> bool:
+        if user_id in self._tombstones:
+            return True
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            current_version, is_active = entry
+            if not is_active or token_version < current_version:
+                return True
+        self._seen.add(user_id)
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "tombstones": len(self._tombstones),
+            "seen": len(self._seen),
+            "reloads": self.reloads,
+        }
+
+revocations = RevocationList()
+cache.on_invalidate("user", revocations.mark_stale)
+
+async def get_current_user(
+    db: AsyncSession = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+) -> Union[models.User, schemas.AuthenticatedUser]:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -58,6 +200,17 @@ async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depe
         token_data = schemas.TokenData(username=username, role=payload.get("role"))
     except JWTError:
         raise credentials_exception
+    if AUTH_STATELESS and "uid" in payload and "ver" in payload:
+        await revocations.ensure_fresh(db)
+        if revocations.is_revoked(payload["uid"], payload["ver"]):
+            raise credentials_exception
+        return schemas.AuthenticatedUser(
+            id=payload["uid"],
+            username=username,
+            role=token_data.role,
+            is_active=payload.get("active", True),
+        )
+    # Tokens issued before stateless claims existed still go through the database
     user = await crud.get_user_by_username(db, username=token_data.username)
     if not user:
         raise credentials_exception
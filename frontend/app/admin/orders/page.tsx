@@ -38,7 +38,11 @@ import { Separator } from "@/components/ui/separator"
 import { useToast } from "@/components/ui/use-toast"
 import { useAuthContext } from "@/contexts/AuthContext"
 import { adminApi } from "@/lib/api"
+import { localDayBoundary } from "@/lib/utils"
 import type { Order, OrderStatus } from "@/types/api"
+import type { AdminOrderListParams } from "@/types/common"
+
+const PAGE_SIZE = 25
 
 export default function OrdersPage() {
   const { toast } = useToast()
@@ -47,15 +51,15 @@ export default function OrdersPage() {
   const [filteredOrders, setFilteredOrders] = useState<Order[]>([])
   const [searchQuery, setSearchQuery] = useState("")
   const [statusFilter, setStatusFilter] = useState("all")
-  const [sortField, setSortField] = useState("createdAt")
-  const [sortOrder, setSortOrder] = useState("desc")
+  const [userFilter, setUserFilter] = useState("")
+  const [createdFrom, setCreatedFrom] = useState("")
+  const [createdTo, setCreatedTo] = useState("")
+  const [sortField, setSortField] = useState<NonNullable<AdminOrderListParams["sort"]>>("created_at")
+  const [sortOrder, setSortOrder] = useState<"asc" | "desc">("desc")
   const [loading, setLoading] = useState(true)
-  const [pagination, setPagination] = useState({
-    page: 1,
-    limit: 10,
-    total: 0,
-    pages: 1,
-  })
+  const [loadingMore, setLoadingMore] = useState(false)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [totalEstimate, setTotalEstimate] = useState<number | null>(null)
   
   // Order detail dialog
   const [selectedOrder, setSelectedOrder] = useState<Order | null>(null)
@@ -65,26 +69,27 @@ export default function OrdersPage() {
   useEffect(() => {
     localStorage.setItem('previousPath', window.location.pathname)
     fetchOrders()
-  }, [pagination.page, statusFilter, sortField, sortOrder])
+  }, [statusFilter, userFilter, createdFrom, createdTo, sortField, sortOrder])
+
+  // Filtering, sorting and paging all happen on the server
+  const queryParams = (): AdminOrderListParams => ({
+    limit: PAGE_SIZE,
+    sort: sortField,
+    order: sortOrder,
+    status: statusFilter === 'all' ? undefined : statusFilter as OrderStatus,
+    user_id: userFilter ? Number(userFilter) : undefined,
+    created_from: createdFrom ? localDayBoundary(createdFrom, 'start') : undefined,
+    created_to: createdTo ? localDayBoundary(createdTo, 'end') : undefined,
+  })
 
   const fetchOrders = async () => {
     try {
       setLoading(true)
-      const data = await adminApi.getOrders()
-      let list = data
-      if (statusFilter !== 'all') list = list.filter(o => o.status === statusFilter as OrderStatus)
-      // simple sort
-      list = list.slice().sort((a,b) => {
-        const dir = sortOrder === 'asc' ? 1 : -1
-        if (sortField === 'total') return (a.total - b.total) * dir
-        if (sortField === 'id') return (a.id - b.id) * dir
-        const da = new Date(a.created_at).getTime()
-        const db = new Date(b.created_at).getTime()
-        return (da - db) * dir
-      })
-      setOrders(list)
-      setFilteredOrders(list)
-      setPagination(p => ({ ...p, total: list.length, pages: Math.max(1, Math.ceil(list.length / p.limit)) }))
+      const page = await adminApi.getOrders({ ...queryParams(), include_total: true })
+      setOrders(page.items)
+      setFilteredOrders(page.items)
+      setNextCursor(page.nextCursor)
+      setTotalEstimate(page.totalEstimate)
     } catch (error) {
       console.error("Error fetching orders:", error)
       toast({ title: "Error", description: "Failed to load orders. Please try again.", variant: "destructive" })
@@ -93,6 +98,22 @@ export default function OrdersPage() {
     }
   }
 
+  const loadMoreOrders = async () => {
+    if (!nextCursor) return
+    try {
+      setLoadingMore(true)
+      const page = await adminApi.getOrders({ ...queryParams(), cursor: nextCursor })
+      setOrders(prev => [...prev, ...page.items])
+      setFilteredOrders(prev => [...prev, ...page.items])
+      setNextCursor(page.nextCursor)
+    } catch (error) {
+      console.error("Error fetching orders:", error)
+      toast({ title: "Error", description: "Failed to load more orders. Please try again.", variant: "destructive" })
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleSearch = (e: React.FormEvent) => {
     e.preventDefault()
     const query = searchQuery.toLowerCase()
@@ -103,7 +124,7 @@ export default function OrdersPage() {
     setFilteredOrders(filtered)
   }
 
-  const handleSort = (field: string) => {
+  const handleSort = (field: NonNullable<AdminOrderListParams["sort"]>) => {
     if (field === sortField) setSortOrder(sortOrder === "asc" ? "desc" : "asc")
     else { setSortField(field); setSortOrder("asc") }
   }
@@ -207,12 +228,36 @@ export default function OrdersPage() {
                   <SelectItem value="cancelled">Cancelled</SelectItem>
                 </SelectContent>
               </Select>
+              <Input
+                type="number"
+                min={1}
+                placeholder="User ID"
+                value={userFilter}
+                onChange={(e) => setUserFilter(e.target.value)}
+                className="w-[110px]"
+              />
+              <Input
+                type="date"
+                aria-label="Placed from"
+                value={createdFrom}
+                onChange={(e) => setCreatedFrom(e.target.value)}
+                className="w-[160px]"
+              />
+              <Input
+                type="date"
+                aria-label="Placed to"
+                value={createdTo}
+                onChange={(e) => setCreatedTo(e.target.value)}
+                className="w-[160px]"
+              />
               <Button variant="outline" size="icon" onClick={() => {
                 setSearchQuery("")
                 setStatusFilter("all")
-                setSortField("createdAt")
+                setUserFilter("")
+                setCreatedFrom("")
+                setCreatedTo("")
+                setSortField("created_at")
                 setSortOrder("desc")
-                fetchOrders()
               }}>
                 <Filter className="h-4 w-4" />
               </Button>
@@ -226,7 +271,7 @@ export default function OrdersPage() {
         <CardHeader className="pb-3">
           <CardTitle>Orders List</CardTitle>
           <CardDescription>
-            Showing {filteredOrders.length} of {pagination.total} orders
+            Showing {filteredOrders.length} of {totalEstimate === null ? orders.length : `about ${totalEstimate}`} orders
           </CardDescription>
         </CardHeader>
         <CardContent>
@@ -250,20 +295,10 @@ export default function OrdersPage() {
                       </Button>
                     </th>
                     <th className="pb-3 text-left font-medium">Customer</th>
+                    <th className="pb-3 text-left font-medium">Status</th>
+                    <th className="pb-3 text-left font-medium">Total</th>
                     <th className="pb-3 text-left font-medium">
-                      <Button variant="ghost" className="p-0 font-medium" onClick={() => handleSort("status")}>
-                        Status
-                        <ArrowUpDown className="ml-2 h-4 w-4" />
-                      </Button>
-                    </th>
-                    <th className="pb-3 text-left font-medium">
-                      <Button variant="ghost" className="p-0 font-medium" onClick={() => handleSort("total")}>
-                        Total
-                        <ArrowUpDown className="ml-2 h-4 w-4" />
-                      </Button>
-                    </th>
-                    <th className="pb-3 text-left font-medium">
-                      <Button variant="ghost" className="p-0 font-medium" onClick={() => handleSort("createdAt")}>
+                      <Button variant="ghost" className="p-0 font-medium" onClick={() => handleSort("created_at")}>
                         Date
                         <ArrowUpDown className="ml-2 h-4 w-4" />
                       </Button>
@@ -323,33 +358,10 @@ export default function OrdersPage() {
           )}
           
           {/* Pagination */}
-          {pagination.pages > 1 && (
-            <div className="flex justify-center gap-1 mt-6">
-              <Button
-                variant="outline"
-                size="sm"
-                onClick={() => setPagination({ ...pagination, page: Math.max(1, pagination.page - 1) })}
-                disabled={pagination.page === 1}
-              >
-                Previous
-              </Button>
-              {Array.from({ length: pagination.pages }, (_, i) => i + 1).map((page) => (
-                <Button
-                  key={page}
-                  variant={pagination.page === page ? "default" : "outline"}
-                  size="sm"
-                  onClick={() => setPagination({ ...pagination, page })}
-                >
-                  {page}
-                </Button>
-              ))}
-              <Button
-                variant="outline"
-                size="sm"
-                onClick={() => setPagination({ ...pagination, page: Math.min(pagination.pages, pagination.page + 1) })}
-                disabled={pagination.page === pagination.pages}
-              >
-                Next
+          {nextCursor && (
+            <div className="flex justify-center mt-6">
+              <Button variant="outline" size="sm" onClick={loadMoreOrders} disabled={loadingMore}>
+                {loadingMore ? "Loading..." : "Load more"}
               </Button>
             </div>
           )}
@@ -17,7 +17,11 @@ import { AlertDialog, AlertDialogAction, AlertDialogCancel, AlertDialogContent,
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs"
 import { Search, UserPlus, Trash2, Edit, UserCheck, UserX, RefreshCw, Filter } from "lucide-react"
 import { adminApi } from "@/lib/api"
+import { localDayBoundary } from "@/lib/utils"
 import type { User, AdminUserUpdate, UserCreate } from "@/types/api"
+import type { AdminUserListParams } from "@/types/common"
+
+const PAGE_SIZE = 50
 
 export default function UsersPage() {
   const router = useRouter()
@@ -29,6 +33,11 @@ export default function UsersPage() {
   const [searchQuery, setSearchQuery] = useState("")
   const [roleFilter, setRoleFilter] = useState("all")
   const [statusFilter, setStatusFilter] = useState("all")
+  const [createdFrom, setCreatedFrom] = useState("")
+  const [createdTo, setCreatedTo] = useState("")
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [totalEstimate, setTotalEstimate] = useState<number | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [isEditDialogOpen, setIsEditDialogOpen] = useState(false)
   const [isAddDialogOpen, setIsAddDialogOpen] = useState(false)
   const [selectedUser, setSelectedUser] = useState<User | null>(null)
@@ -42,14 +51,24 @@ export default function UsersPage() {
       return
     }
     fetchUsers()
-  }, [user])
+  }, [user, roleFilter, statusFilter, createdFrom, createdTo])
+
+  // Role, status and date filters and paging run on the server; search narrows the loaded rows
+  const queryParams = (): AdminUserListParams => ({
+    limit: PAGE_SIZE,
+    role: roleFilter === 'all' ? undefined : roleFilter as AdminUserListParams["role"],
+    is_active: statusFilter === 'all' ? undefined : statusFilter === 'active',
+    created_from: createdFrom ? localDayBoundary(createdFrom, 'start') : undefined,
+    created_to: createdTo ? localDayBoundary(createdTo, 'end') : undefined,
+  })
 
   const fetchUsers = async () => {
     try {
       setLoading(true)
-      const data = await adminApi.getUsers()
-      setUsers(data)
-      setFilteredUsers(data)
+      const page = await adminApi.getUsers({ ...queryParams(), include_total: true })
+      setUsers(page.items)
+      setNextCursor(page.nextCursor)
+      setTotalEstimate(page.totalEstimate)
     } catch (error) {
       console.error('Error fetching users:', error)
       toast({ title: 'Error', description: 'Failed to load users', variant: 'destructive' })
@@ -58,6 +77,21 @@ export default function UsersPage() {
     }
   }
 
+  const loadMoreUsers = async () => {
+    if (!nextCursor) return
+    try {
+      setLoadingMore(true)
+      const page = await adminApi.getUsers({ ...queryParams(), cursor: nextCursor })
+      setUsers(prev => [...prev, ...page.items])
+      setNextCursor(page.nextCursor)
+    } catch (error) {
+      console.error('Error fetching users:', error)
+      toast({ title: 'Error', description: 'Failed to load more users', variant: 'destructive' })
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   // Form state for adding/editing users
   const [formData, setFormData] = useState({
     name: "",
@@ -190,27 +224,22 @@ export default function UsersPage() {
     }
   }
 
-  // Filter users based on search and filters
+  // Narrow the loaded users by the search box
   useEffect(() => {
     let result = [...users]
     if (searchQuery) {
       const q = searchQuery.toLowerCase()
       result = result.filter(u => (u.full_name || u.username || '').toLowerCase().includes(q) || (u.email || '').toLowerCase().includes(q))
     }
-    if (roleFilter !== 'all') {
-      result = result.filter(u => u.role === roleFilter)
-    }
-    if (statusFilter !== 'all') {
-      const isActive = statusFilter === 'active'
-      result = result.filter(u => u.is_active === isActive)
-    }
     setFilteredUsers(result)
-  }, [users, searchQuery, roleFilter, statusFilter])
+  }, [users, searchQuery])
 
   const resetFilters = () => {
     setSearchQuery("")
     setRoleFilter("all")
     setStatusFilter("all")
+    setCreatedFrom("")
+    setCreatedTo("")
   }
 
   return (
@@ -250,8 +279,8 @@ export default function UsersPage() {
                   </SelectTrigger>
                   <SelectContent>
                     <SelectItem value="all">All Roles</SelectItem>
-                    <SelectItem value="ADMIN">Admin</SelectItem>
-                    <SelectItem value="CUSTOMER">Customer</SelectItem>
+                    <SelectItem value="admin">Admin</SelectItem>
+                    <SelectItem value="user">Customer</SelectItem>
                   </SelectContent>
                 </Select>
               </div>
@@ -267,6 +296,20 @@ export default function UsersPage() {
                   </SelectContent>
                 </Select>
               </div>
+              <Input
+                type="date"
+                aria-label="Created from"
+                value={createdFrom}
+                onChange={(e) => setCreatedFrom(e.target.value)}
+                className="w-full sm:w-40"
+              />
+              <Input
+                type="date"
+                aria-label="Created to"
+                value={createdTo}
+                onChange={(e) => setCreatedTo(e.target.value)}
+                className="w-full sm:w-40"
+              />
               <Button variant="outline" size="icon" onClick={resetFilters} className="h-10 w-10">
                 <RefreshCw className="h-4 w-4" />
               </Button>
@@ -310,8 +353,8 @@ export default function UsersPage() {
                       <TableCell className="font-medium">{user.full_name || user.username}</TableCell>
                       <TableCell>{user.email}</TableCell>
                       <TableCell>
-                        <span className={`inline-flex items-center rounded-full px-2.5 py-0.5 text-xs font-medium ${user.role === 'ADMIN' ? 'bg-blue-100 text-blue-800' : 'bg-green-100 text-green-800'}`}>
-                          {user.role === 'ADMIN' ? 'Admin' : 'Customer'}
+                        <span className={`inline-flex items-center rounded-full px-2.5 py-0.5 text-xs font-medium ${user.role === 'admin' ? 'bg-blue-100 text-blue-800' : 'bg-green-100 text-green-800'}`}>
+                          {user.role === 'admin' ? 'Admin' : 'Customer'}
                         </span>
                       </TableCell>
                       <TableCell>{user.username}</TableCell>
@@ -368,8 +411,13 @@ export default function UsersPage() {
         </CardContent>
         <CardFooter className="flex justify-between">
           <div className="text-sm text-muted-foreground">
-            Showing {filteredUsers.length} of {users.length} users
+            Showing {filteredUsers.length} of {totalEstimate === null ? users.length : `about ${totalEstimate}`} users
           </div>
+          {nextCursor && (
+            <Button variant="outline" size="sm" onClick={loadMoreUsers} disabled={loadingMore}>
+              {loadingMore ? "Loading..." : "Load more"}
+            </Button>
+          )}
         </CardFooter>
       </Card>
 
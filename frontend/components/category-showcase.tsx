@@ -107,7 +107,7 @@ export default function CategoryShowcase() {
                       </p>
                     )}
                     <div className="mt-4 text-sm opacity-75">
-                      {category.products.length} products
+                      {category.product_count} products
                     </div>
                   </div>
                 </div>
@@ -44,7 +44,7 @@ export default function CategorySidebar({
         >
           <span className="flex-1 text-left">All Categories</span>
           <Badge variant="secondary" className="ml-2">
-            {categories.reduce((total, cat) => total + cat.products.length, 0)}
+            {categories.reduce((total, cat) => total + cat.product_count, 0)}
           </Badge>
         </Button>
         
@@ -57,7 +57,7 @@ export default function CategorySidebar({
           >
             <span className="flex-1 text-left">{category.name}</span>
             <Badge variant="secondary" className="ml-2">
-              {category.products.length}
+              {category.product_count}
             </Badge>
           </Button>
         ))}
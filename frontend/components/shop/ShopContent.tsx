@@ -10,51 +10,82 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@
 import { Sheet, SheetContent, SheetTrigger } from "@/components/ui/sheet"
 import ProductCard from "@/components/product-card"
 import CategorySidebar from "@/components/category-sidebar"
-import Pagination from "@/components/pagination"
 import { useToast } from "@/components/ui/use-toast"
 import { shopApi } from "@/lib/api"
 import type { Product } from "@/types/api"
+import type { ProductQueryParams } from "@/types/common"
+
+const PAGE_SIZE = 24
+
+// Sort options mapped onto the sort keys /shop/products accepts
+const SORT_PARAMS: Record<string, Pick<ProductQueryParams, "sort" | "order">> = {
+  "featured": { sort: "updated_at", order: "desc" },
+  "price-asc": { sort: "price", order: "asc" },
+  "price-desc": { sort: "price", order: "desc" },
+  "name-asc": { sort: "name", order: "asc" },
+  "name-desc": { sort: "name", order: "desc" },
+}
 
 export default function ShopContent() {
   const { toast } = useToast()
   const searchParams = useSearchParams()
   const [products, setProducts] = useState<Product[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [searchQuery, setSearchQuery] = useState("")
+  const [debouncedSearch, setDebouncedSearch] = useState("")
   const [sortBy, setSortBy] = useState("featured")
   const [isFilterOpen, setIsFilterOpen] = useState(false)
-  const [pagination, setPagination] = useState({ total: 0, page: 1, limit: 8, pages: 1 })
 
-  const currentPage = parseInt(searchParams.get("page") || "1") || 1
   const selectedCategory = searchParams.get("category")
 
-  useEffect(() => { fetchProducts() }, [currentPage, selectedCategory, sortBy, searchQuery])
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchQuery.trim()), 300)
+    return () => clearTimeout(timer)
+  }, [searchQuery])
 
-  const fetchProducts = async () => {
-    try {
-      setLoading(true)
-      const all = await shopApi.getProducts()
-      let filtered = all
-      if (selectedCategory) {
-        const catId = Number(selectedCategory)
-        filtered = filtered.filter(p => p.category_id === catId)
-      }
-      if (searchQuery) {
-        const q = searchQuery.toLowerCase()
-        filtered = filtered.filter(p => p.name.toLowerCase().includes(q) || p.description.toLowerCase().includes(q))
-      }
-      if (sortBy.startsWith('price')) {
-        filtered = filtered.slice().sort((a,b) => sortBy.endsWith('asc') ? a.price - b.price : b.price - a.price)
-      } else if (sortBy.startsWith('name')) {
-        filtered = filtered.slice().sort((a,b) => sortBy.endsWith('asc') ? a.name.localeCompare(b.name) : b.name.localeCompare(a.name))
+  const queryParams = (): ProductQueryParams => ({
+    ...SORT_PARAMS[sortBy],
+    category_id: selectedCategory ? Number(selectedCategory) : undefined,
+    search: debouncedSearch || undefined,
+    limit: PAGE_SIZE,
+  })
+
+  useEffect(() => {
+    // Ignore responses for filters the user has already moved away from
+    let ignore = false
+    const fetchProducts = async () => {
+      try {
+        setLoading(true)
+        const page = await shopApi.getProducts(queryParams())
+        if (ignore) return
+        setProducts(page.items)
+        setNextCursor(page.nextCursor)
+      } catch (error) {
+        if (ignore) return
+        console.error('Error fetching products:', error)
+        toast({ title: 'Error', description: 'Failed to load products. Please try again.', variant: 'destructive' })
+      } finally {
+        if (!ignore) setLoading(false)
       }
-      setProducts(filtered)
-      setPagination(prev => ({ ...prev, total: filtered.length, pages: Math.max(1, Math.ceil(filtered.length / prev.limit)) }))
+    }
+    fetchProducts()
+    return () => { ignore = true }
+  }, [selectedCategory, sortBy, debouncedSearch])
+
+  const loadMore = async () => {
+    if (!nextCursor) return
+    try {
+      setLoadingMore(true)
+      const page = await shopApi.getProducts({ ...queryParams(), cursor: nextCursor })
+      setProducts(prev => [...prev, ...page.items])
+      setNextCursor(page.nextCursor)
     } catch (error) {
       console.error('Error fetching products:', error)
-      toast({ title: 'Error', description: 'Failed to load products. Please try again.', variant: 'destructive' })
+      toast({ title: 'Error', description: 'Failed to load more products. Please try again.', variant: 'destructive' })
     } finally {
-      setLoading(false)
+      setLoadingMore(false)
     }
   }
 
@@ -117,7 +148,7 @@ export default function ShopContent() {
 
           {loading ? (
             <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6 animate-pulse">
-              {Array.from({ length: 8 }).map((_, i) => (<div key={i} className="bg-muted rounded-lg h-[300px]" />))}
+              {Array.from({ length: PAGE_SIZE }).map((_, i) => (<div key={i} className="bg-muted rounded-lg h-[300px]" />))}
             </div>
           ) : products.length === 0 ? (
             <div className="flex flex-col items-center justify-center h-64 text-center">
@@ -133,13 +164,11 @@ export default function ShopContent() {
               <motion.div initial={{ opacity: 0 }} animate={{ opacity: 1 }} transition={{ duration: 0.3 }} className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
                 {products.map((product) => (<ProductCard key={product.id} product={product} />))}
               </motion.div>
-              {pagination.pages > 1 && (
+              {nextCursor && (
                 <div className="mt-8 flex justify-center">
-                  <Pagination currentPage={currentPage} totalPages={pagination.pages} onPageChange={(page: number) => {
-                    const params = new URLSearchParams(window.location.search)
-                    params.set("page", String(page))
-                    window.history.pushState({}, "", `?${params.toString()}`)
-                  }} />
+                  <Button variant="outline" onClick={loadMore} disabled={loadingMore}>
+                    {loadingMore ? "Loading..." : "Load more"}
+                  </Button>
                 </div>
               )}
             </>
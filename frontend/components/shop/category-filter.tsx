@@ -53,7 +53,7 @@ export default function CategoryFilter({
         >
           All Categories
           <Badge variant="secondary" className="ml-auto">
-            {categories.reduce((total, cat) => total + cat.products.length, 0)}
+            {categories.reduce((total, cat) => total + cat.product_count, 0)}
           </Badge>
         </Button>
         
@@ -66,7 +66,7 @@ export default function CategoryFilter({
           >
             {category.name}
             <Badge variant="secondary" className="ml-auto">
-              {category.products.length}
+              {category.product_count}
             </Badge>
           </Button>
         ))}
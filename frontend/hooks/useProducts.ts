@@ -1,11 +1,11 @@
 import { useState, useEffect, useCallback } from 'react';
 import { shopApi } from '@/lib/api';
-import type { Product, Category } from '@/types/api';
-import type { LoadingState, FilterParams, PaginationParams } from '@/types/common';
+import type { Product, CategorySummary } from '@/types/api';
+import type { LoadingState, ProductQueryParams } from '@/types/common';
 
 interface ProductsState {
   products: Product[];
-  categories: Category[];
+  categories: CategorySummary[];
   featured: Product[];
   bestsellers: Product[];
   loading: LoadingState;
@@ -13,10 +13,10 @@ interface ProductsState {
 }
 
 interface ProductsActions {
-  getProducts: (params?: PaginationParams & FilterParams) => Promise<Product[]>;
+  getProducts: (params?: ProductQueryParams) => Promise<Product[]>;
   getProductById: (id: number) => Promise<Product | null>;
-  getCategories: () => Promise<Category[]>;
-  getCategoryById: (id: number) => Promise<Category | null>;
+  getCategories: () => Promise<CategorySummary[]>;
+  getCategoryById: (id: number) => Promise<CategorySummary | null>;
   getFeatured: (limit?: number) => Promise<Product[]>;
   getBestsellers: (limit?: number) => Promise<Product[]>;
   refreshProducts: () => Promise<void>;
@@ -36,31 +36,31 @@ export function useProducts(): ProductsState & ProductsActions {
   const refreshProducts = useCallback(async (): Promise<void> => {
     try {
       setState(prev => ({ ...prev, loading: 'loading', error: null }));
-      const [products, categories, featured, bestsellers] = await Promise.all([
-        shopApi.getProducts(),
+      // Product listings are paged on the server; callers fetch them with getProducts
+      const [categories, featured, bestsellers] = await Promise.all([
         shopApi.getCategories(),
         shopApi.getFeatured(),
         shopApi.getBestsellers(),
       ]);
       
-      setState({
-        products,
+      setState(prev => ({
+        ...prev,
         categories,
         featured,
         bestsellers,
         loading: 'success',
         error: null,
-      });
+      }));
     } catch (err) {
       const errorMessage = err instanceof Error ? err.message : 'Failed to load products';
       setState(prev => ({ ...prev, loading: 'error', error: errorMessage }));
     }
   }, []);
 
-  const getProducts = useCallback(async (params?: PaginationParams & FilterParams): Promise<Product[]> => {
+  const getProducts = useCallback(async (params?: ProductQueryParams): Promise<Product[]> => {
     try {
       setState(prev => ({ ...prev, loading: 'loading', error: null }));
-      const products = await shopApi.getProducts();
+      const { items: products } = await shopApi.getProducts(params);
       setState(prev => ({ ...prev, products, loading: 'success', error: null }));
       return products;
     } catch (err) {
@@ -83,7 +83,7 @@ export function useProducts(): ProductsState & ProductsActions {
     }
   }, []);
 
-  const getCategories = useCallback(async (): Promise<Category[]> => {
+  const getCategories = useCallback(async (): Promise<CategorySummary[]> => {
     try {
       setState(prev => ({ ...prev, loading: 'loading', error: null }));
       const categories = await shopApi.getCategories();
@@ -96,7 +96,7 @@ export function useProducts(): ProductsState & ProductsActions {
     }
   }, []);
 
-  const getCategoryById = useCallback(async (id: number): Promise<Category | null> => {
+  const getCategoryById = useCallback(async (id: number): Promise<CategorySummary | null> => {
     try {
       setState(prev => ({ ...prev, loading: 'loading', error: null }));
       const category = await shopApi.getCategoryById(id);
@@ -3,10 +3,12 @@ import type {
   UserCreate,
   UserUpdate,
   AdminUserUpdate,
+  AdminUserDetail,
   Token,
   Product,
   ProductCreate,
   Category,
+  CategorySummary,
   CategoryCreate,
   CategoryUpdate,
   CartResponse,
@@ -21,16 +23,18 @@ import type {
   CheckoutResponse,
   AnalyticsResponse,
   Msg,
+  CursorPage,
 } from '@/types/api';
+import type { ProductQueryParams, AdminUserListParams, AdminOrderListParams } from '@/types/common';
 
 // Base API configuration
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'https://pisafa-api.onrender.com';
 
 // Helper function to handle API requests
-async function fetchWithAuth<T>(
+async function requestWithAuth(
   url: string,
   options: RequestInit = {}
-): Promise<T> {
+): Promise<Response> {
   const token = typeof window !== 'undefined' ? localStorage.getItem('access_token') : null;
   const headers: HeadersInit = {
     'Content-Type': 'application/json',
@@ -52,9 +56,41 @@ async function fetchWithAuth<T>(
     throw new Error(error.detail || 'Something went wrong');
   }
 
+  return response;
+}
+
+async function fetchWithAuth<T>(
+  url: string,
+  options: RequestInit = {}
+): Promise<T> {
+  const response = await requestWithAuth(url, options);
   return response.json();
 }
 
+function toQueryString(params: Record<string, string | number | boolean | undefined>): string {
+  const query = new URLSearchParams(
+    Object.entries(params)
+      .filter(([, value]) => value !== undefined && value !== '')
+      .map(([key, value]) => [key, String(value)])
+  ).toString();
+  return query ? `?${query}` : '';
+}
+
+// Keyset-paginated list endpoints return the next page's cursor in X-Next-Cursor
+async function fetchPageWithAuth<T>(
+  url: string,
+  options: RequestInit = {}
+): Promise<CursorPage<T>> {
+  const response = await requestWithAuth(url, options);
+  const items: T[] = await response.json();
+  const estimate = response.headers.get('X-Total-Count-Estimate');
+  return {
+    items,
+    nextCursor: response.headers.get('X-Next-Cursor'),
+    totalEstimate: estimate === null ? null : Number(estimate),
+  };
+}
+
 // Auth API
 export const authApi = {
   login: async (username: string, password: string, rememberMe = false): Promise<Token> => {
@@ -186,13 +222,17 @@ export const userApi = {
 // Shop API
 export const shopApi = {
   // Categories
-  getCategories: (): Promise<Category[]> => fetchWithAuth<Category[]>('/shop/categories'),
+  getCategories: (): Promise<CategorySummary[]> => fetchWithAuth<CategorySummary[]>('/shop/categories'),
   
-  getCategoryById: (categoryId: number): Promise<Category> => 
-    fetchWithAuth<Category>(`/shop/categories/${categoryId}`),
+  getCategoryById: (categoryId: number): Promise<CategorySummary> => 
+    fetchWithAuth<CategorySummary>(`/shop/categories/${categoryId}`),
+
+  getCategoryProducts: (categoryId: number, limit = 50): Promise<Product[]> =>
+    fetchWithAuth<Product[]>(`/shop/categories/${categoryId}/products?limit=${limit}`),
   
   // Products
-  getProducts: (): Promise<Product[]> => fetchWithAuth<Product[]>('/shop/products'),
+  getProducts: (params: ProductQueryParams = {}): Promise<CursorPage<Product>> =>
+    fetchPageWithAuth<Product>(`/shop/products${toQueryString({ ...params })}`),
   
   getProductById: (productId: number): Promise<Product> => 
     fetchWithAuth<Product>(`/shop/products/${productId}`),
@@ -207,9 +247,11 @@ export const shopApi = {
 // Admin API
 export const adminApi = {
   // Users
-  getUsers: (): Promise<User[]> => fetchWithAuth<User[]>('/admin/users'),
+  // Paginated: pass filters, sort and cursor as query params (see X-Next-Cursor)
+  getUsers: (params: AdminUserListParams = {}): Promise<CursorPage<User>> =>
+    fetchPageWithAuth<User>(`/admin/users${toQueryString({ ...params })}`),
   
-  getUserById: (userId: number): Promise<User> => fetchWithAuth<User>(`/admin/users/${userId}`),
+  getUserById: (userId: number): Promise<AdminUserDetail> => fetchWithAuth<AdminUserDetail>(`/admin/users/${userId}`),
   
   createUser: (userData: UserCreate): Promise<User> =>
     fetchWithAuth<User>('/admin/users', {
@@ -269,7 +311,8 @@ export const adminApi = {
     }),
 
   // Orders
-  getOrders: (): Promise<Order[]> => fetchWithAuth<Order[]>('/admin/orders'),
+  getOrders: (params: AdminOrderListParams = {}): Promise<CursorPage<Order>> =>
+    fetchPageWithAuth<Order>(`/admin/orders${toQueryString({ ...params })}`),
   
   getOrder: (orderId: number): Promise<Order> => fetchWithAuth<Order>(`/admin/orders/${orderId}`),
   
@@ -288,7 +331,13 @@ export const adminApi = {
     fetchWithAuth<OrderSummaryResponse>(`/admin/orders/${orderId}/summary`),
     
   // Analytics
-  getAnalytics: (): Promise<AnalyticsResponse> => fetchWithAuth<AnalyticsResponse>('/admin/analytics'),
+  getAnalytics: (startDate?: string, endDate?: string): Promise<AnalyticsResponse> => {
+    const params = new URLSearchParams();
+    if (startDate) params.set('start_date', startDate);
+    if (endDate) params.set('end_date', endDate);
+    const query = params.toString();
+    return fetchWithAuth<AnalyticsResponse>(`/admin/analytics${query ? `?${query}` : ''}`);
+  },
 };
 
 // Export all APIs for convenience
@@ -84,6 +84,15 @@ export interface Category {
   products: Product[];
 }
 
+export interface CategorySummary {
+  id: number;
+  name: string;
+  description?: string;
+  image_url?: string;
+  product_count: number;
+  in_stock_count: number;
+}
+
 export interface CategoryCreate {
   name: string;
   description?: string;
@@ -139,6 +148,10 @@ export interface Order {
   created_at: string;
 }
 
+export interface AdminUserDetail extends User {
+  orders: Order[];
+}
+
 export interface OrderBase {
   total: number;
   status?: OrderStatus;
@@ -193,6 +206,8 @@ export interface AnalyticsResponse {
   total_revenue: number;
   top_products: Record<string, any>[];
   category_performance: Record<string, any>[];
+  start_date: string | null;
+  end_date: string | null;
   currency: string;
 }
 
@@ -225,6 +240,13 @@ export interface PaginatedResponse<T> {
   pages: number;
 }
 
+export interface CursorPage<T> {
+  items: T[];
+  nextCursor: string | null;
+  // Planner estimate of all matching rows, sent when the request asks for include_total
+  totalEstimate: number | null;
+}
+
 // Form data types
 export interface LoginFormData {
   username: string;
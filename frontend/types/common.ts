@@ -24,6 +24,37 @@ export interface FilterParams {
   is_bestseller?: boolean;
 }
 
+export interface CursorParams {
+  limit?: number;
+  cursor?: string;
+}
+
+export interface ProductQueryParams extends FilterParams, CursorParams {
+  search?: string;
+  sort?: 'price' | 'updated_at' | 'name';
+  order?: 'asc' | 'desc';
+}
+
+export interface AdminListParams extends CursorParams {
+  order?: 'asc' | 'desc';
+  // ISO timestamps; offset-aware values are converted to UTC by the API
+  created_from?: string;
+  created_to?: string;
+  include_total?: boolean;
+}
+
+export interface AdminUserListParams extends AdminListParams {
+  sort?: 'id' | 'created_at' | 'username';
+  role?: 'admin' | 'user';
+  is_active?: boolean;
+}
+
+export interface AdminOrderListParams extends AdminListParams {
+  sort?: 'id' | 'created_at';
+  status?: 'pending' | 'processing' | 'shipped' | 'delivered' | 'cancelled';
+  user_id?: number;
+}
+
 export interface SortOption {
   value: string;
   label: string;
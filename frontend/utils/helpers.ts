@@ -35,6 +35,14 @@ export function formatDate(date: string | Date, options?: Intl.DateTimeFormatOpt
   return new Intl.DateTimeFormat('en-US', defaultOptions).format(dateObj);
 }
 
+/**
+ * Turn a local YYYY-MM-DD date input into the UTC instant its day starts or ends at
+ */
+export function localDayBoundary(day: string, boundary: 'start' | 'end'): string {
+  const time = boundary === 'start' ? '00:00:00.000' : '23:59:59.999';
+  return new Date(`${day}T${time}`).toISOString();
+}
+
 /**
  * Format relative time (e.g., "2 hours ago")
  */
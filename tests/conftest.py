@@ -0,0 +1,89 @@
+"""
+Shared fixtures. Tests that need PostgreSQL run against TEST_DATABASE_URL, e.g.
+
+    TEST_DATABASE_URL=postgresql+asyncpg://postgres@localhost/shop_test python -m pytest -q
+
+and are skipped when it is unset. The schema is dropped and recreated for every
+such test, so never point it at a database you care about.
+
+TEST_DATABASE_READ_URL turns the read replica on. Point it at the same database
+through a role that may only read, so replica reads see the test data and any
+write routed to the replica fails:
+
+    CREATE ROLE shop_reader LOGIN;
+    TEST_DATABASE_READ_URL=postgresql+asyncpg://shop_reader@localhost/shop_test
+
+The tables are granted to that role as they are recreated. Without it the
+replica is off, and every read uses the primary.
+"""
+import os
+import sys
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+TEST_DATABASE_READ_URL = os.getenv("TEST_DATABASE_READ_URL") if TEST_DATABASE_URL else None
+
+# The backend reads its settings at import time; never let it see a real database
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "postgresql+asyncpg://test@localhost/test"
+if TEST_DATABASE_READ_URL:
+    os.environ["DATABASE_READ_URL"] = TEST_DATABASE_READ_URL
+else:
+    os.environ.pop("DATABASE_READ_URL", None)
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("DB_SSL", "false")
+os.environ.setdefault("CACHE_INVALIDATION_BUS", "memory")
+os.environ.setdefault("RATE_LIMIT_STORAGE_URI", "memory://")
+os.environ.setdefault("DB_MIGRATE_ON_STARTUP", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from backend import models
+    from backend.database import ASYNCPG_CONNECT_ARGS
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool, connect_args=ASYNCPG_CONNECT_ARGS)
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.drop_all)
+        await conn.run_sync(models.Base.metadata.create_all)
+        if TEST_DATABASE_READ_URL:
+            reader = make_url(TEST_DATABASE_READ_URL).username
+            await conn.execute(text(f'GRANT SELECT ON ALL TABLES IN SCHEMA public TO "{reader}"'))
+    yield engine
+    await engine.dispose()
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+@pytest.fixture
+async def db(session_factory):
+    async with session_factory() as session:
+        yield session
+
+@pytest.fixture
+def make_products(db):
+    """Insert products with the given stock levels and return their ids."""
+    from backend import models
+
+    async def make(*stock_levels: int):
+        products = [
+            models.Product(name=f"Product {i}", description="", price=100.0, stock=stock)
+            for i, stock in enumerate(stock_levels)
+        ]
+        db.add_all(products)
+        await db.commit()
+        return [product.id for product in products]
+    return make
@@ -0,0 +1,81 @@
+"""
+In-process stand-in for the Daraja endpoints the M-Pesa workers call: OAuth,
+STK push and STK query. Tests script its answers and read back what it received.
+"""
+import asyncio
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse
+from backend.services import mpesa
+
+class FakeDaraja:
+    def __init__(self):
+        self.tokens_issued = 0
+        self.pushes: List[dict] = []
+        self.queries: List[str] = []
+        # Upcoming pushes answered with a 500, and how long each push takes
+        self.failing_pushes = 0
+        self.push_delay = 0.0
+        # Upcoming STK queries answered with a 503, as during a Daraja outage
+        self.failing_queries = 0
+        # ResultCode per CheckoutRequestID; None while the customer has not answered
+        self.results: Dict[str, Optional[int]] = {}
+        self.app = FastAPI()
+        self.app.get("/oauth/v1/generate")(self.generate_token)
+        self.app.post("/mpesa/stkpush/v1/processrequest")(self.stk_push)
+        self.app.post("/mpesa/stkpushquery/v1/query")(self.stk_query)
+
+    def complete(self, checkout_request_id: str, result_code: int = 0) -> None:
+        """Answer the push as the customer would: 0 paid, anything else failed or cancelled."""
+        self.results[checkout_request_id] = result_code
+
+    async def generate_token(self, grant_type: str):
+        self.tokens_issued += 1
+        return {"access_token": f"token-{self.tokens_issued}", "expires_in": "3599"}
+
+    def _authorized(self, authorization: Optional[str]) -> bool:
+        return authorization == f"Bearer token-{self.tokens_issued}"
+
+    async def stk_push(self, request: Request, authorization: Optional[str] = Header(None)):
+        if not self._authorized(authorization):
+            return JSONResponse({"errorCode": "404.001.03", "errorMessage": "Invalid Access Token"}, status_code=401)
+        if self.push_delay:
+            await asyncio.sleep(self.push_delay)
+        payload = await request.json()
+        self.pushes.append(payload)
+        if self.failing_pushes:
+            self.failing_pushes -= 1
+            return JSONResponse({"errorCode": "500.001.1001", "errorMessage": "Unable to lock subscriber"}, status_code=500)
+        checkout_request_id = f"ws_CO_{len(self.pushes)}"
+        self.results[checkout_request_id] = None
+        return {
+            "MerchantRequestID": f"merchant-{len(self.pushes)}",
+            "CheckoutRequestID": checkout_request_id,
+            "ResponseCode": "0",
+            "ResponseDescription": "Success. Request accepted for processing",
+        }
+
+    async def stk_query(self, request: Request, authorization: Optional[str] = Header(None)):
+        if not self._authorized(authorization):
+            return JSONResponse({"errorCode": "404.001.03", "errorMessage": "Invalid Access Token"}, status_code=401)
+        checkout_request_id = (await request.json())["CheckoutRequestID"]
+        self.queries.append(checkout_request_id)
+        if self.failing_queries:
+            self.failing_queries -= 1
+            return JSONResponse({"errorCode": "503.001.01", "errorMessage": "Service unavailable"}, status_code=503)
+        if checkout_request_id not in self.results:
+            return JSONResponse(
+                {"errorCode": mpesa.STK_QUERY_UNKNOWN_REQUEST, "errorMessage": "Invalid CheckoutRequestID"},
+                status_code=400,
+            )
+        result_code = self.results[checkout_request_id]
+        if result_code is None:
+            return JSONResponse(
+                {"errorCode": mpesa.STK_QUERY_IN_PROGRESS, "errorMessage": "The transaction is being processed"},
+                status_code=500,
+            )
+        return {
+            "CheckoutRequestID": checkout_request_id,
+            "ResultCode": str(result_code),
+            "ResultDesc": "The service request is processed successfully." if result_code == 0 else "Request cancelled by user",
+        }
@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+from backend.routers.admin import _created_range
+
+def test_offset_aware_bounds_become_naive_utc():
+    nairobi = timezone(timedelta(hours=3))
+    created_from, created_to = _created_range(
+        datetime(2026, 3, 1, 0, 0, tzinfo=nairobi), datetime(2026, 3, 1, 23, 59, tzinfo=timezone.utc)
+    )
+    assert created_from == datetime(2026, 2, 28, 21, 0)
+    assert created_to == datetime(2026, 3, 1, 23, 59)
+
+def test_mixed_naive_and_aware_bounds_compare():
+    with pytest.raises(HTTPException) as exc_info:
+        _created_range(datetime(2026, 3, 2), datetime(2026, 3, 1, tzinfo=timezone.utc))
+    assert exc_info.value.status_code == 400
+
+def test_naive_bounds_pass_through():
+    assert _created_range(datetime(2026, 3, 1), None) == (datetime(2026, 3, 1), None)
@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from backend import cache, crud, models, schemas
+
+pytestmark = pytest.mark.anyio
+
+async def test_product_updates_stamp_the_row_and_the_invalidation_alike(db):
+    category = models.Category(name="Rings")
+    product = models.Product(name="Ring", description="", price=100.0, stock=5, category=category)
+    db.add(product)
+    await db.commit()
+    before = product.updated_at
+    key = ("product", product.id)
+
+    updated = await crud.update_product(db, product.id, schemas.ProductBase(
+        name="Ring", description="", price=120.0, stock=5, category_id=category.id,
+    ))
+
+    # A read that saw the new row may fill the cache; one from before the write may not
+    assert updated.updated_at > before
+    assert cache.catalog_cache.is_current(key, updated.updated_at)
+    assert not cache.catalog_cache.is_current(key, before)
+
+    assert await crud.delete_product(db, product.id)
+    assert not cache.catalog_cache.is_current(key, updated.updated_at)
+
+async def test_new_categories_are_stamped_too(db):
+    before = datetime.utcnow()
+
+    category = await crud.create_category(db, schemas.CategoryCreate(name="Bangles"))
+
+    # A category list read before the insert cannot fill the cache over it
+    assert not cache.catalog_cache.is_current(("category", category.id), before)
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+def test_entries_expire_after_their_ttl(clock):
+    lru = cache.TTLCache(maxsize=10, ttl=60)
+    lru.set(("product", 1), "default ttl")
+    lru.set(("product", 2), "short ttl", ttl=5)
+
+    clock.value += 5
+    assert lru.get(("product", 2)) is None
+    assert lru.get(("product", 1)) == "default ttl"
+    clock.value += 55
+    assert lru.get(("product", 1)) is None
+    assert lru.stats()["size"] == 0
+
+def test_least_recently_used_entry_is_evicted_at_capacity(clock):
+    lru = cache.TTLCache(maxsize=2, ttl=60)
+    lru.set(("product", 1), "one")
+    lru.set(("product", 2), "two")
+    lru.get(("product", 1))
+
+    lru.set(("product", 3), "three")
+
+    assert lru.get(("product", 2)) is None
+    assert (lru.get(("product", 1)), lru.get(("product", 3))) == ("one", "three")
+    assert lru.evictions == 1
+
+def test_counters(clock):
+    lru = cache.TTLCache(maxsize=10, ttl=60)
+    lru.set(("product", 1), "one")
+    lru.set(("product", 2), "two")
+    lru.set(("category", 1), "rings")
+    lru.get(("product", 1))
+    lru.get(("product", 9))
+
+    assert lru.invalidate("product", 1) == 1
+    assert lru.invalidate("product", 1) == 0
+    lru.clear()
+
+    stats = lru.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+    assert (stats["invalidations"], stats["evictions"], stats["size"]) == (3, 0, 0)
+
+def test_fills_older_than_a_recorded_version_are_rejected(clock):
+    lru = cache.TTLCache(maxsize=10, ttl=60)
+    key = ("product", 1)
+    write = datetime(2024, 1, 1, 12, 0, 0)
+
+    assert lru.record_version(key, write)
+    # Duplicates and reordered older messages are not applied again
+    assert not lru.record_version(key, write)
+    assert not lru.record_version(key, write - timedelta(seconds=1))
+
+    assert not lru.is_current(key, write - timedelta(seconds=1))
+    assert lru.is_current(key, write)
+    assert lru.is_current(("product", 2), write - timedelta(days=1))
+    lru.set(key, "read before the write", version=write - timedelta(seconds=1))
+    assert lru.get(key) is None
+    lru.set(key, "read after the write", version=write)
+    assert lru.get(key) == "read after the write"
+
+@pytest.fixture
+def postgres_bus(monkeypatch):
+    from backend import database
+    monkeypatch.setattr(cache, "CACHE_INVALIDATION_BUS", "postgres")
+    monkeypatch.setattr(database, "SQLALCHEMY_DATABASE_URL", "postgresql+asyncpg://app@pooler.example/shop")
+    monkeypatch.setattr(database, "DB_POOLER_MODE", True)
+    return database
+
+async def test_invalidation_bus_refuses_to_listen_through_a_pooler(postgres_bus):
+    bus = cache._build_bus()
+
+    with pytest.raises(RuntimeError, match="DATABASE_DIRECT_URL"):
+        await bus.start()
+    assert bus._task is None
+
+async def test_invalidation_bus_listens_on_the_direct_url(postgres_bus, monkeypatch):
+    monkeypatch.setattr(postgres_bus, "SQLALCHEMY_DIRECT_DATABASE_URL", "postgresql+asyncpg://app@direct.example/shop")
+
+    bus = cache._build_bus()
+
+    assert bus.dsn == "postgresql://app@direct.example/shop"
+    assert not bus.pooled
+
+def test_invalidation_bus_needs_a_transport():
+    with pytest.raises(TypeError):
+        cache.InvalidationBus()
+
+@pytest.fixture
+def workers():
+    """Two buses on one hub, as two workers sharing a channel."""
+    hub = []
+    cache.catalog_cache.clear()
+    yield cache.InMemoryInvalidationBus(hub), cache.InMemoryInvalidationBus(hub)
+    cache.catalog_cache.clear()
+
+async def test_invalidation_reaches_the_other_worker(workers):
+    publisher, other = workers
+    cache.catalog_cache.set(("product", 101), "cached")
+
+    await publisher.publish("product", 101, datetime.utcnow())
+
+    assert cache.catalog_cache.get(("product", 101)) is None
+    assert (publisher.published, other.received) == (1, 1)
+
+async def test_invalidation_older_than_one_applied_is_skipped(workers):
+    publisher, other = workers
+    newer = datetime.utcnow()
+    await publisher.publish("product", 102, newer)
+    cache.catalog_cache.set(("product", 102), "filled after the newer write", version=newer)
+
+    # A message delayed past the newer one must not drop what was filled since
+    await publisher.publish("product", 102, newer - timedelta(seconds=1))
+
+    assert cache.catalog_cache.get(("product", 102)) == "filled after the newer write"
+    assert other.received == 2
+
+async def test_worker_ignores_the_echo_of_its_own_message(workers):
+    publisher, other = workers
+    other.hub.remove(other)
+    cache.catalog_cache.set(("product", 103), "cached")
+
+    await publisher.publish("product", 103, datetime.utcnow())
+
+    # The hub delivers back to the publisher, which already applied its own write
+    assert publisher.received == 0
+    assert cache.catalog_cache.get(("product", 103)) == "cached"
@@ -0,0 +1,37 @@
+"""
+Import-time guards for the app: modules only a few code paths need stay out of
+`import backend.main`, and the whole import stays inside a time budget.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from backend import profile_imports
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous enough for a cold CI runner; the app imports in about 1.5 s locally
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 3000))
+
+LAZY_MODULES = ["httpx", "smtplib", "alembic", "email.mime.text"]
+
+@pytest.fixture(autouse=True)
+def importable(monkeypatch):
+    # The imports run in a fresh interpreter, which does not see conftest's sys.path
+    monkeypatch.setenv("PYTHONPATH", ROOT)
+
+def test_lazy_modules_are_not_imported():
+    code = (
+        "import sys, backend.main\n"
+        f"print(','.join(name for name in {LAZY_MODULES!r} if name in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+def test_import_time_budget():
+    rows = profile_imports.profile("backend.main")
+    total_ms = next(cumulative for name, _, cumulative in rows if name == "backend.main") / 1000
+    assert total_ms < IMPORT_BUDGET_MS, f"import backend.main took {total_ms:.0f} ms"
@@ -0,0 +1,361 @@
+from datetime import datetime, timedelta
+import httpx
+import pytest
+from sqlalchemy import event, select, update
+from backend import models, schemas
+from backend.database import engine as app_engine
+from backend.services import checkout as checkout_service
+from backend.services import mpesa, outbox, payments, reconciliation
+from fake_daraja import FakeDaraja
+
+pytestmark = pytest.mark.anyio
+
+CHECKOUT = schemas.CheckoutCreate(payment_method="mpesa", address="1 Test Lane", phone_number="254700000000")
+
+@pytest.fixture
+async def daraja():
+    fake = FakeDaraja()
+    mpesa.token_cache.invalidate()
+    mpesa._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app), base_url=mpesa.MPESA_BASE_URL)
+    yield fake
+    await mpesa.close_client()
+    mpesa.token_cache.invalidate()
+
+@pytest.fixture
+def place_order(db):
+    """Check out a fresh user's cart of one product and return the order id."""
+    count = 0
+
+    async def place(stock: int = 10, quantity: int = 2):
+        nonlocal count
+        count += 1
+        category = models.Category(name=f"Category {count}")
+        product = models.Product(name=f"Product {count}", description="", price=100.0, stock=stock, category=category)
+        user = models.User(username=f"buyer{count}", hashed_password="x", role=models.UserRole.user, is_active=True)
+        cart = models.Cart(user=user, products=[], items=[models.CartItem(product=product, quantity=quantity)])
+        db.add(cart)
+        await db.commit()
+        response = await checkout_service.checkout_cart(db, user.id, CHECKOUT)
+        return response["order_id"]
+    return place
+
+def dispatcher(session_factory, **options):
+    return outbox.StkPushDispatcher(
+        session_factory=session_factory, **{"max_attempts": 2, "push_deadline": 1.0, **options}
+    )
+
+def poller(session_factory):
+    return reconciliation.StkStatusPoller(session_factory=session_factory, rate_per_second=1000, query_deadline=1.0)
+
+async def order_state(db, order_id: int):
+    """(intent, payment, order status, product stock) as stored now."""
+    db.expire_all()
+    intent = (await db.execute(select(models.PaymentIntent).where(models.PaymentIntent.order_id == order_id))).scalar_one()
+    payment = await db.get(models.Payment, intent.payment_id)
+    order = await db.get(models.Order, order_id)
+    stock = (await db.execute(
+        select(models.Product.stock).join(models.OrderItem).where(models.OrderItem.order_id == order_id)
+    )).scalar_one()
+    return intent, payment, order.status, stock
+
+async def make_due(db, order_id: int) -> None:
+    await db.execute(
+        update(models.PaymentIntent)
+        .where(models.PaymentIntent.order_id == order_id)
+        .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+    )
+    await db.commit()
+
+async def backdate_payments(db, seconds: float) -> None:
+    await db.execute(update(models.Payment).values(created_at=datetime.utcnow() - timedelta(seconds=seconds)))
+    await db.commit()
+
+async def test_dispatcher_records_the_checkout_request_id(db, session_factory, place_order, daraja):
+    order_id = await place_order(stock=10, quantity=2)
+    worker = dispatcher(session_factory)
+
+    assert await worker.dispatch_once() == 1
+
+    intent, payment, status, stock = await order_state(db, order_id)
+    assert intent.status == models.PaymentIntentStatus.dispatched
+    assert intent.checkout_request_id == payment.transaction_id == "ws_CO_1"
+    checkout = await db.get(models.Checkout, payment.checkout_id)
+    assert checkout.mpesa_transaction_id == "ws_CO_1"
+    assert (status, stock) == (models.OrderStatus.pending, 8)
+    assert daraja.pushes[0]["AccountReference"] == f"Order_{order_id}"
+    assert daraja.pushes[0]["Amount"] == 200
+    assert worker.stats() == {"dispatched": 1, "retried": 0, "failed": 0, "lost": 0}
+
+async def test_dispatcher_gives_up_and_cancels_the_order(db, session_factory, place_order, daraja):
+    order_id = await place_order(stock=10, quantity=2)
+    daraja.failing_pushes = 2
+    worker = dispatcher(session_factory)
+
+    await worker.dispatch_once()
+    intent, payment, status, _ = await order_state(db, order_id)
+    assert intent.status == models.PaymentIntentStatus.pending
+    assert intent.next_attempt_at > datetime.utcnow()
+    assert intent.last_error == "Failed to initiate M-Pesa STK Push"
+    assert payment.status == models.PaymentStatus.pending
+
+    # Not due yet, so nothing is claimed until the backoff has passed
+    assert await worker.dispatch_once() == 0
+    await make_due(db, order_id)
+    await worker.dispatch_once()
+
+    intent, payment, status, stock = await order_state(db, order_id)
+    assert intent.status == models.PaymentIntentStatus.failed
+    assert payment.status == models.PaymentStatus.failed
+    assert (status, stock) == (models.OrderStatus.cancelled, 10)
+    assert worker.stats() == {"dispatched": 0, "retried": 1, "failed": 1, "lost": 0}
+
+async def test_dispatcher_counts_a_push_past_its_deadline_as_failed(db, session_factory, place_order, daraja):
+    order_id = await place_order()
+    daraja.push_delay = 0.5
+    worker = dispatcher(session_factory, push_deadline=0.1)
+
+    await worker.dispatch_once()
+
+    intent, payment, _, _ = await order_state(db, order_id)
+    assert intent.status == models.PaymentIntentStatus.pending
+    assert intent.last_error == "TimeoutError"
+    assert payment.transaction_id is None
+    assert worker.retried == 1
+
+async def test_dispatcher_drops_outcomes_after_losing_its_lease(db, session_factory, place_order, daraja):
+    order_id = await place_order()
+    stalled = dispatcher(session_factory)
+    [intent] = await stalled._claim()
+    outcome = await stalled._push(intent)
+
+    # The lease runs out before the stalled worker records; another worker claims and pushes again
+    await make_due(db, order_id)
+    successor = dispatcher(session_factory)
+    assert await successor.dispatch_once() == 1
+    await stalled._record([(intent, outcome)])
+
+    stored, payment, _, _ = await order_state(db, order_id)
+    assert stored.attempts == 2
+    assert stored.checkout_request_id == payment.transaction_id == "ws_CO_2"
+    assert stalled.stats()["lost"] == 1
+    assert successor.stats()["dispatched"] == 1
+
+async def test_poller_settles_answered_payments(db, session_factory, place_order, daraja):
+    paid = await place_order(stock=10, quantity=2)
+    cancelled = await place_order(stock=10, quantity=3)
+    await dispatcher(session_factory).dispatch_once()
+    daraja.complete("ws_CO_1", 0)
+    daraja.complete("ws_CO_2", 1032)
+    worker = poller(session_factory)
+
+    # Payments younger than the stale threshold are left to their callbacks
+    assert await worker.run_once() == 0
+    await backdate_payments(db, reconciliation.STK_POLL_STALE_AFTER_SECONDS + 10)
+    assert await worker.run_once() == 2
+
+    _, payment, status, stock = await order_state(db, paid)
+    assert payment.status == models.PaymentStatus.completed
+    assert (status, stock) == (models.OrderStatus.processing, 8)
+    _, payment, status, stock = await order_state(db, cancelled)
+    assert payment.status == models.PaymentStatus.failed
+    assert (status, stock) == (models.OrderStatus.cancelled, 10)
+    assert worker.stats() == {"queried": 2, "settled": 2, "errors": 0, "gave_up": 0, "overdue_errors": 0}
+    checkpoint = await db.get(models.WorkerCheckpoint, worker.name)
+    assert checkpoint.leased_until is None
+    assert checkpoint.position == payment.id
+
+async def test_poller_gives_up_on_unanswered_payments_after_the_deadline(db, session_factory, place_order, daraja):
+    order_id = await place_order(stock=10, quantity=2)
+    await dispatcher(session_factory).dispatch_once()
+    await backdate_payments(db, reconciliation.STK_POLL_STALE_AFTER_SECONDS + 10)
+    worker = poller(session_factory)
+
+    assert await worker.run_once() == 1
+    _, payment, status, _ = await order_state(db, order_id)
+    assert payment.status == models.PaymentStatus.pending
+
+    await backdate_payments(db, reconciliation.STK_POLL_GIVE_UP_AFTER_SECONDS + 10)
+    # The first cycle hits the end of the table and rewinds the checkpoint
+    assert await worker.run_once() == 0
+    assert await worker.run_once() == 1
+
+    _, payment, status, stock = await order_state(db, order_id)
+    assert payment.status == models.PaymentStatus.failed
+    assert (status, stock) == (models.OrderStatus.cancelled, 10)
+    assert daraja.queries == ["ws_CO_1", "ws_CO_1"]
+    assert worker.gave_up == 1
+
+async def test_poller_gives_up_on_requests_daraja_does_not_know_after_the_deadline(db, session_factory, place_order, daraja):
+    order_id = await place_order(stock=10, quantity=2)
+    await dispatcher(session_factory).dispatch_once()
+    daraja.results.clear()
+    await backdate_payments(db, reconciliation.STK_POLL_STALE_AFTER_SECONDS + 10)
+    worker = poller(session_factory)
+
+    # Not known yet, but not overdue either
+    assert await worker.run_once() == 1
+    _, payment, _, _ = await order_state(db, order_id)
+    assert payment.status == models.PaymentStatus.pending
+
+    await backdate_payments(db, reconciliation.STK_POLL_GIVE_UP_AFTER_SECONDS + 10)
+    assert await worker.run_once() == 0
+    assert await worker.run_once() == 1
+
+    _, payment, status, stock = await order_state(db, order_id)
+    assert payment.status == models.PaymentStatus.failed
+    assert (status, stock) == (models.OrderStatus.cancelled, 10)
+    assert worker.stats()["errors"] == 0
+
+async def test_poller_query_errors_leave_payments_pending(db, session_factory, place_order, daraja):
+    order_id = await place_order()
+    await dispatcher(session_factory).dispatch_once()
+    await backdate_payments(db, reconciliation.STK_POLL_STALE_AFTER_SECONDS + 10)
+    daraja.failing_queries = 1
+    worker = poller(session_factory)
+
+    assert await worker.run_once() == 1
+
+    _, payment, _, _ = await order_state(db, order_id)
+    assert payment.status == models.PaymentStatus.pending
+    assert worker.stats() == {"queried": 1, "settled": 0, "errors": 1, "gave_up": 0, "overdue_errors": 0}
+
+async def test_poller_never_gives_up_on_a_failed_query(db, session_factory, place_order, daraja):
+    order_id = await place_order(stock=10, quantity=2)
+    await dispatcher(session_factory).dispatch_once()
+    # The customer paid, but the callback was lost and Daraja is down when the poller asks
+    daraja.complete("ws_CO_1", 0)
+    daraja.failing_queries = 1
+    await backdate_payments(db, reconciliation.STK_POLL_GIVE_UP_AFTER_SECONDS + 10)
+    worker = poller(session_factory)
+
+    assert await worker.run_once() == 1
+
+    _, payment, status, stock = await order_state(db, order_id)
+    assert payment.status == models.PaymentStatus.pending
+    assert (status, stock) == (models.OrderStatus.pending, 8)
+    assert worker.stats() == {"queried": 1, "settled": 0, "errors": 1, "gave_up": 0, "overdue_errors": 1}
+
+    # The next pass gets an answer and settles it as paid
+    assert await worker.run_once() == 0
+    assert await worker.run_once() == 1
+    _, payment, status, _ = await order_state(db, order_id)
+    assert (payment.status, status) == (models.PaymentStatus.completed, models.OrderStatus.processing)
+
+async def test_poller_lease_is_exclusive_and_fenced(db, session_factory):
+    holder, rival = poller(session_factory), poller(session_factory)
+    position, lease_until = await holder._lease()
+    assert position == 0
+
+    # While the lease is held nobody else polls
+    assert await rival.run_once() == 0
+    assert await rival._lease() is None
+
+    # Once it runs out a rival takes over, and the old holder can no longer move the checkpoint
+    await db.execute(
+        update(models.WorkerCheckpoint)
+        .where(models.WorkerCheckpoint.name == holder.name)
+        .values(leased_until=datetime.utcnow() - timedelta(seconds=1))
+    )
+    await db.commit()
+    _, rival_lease = await rival._lease()
+    await holder._release(99, lease_until)
+
+    db.expire_all()
+    checkpoint = await db.get(models.WorkerCheckpoint, holder.name)
+    assert (checkpoint.position, checkpoint.leased_until) == (0, rival_lease)
+
+def stk_callback(checkout_request_id: str, result_code: int = 0, amount: float = 200) -> dict:
+    callback = {
+        "MerchantRequestID": "merchant-1",
+        "CheckoutRequestID": checkout_request_id,
+        "ResultCode": result_code,
+        "ResultDesc": "The service request is processed successfully.",
+    }
+    if result_code == 0:
+        callback["CallbackMetadata"] = {"Item": [{"Name": "Amount", "Value": amount}, {"Name": "MpesaReceiptNumber", "Value": "RCPT1"}]}
+    return {"Body": {"stkCallback": callback}}
+
+def test_parse_stk_callback():
+    paid = payments.parse_stk_callback(stk_callback("ws_CO_1", 0, 200), order_id=7)
+    assert (paid.transaction_id, paid.succeeded, paid.order_id, paid.amount) == ("ws_CO_1", True, 7, 200.0)
+
+    cancelled = payments.parse_stk_callback(stk_callback("ws_CO_2", 1032))
+    assert (cancelled.succeeded, cancelled.amount) == (False, None)
+
+    assert payments.parse_stk_callback({}) is None
+    assert payments.parse_stk_callback({"Body": {"stkCallback": {"CheckoutRequestID": "ws_CO_1", "ResultCode": "x"}}}) is None
+
+def test_callbacks_are_rejected_without_a_secret(monkeypatch):
+    monkeypatch.setattr(mpesa, "MPESA_CALLBACK_SECRET", "")
+
+    with pytest.raises(RuntimeError):
+        mpesa.callback_token(1)
+    # Not even the token an empty key would produce is accepted
+    assert not mpesa.valid_callback_token(1, "08b8da96798f79d662008386886decc80f352c96b3847cf217f868f60321577d")
+
+@pytest.fixture
+async def callbacks(engine, session_factory, monkeypatch):
+    """Post callbacks through the app to a processor settling into the test database."""
+    from backend.main import app
+    processor = payments.CallbackProcessor(session_factory=session_factory)
+    monkeypatch.setattr(payments, "callback_processor", processor)
+    # Statements that changed rows; guarded updates that match nothing are fine
+    writes = []
+
+    def log(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith("SELECT") and cursor.rowcount != 0:
+            writes.append(statement)
+
+    async def post(order_id: int, token: str, payload: dict) -> int:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post(f"/mpesa/callback/{order_id}/{token}", json=payload)
+        # Settle whatever the route queued, as the background worker would
+        batch = []
+        while not processor.queue.empty():
+            batch.append(processor.queue.get_nowait())
+        if batch:
+            await processor.apply(batch)
+        return response.status_code
+
+    post.processor = processor
+    post.writes = writes
+    event.listen(engine.sync_engine, "after_cursor_execute", log)
+    yield post
+    event.remove(engine.sync_engine, "after_cursor_execute", log)
+    await app_engine.dispose()
+
+async def test_callback_with_a_forged_token_is_refused(db, session_factory, place_order, daraja, callbacks):
+    order_id = await place_order(stock=10, quantity=2)
+    await dispatcher(session_factory).dispatch_once()
+    callbacks.writes.clear()
+
+    assert await callbacks(order_id, "0" * 64, stk_callback("ws_CO_1")) == 403
+    # A genuine token for another order does not carry over either
+    assert await callbacks(order_id, mpesa.callback_token(order_id + 1), stk_callback("ws_CO_1")) == 403
+
+    assert callbacks.writes == []
+    assert callbacks.processor.stats()["received"] == 0
+    _, payment, status, stock = await order_state(db, order_id)
+    assert (payment.status, status, stock) == (models.PaymentStatus.pending, models.OrderStatus.pending, 8)
+
+async def test_replayed_callback_writes_nothing(db, session_factory, place_order, daraja, callbacks):
+    order_id = await place_order(stock=10, quantity=2)
+    await dispatcher(session_factory).dispatch_once()
+    token = mpesa.callback_token(order_id)
+
+    assert await callbacks(order_id, token, stk_callback("ws_CO_1")) == 200
+    _, payment, status, _ = await order_state(db, order_id)
+    assert (payment.status, status) == (models.PaymentStatus.completed, models.OrderStatus.processing)
+    assert callbacks.writes
+    callbacks.writes.clear()
+
+    # The processor remembers what it settled and drops the duplicate before the database
+    assert await callbacks(order_id, token, stk_callback("ws_CO_1")) == 200
+    assert callbacks.processor.stats()["duplicates"] == 1
+    # After a restart it has forgotten, so the replay reaches settlement and finds nothing pending
+    callbacks.processor._settled.clear()
+    assert await callbacks(order_id, token, stk_callback("ws_CO_1", 1032)) == 200
+
+    assert callbacks.writes == []
+    _, payment, status, stock = await order_state(db, order_id)
+    assert (payment.status, status, stock) == (models.PaymentStatus.completed, models.OrderStatus.processing, 8)
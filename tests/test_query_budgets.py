@@ -0,0 +1,113 @@
+"""
+Statement and row budgets per endpoint. Each request runs against seeded data
+with a SQL event listener counting what reaches PostgreSQL; a change that adds
+a lazy load or an N+1 loop shows up here as a budget failure.
+"""
+import httpx
+import pytest
+from sqlalchemy import event
+from backend import cache, models, utils
+from backend.database import engine as app_engine, read_engine
+
+pytestmark = pytest.mark.anyio
+
+class QueryLog:
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        self.rows += max(cursor.rowcount, 0)
+
+@pytest.fixture
+async def seeded(db):
+    category = models.Category(name="Tea")
+    products = [models.Product(name=f"Tea {i}", description="", price=10.0 + i, stock=10, category=category) for i in range(30)]
+    customer = models.User(username="customer", hashed_password="x", role=models.UserRole.user)
+    admin = models.User(username="admin", hashed_password="x", role=models.UserRole.admin)
+    db.add_all([category, *products, customer, admin])
+    await db.flush()
+    # A long-time customer: the profile views must not load any of this
+    for _ in range(20):
+        db.add(models.Order(
+            user_id=customer.id,
+            total=30.0,
+            status=models.OrderStatus.delivered,
+            items=[models.OrderItem(product_id=product.id, quantity=1, price=10.0) for product in products[:3]],
+        ))
+    db.add(models.Cart(user_id=customer.id, items=[models.CartItem(product_id=p.id, quantity=1) for p in products[:10]]))
+    await db.commit()
+    return {
+        "customer": customer,
+        "admin": admin,
+        "customer_token": utils.create_access_token(utils.access_token_claims(customer)),
+        "admin_token": utils.create_access_token(utils.access_token_claims(admin)),
+        "product_id": products[0].id,
+    }
+
+@pytest.fixture
+async def client(engine):
+    from backend.main import app
+    cache.catalog_cache.clear()
+    utils.revocations.mark_stale()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    # The app's pools belong to this test's event loop
+    await app_engine.dispose()
+    await read_engine.dispose()
+
+async def measure(client, path: str, token: str) -> QueryLog:
+    headers = {"Authorization": f"Bearer {token}"}
+    # The first request loads the revocation list; budgets cover the steady state
+    (await client.get(path, headers=headers)).raise_for_status()
+    log = QueryLog()
+    # Count the replica too when the tests run with one
+    engines = {app_engine.sync_engine, read_engine.sync_engine}
+    for target in engines:
+        event.listen(target, "after_cursor_execute", log)
+    try:
+        response = await client.get(path, headers=headers)
+    finally:
+        for target in engines:
+            event.remove(target, "after_cursor_execute", log)
+    response.raise_for_status()
+    return log
+
+# path, token, max statements, max rows. Keyset pages fetch one row past the limit.
+BUDGETS = [
+    ("/user/profile", "customer_token", 1, 1),
+    # The user and their 20 order headers, without the order items
+    ("/admin/users/{customer_id}", "admin_token", 2, 21),
+    ("/admin/users?limit=50", "admin_token", 1, 2),
+    ("/user/cart", "customer_token", 1, 10),
+    # 20 orders with their 60 items and 3 distinct products, loaded by selectin queries
+    ("/user/orders", "customer_token", 4, 83),
+    ("/admin/orders?limit=10", "admin_token", 1, 11),
+    ("/shop/products?limit=20", "customer_token", 1, 21),
+    # Served from the catalog cache the first request filled
+    ("/shop/products/{product_id}", "customer_token", 0, 0),
+    ("/shop/categories", "customer_token", 0, 0),
+]
+
+@pytest.mark.parametrize("path, token, max_statements, max_rows", BUDGETS)
+async def test_endpoint_query_budget(client, seeded, path, token, max_statements, max_rows):
+    path = path.format(customer_id=seeded["customer"].id, product_id=seeded["product_id"])
+
+    log = await measure(client, path, seeded[token])
+
+    assert log.statements <= max_statements, f"{path} sent {log.statements} statements, budget {max_statements}"
+    assert log.rows <= max_rows, f"{path} fetched {log.rows} rows, budget {max_rows}"
+
+async def test_admin_user_detail_lists_orders_without_their_items(client, seeded):
+    customer = seeded["customer"]
+    path = f"/admin/users/{customer.id}"
+
+    log = await measure(client, path, seeded["admin_token"])
+    detail = (await client.get(path, headers={"Authorization": f"Bearer {seeded['admin_token']}"})).json()
+
+    assert (log.statements, log.rows) == (2, 21)
+    assert detail["username"] == "customer"
+    assert len(detail["orders"]) == 20
+    assert {order["user_id"] for order in detail["orders"]} == {customer.id}
+    assert "items" not in detail["orders"][0]
@@ -0,0 +1,134 @@
+"""
+Read routing. The replica tests run when TEST_DATABASE_READ_URL points at a
+read-only role on the test database (see conftest), so any write sent to the
+replica fails there instead of passing unnoticed.
+"""
+import asyncio
+import httpx
+import pytest
+from sqlalchemy import event, insert, text
+from sqlalchemy.exc import DBAPIError
+from starlette.requests import Request
+from backend import cache, crud, models, replica, utils
+from backend.database import ReadSessionLocal, engine as app_engine, read_engine
+from conftest import TEST_DATABASE_READ_URL
+
+pytestmark = pytest.mark.anyio
+
+needs_replica = pytest.mark.skipif(not TEST_DATABASE_READ_URL, reason="TEST_DATABASE_READ_URL is not set")
+
+def request_as(user_id=None) -> Request:
+    headers = []
+    if user_id is not None:
+        token = utils.create_access_token({"sub": f"user{user_id}", "role": "user", "uid": user_id, "ver": 0})
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+async def routed_bind(route: str, request: Request):
+    sessions = replica.read_db(route)(request)
+    db = await sessions.__anext__()
+    await sessions.aclose()
+    return db.bind
+
+@pytest.fixture(autouse=True)
+def forget_writers():
+    yield
+    replica._recent_writers.clear()
+
+async def test_every_read_uses_the_primary_without_a_replica(monkeypatch):
+    monkeypatch.setattr(replica, "read_engine", app_engine)
+
+    assert not replica.replica_enabled()
+    assert await routed_bind("catalog", request_as()) is app_engine
+
+@needs_replica
+async def test_listed_routes_read_from_the_replica(engine):
+    sessions = replica.read_db("catalog")(request_as(1))
+    db = await sessions.__anext__()
+    try:
+        assert db.bind is read_engine
+        assert (await db.execute(text("SELECT current_user"))).scalar() == read_engine.url.username
+    finally:
+        await sessions.aclose()
+        await read_engine.dispose()
+
+    assert await routed_bind("checkout", request_as(1)) is app_engine
+
+@needs_replica
+async def test_recent_writers_stay_on_the_primary_until_the_window_ends(monkeypatch):
+    monkeypatch.setattr(replica, "DB_READ_YOUR_WRITES_SECONDS", 0.2)
+
+    await replica.mark_recent_write(7)
+
+    assert await routed_bind("catalog", request_as(7)) is app_engine
+    assert await routed_bind("catalog", request_as(8)) is read_engine
+    assert await routed_bind("catalog", request_as()) is read_engine
+    await asyncio.sleep(0.25)
+    assert await routed_bind("catalog", request_as(7)) is read_engine
+
+@needs_replica
+async def test_writes_never_reach_the_replica(db):
+    category = models.Category(name="Tea")
+    product = models.Product(name="Tea", description="", price=10.0, stock=10, category=category)
+    user = models.User(username="customer", hashed_password="x", role=models.UserRole.user, is_active=True)
+    db.add_all([product, user])
+    await db.commit()
+    headers = {"Authorization": f"Bearer {utils.create_access_token(utils.access_token_claims(user))}"}
+    replica_statements = []
+
+    def log(conn, cursor, statement, parameters, context, executemany):
+        replica_statements.append(statement)
+
+    from backend.main import app
+    cache.catalog_cache.clear()
+    utils.revocations.mark_stale()
+    event.listen(read_engine.sync_engine, "before_cursor_execute", log)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            (await client.get("/shop/products", headers=headers)).raise_for_status()
+            assert replica_statements, "catalog reads should use the replica"
+
+            (await client.post("/user/cart", json={"product_id": product.id, "quantity": 2}, headers=headers)).raise_for_status()
+            # The writer's own reads are pinned to the primary right after the write
+            before = len(replica_statements)
+            (await client.get("/shop/products", headers=headers)).raise_for_status()
+            assert len(replica_statements) == before
+            (await client.get("/shop/products")).raise_for_status()
+            assert len(replica_statements) > before
+    finally:
+        event.remove(read_engine.sync_engine, "before_cursor_execute", log)
+        await app_engine.dispose()
+
+    assert all(statement.lstrip().upper().startswith("SELECT") for statement in replica_statements)
+    # The replica role cannot write, so a misrouted write would also fail loudly
+    try:
+        async with ReadSessionLocal() as replica_db:
+            with pytest.raises(DBAPIError):
+                await replica_db.execute(insert(models.Category).values(name="Coffee"))
+    finally:
+        await read_engine.dispose()
+
+@needs_replica
+async def test_cached_catalog_entries_are_filled_from_the_primary(db):
+    category = models.Category(name="Tea")
+    product = models.Product(name="Tea", description="", price=10.0, stock=10, category=category)
+    db.add(product)
+    await db.commit()
+    cache.catalog_cache.clear()
+    replica_statements = []
+
+    def log(conn, cursor, statement, parameters, context, executemany):
+        replica_statements.append(statement)
+
+    event.listen(read_engine.sync_engine, "before_cursor_execute", log)
+    try:
+        # A lagging replica must not be what the whole TTL gets served from
+        async with ReadSessionLocal() as replica_db:
+            assert (await crud.get_cached_product(replica_db, product.id)).stock == 10
+            assert [summary.id for summary in await crud.get_cached_categories(replica_db)] == [category.id]
+    finally:
+        event.remove(read_engine.sync_engine, "before_cursor_execute", log)
+        await app_engine.dispose()
+        await read_engine.dispose()
+
+    assert replica_statements == []
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete
+from backend import crud, models, utils
+
+pytestmark = pytest.mark.anyio
+
+async def add_user(db, username: str, **values) -> models.User:
+    user = models.User(username=username, hashed_password="x", **values)
+    db.add(user)
+    await db.commit()
+    return user
+
+async def test_only_revocations_within_the_token_lifetime_are_loaded(db):
+    long_ago = datetime.utcnow() - utils.ACCESS_TOKEN_MAX_LIFETIME - timedelta(hours=1)
+    old = await add_user(db, "old", token_version=2, updated_at=long_ago)
+    recent = await add_user(db, "recent", token_version=2)
+    revocations = utils.RevocationList()
+
+    await revocations.ensure_fresh(db)
+
+    assert not revocations.is_revoked(old.id, 0)
+    assert revocations.is_revoked(recent.id, 1)
+    assert not revocations.is_revoked(recent.id, 2)
+    assert revocations.stats()["entries"] == 1
+
+async def test_deleted_users_are_tombstoned(db):
+    kept = await add_user(db, "kept")
+    deleted = await add_user(db, "deleted")
+    revocations = utils.RevocationList()
+    await revocations.ensure_fresh(db)
+    assert not revocations.is_revoked(deleted.id, 0)
+
+    await db.execute(delete(models.User).where(models.User.id == deleted.id))
+    await db.commit()
+    revocations.mark_stale(deleted.id)
+    revocations.mark_stale(kept.id)
+    await revocations.ensure_fresh(db)
+
+    assert revocations.is_revoked(deleted.id, 0)
+    assert not revocations.is_revoked(kept.id, 0)
+    assert revocations.stats()["tombstones"] == 1
+
+async def test_deletes_missed_by_the_bus_are_caught_on_the_next_reload(db, monkeypatch):
+    user = await add_user(db, "customer", is_active=True)
+    token = utils.create_access_token(utils.access_token_claims(user))
+    revocations = utils.RevocationList()
+    monkeypatch.setattr(utils, "revocations", revocations)
+    assert (await utils.get_current_user(db, token)).id == user.id
+
+    async def detached(*args, **kwargs):
+        pass
+
+    # The bus is detached: this worker never hears about the delete
+    monkeypatch.setattr(crud.cache, "invalidate", detached)
+    assert await crud.delete_user(db, user.id)
+    assert revocations._pending == set()
+    # The periodic reload comes round
+    revocations._loaded_at -= revocations.refresh_seconds
+
+    with pytest.raises(HTTPException) as rejected:
+        await utils.get_current_user(db, token)
+    assert rejected.value.status_code == 401
+    assert revocations.stats()["tombstones"] == 1
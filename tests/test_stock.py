@@ -0,0 +1,70 @@
+import asyncio
+import random
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, text
+from backend import crud, models, schemas
+
+pytestmark = pytest.mark.anyio
+
+def line(product_id: int, quantity: int = 1) -> schemas.OrderItemBase:
+    return schemas.OrderItemBase(product_id=product_id, quantity=quantity, price=100.0)
+
+async def reserve(session_factory, items, index_plan: bool = False) -> bool:
+    async with session_factory() as db:
+        if index_plan:
+            # What the planner picks on a real catalog: walk the order lines and look each
+            # product up by id, locking rows in line order rather than table order
+            for setting in ("enable_seqscan", "enable_hashjoin", "enable_mergejoin"):
+                await db.execute(text(f"SET LOCAL {setting} = off"))
+        try:
+            await crud.reserve_stock(db, items)
+        except HTTPException:
+            return False
+        await db.commit()
+        return True
+
+async def stock_and_units(db, product_ids):
+    db.expire_all()
+    result = await db.execute(
+        select(models.Product.id, models.Product.stock, models.Product.units_sold)
+        .where(models.Product.id.in_(product_ids))
+        .order_by(models.Product.id)
+    )
+    return [(row.stock, row.units_sold) for row in result.all()]
+
+async def test_concurrent_checkouts_cannot_oversell(db, session_factory, make_products):
+    [product_id] = await make_products(5)
+
+    outcomes = await asyncio.gather(*(reserve(session_factory, [line(product_id)]) for _ in range(20)))
+
+    assert outcomes.count(True) == 5
+    assert await stock_and_units(db, [product_id]) == [(0, 5)]
+
+async def test_insufficient_stock_lists_every_unfulfilled_line(db, make_products):
+    first, second = await make_products(1, 3)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await crud.reserve_stock(db, [line(first, 2), line(second, 1), line(first + second + 100)])
+
+    assert exc_info.value.status_code == 400
+    items = {item["product_id"]: item for item in exc_info.value.detail["items"]}
+    assert items[first]["available"] == 1
+    assert items[first + second + 100]["reason"] == "not_found"
+    assert second not in items
+    assert await stock_and_units(db, [first, second]) == [(1, 0), (3, 0)]
+
+async def test_opposite_line_orders_do_not_deadlock(db, session_factory, make_products):
+    product_ids = await make_products(*([100] * 4))
+    rng = random.Random(6)
+
+    async def shuffled_checkout():
+        lines = [line(product_id) for product_id in product_ids]
+        rng.shuffle(lines)
+        return await reserve(session_factory, lines, index_plan=True)
+
+    # A deadlock surfaces as asyncpg's DeadlockDetectedError, failing the gather
+    outcomes = await asyncio.gather(*(shuffled_checkout() for _ in range(60)))
+
+    assert outcomes.count(True) == 60
+    assert await stock_and_units(db, product_ids) == [(40, 60)] * 4